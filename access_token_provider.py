@@ -0,0 +1,100 @@
+"""Cached Web PubSub client access URLs with proactive refresh"""
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+    from azure.messaging.webpubsubservice import WebPubSubServiceClient
+
+LOG = logging.getLogger(__name__)
+
+
+class ClientAccessTokenProvider:
+    """Caches the client access URL until shortly before its token expires.
+
+    ``get_client_access_token`` signs the token synchronously, so it runs in a
+    worker thread rather than on the event loop. A background task refreshes
+    the URL ``refresh_margin`` seconds before expiry, so reconnects normally
+    find a valid URL in the cache. Concurrent callers share a single refresh.
+
+    The service client comes from ``service_factory``, called in that worker
+    thread the first time a token is needed, so neither importing the Azure
+    SDK nor a missing connection string holds up startup.
+
+    With a ``user_id`` the token signs the connection in as that Web PubSub
+    user, so the backend can send a reply to this connection alone.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable[[], "WebPubSubServiceClient"],
+        minutes_to_expire: int = 60,
+        refresh_margin: float = 300,
+        override_url: Optional[str] = None,
+        user_id: Optional[str] = None
+    ):
+        self.service_factory = service_factory
+        self.user_id = user_id
+        self.service: Optional["WebPubSubServiceClient"] = None
+        self.minutes_to_expire = minutes_to_expire
+        self.refresh_margin = min(refresh_margin, minutes_to_expire * 60 / 2)
+        self.override_url = override_url
+        self._url: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _is_fresh(self) -> bool:
+        return self._url is not None and time.monotonic() < self._expires_at - self.refresh_margin
+
+    async def get_url(self) -> str:
+        """Return a client access URL that is valid for at least ``refresh_margin`` seconds"""
+        if self.override_url:
+            return self.override_url
+        if not self._is_fresh():
+            await self.refresh()
+        return self._url
+
+    async def refresh(self):
+        async with self._lock:
+            # Another caller may have refreshed while this one waited for the lock
+            if self._is_fresh():
+                return
+            requested_at = time.monotonic()
+            token = await asyncio.to_thread(self._client_access_token)
+            self._url = token['url']
+            self._expires_at = requested_at + self.minutes_to_expire * 60
+            LOG.info(f"Refreshed Web PubSub client access token (valid for {self.minutes_to_expire} minutes)")
+
+    def _client_access_token(self) -> dict:
+        if self.service is None:
+            self.service = self.service_factory()
+        if self.user_id:
+            return self.service.get_client_access_token(user_id=self.user_id, minutes_to_expire=self.minutes_to_expire)
+        return self.service.get_client_access_token(minutes_to_expire=self.minutes_to_expire)
+
+    def start(self):
+        """Start refreshing the URL in the background"""
+        if not self.override_url and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            delay = self._expires_at - self.refresh_margin - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except Exception as e:
+                LOG.error(f"Failed to refresh Web PubSub client access token: {str(e)}")
+                await asyncio.sleep(30)
+
+    async def close(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
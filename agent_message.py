@@ -0,0 +1,62 @@
+"""Typed envelope for messages exchanged with the AutoGen backend"""
+import logging
+from typing import List, Optional, Union
+
+from message_formatter import DEFAULT_ACTIONS
+from wire_format import JSON_BACKEND, decode_frame, dumps, loads
+
+LOG = logging.getLogger(__name__)
+
+
+class AgentMessage:
+    """A single AutoGen frame, decoded once and passed through formatting.
+
+    ``payload`` is the decoded JSON object that formatters read; the other
+    attributes are the envelope fields the bot routes and renders with.
+    """
+
+    __slots__ = (
+        "payload", "agent", "agent_type", "conversation_id", "suggested_actions",
+        "stream_id", "final", "traceparent"
+    )
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self.agent: str = payload.get("agent", "AutoGen Agent")
+        self.agent_type: str = payload.get("agent_type", "default_agent")
+        self.conversation_id: Optional[str] = payload.get("conversation_id")
+        self.suggested_actions: List[dict] = payload.get("suggested_actions", DEFAULT_ACTIONS)
+        # Streamed replies arrive as several frames sharing a stream_id; the last has final=true
+        self.stream_id: Optional[str] = payload.get("stream_id")
+        self.final: bool = bool(payload.get("final", not self.stream_id))
+        # W3C trace context echoed back by AutoGen, linking the reply to the user's turn
+        self.traceparent: Optional[str] = payload.get("traceparent")
+
+    @classmethod
+    def from_frame(cls, frame: Union[str, bytes]) -> "AgentMessage":
+        """Decode a raw WebSocket frame in any wire format; undecodable frames become plain text messages"""
+        try:
+            payload = decode_frame(frame)
+        except ValueError:  # JSON, MessagePack, CBOR and decompression errors all surface as ValueError
+            payload = None
+
+        if not isinstance(payload, dict):
+            if isinstance(frame, bytes):
+                frame = frame.decode("utf-8", errors="replace")
+            payload = {"message": frame, "agent": "AutoGen Agent"}
+        return cls(payload)
+
+    @classmethod
+    def coerce(cls, message: Union["AgentMessage", dict, str, bytes]) -> "AgentMessage":
+        """Accept an envelope, an already decoded dict or a raw frame"""
+        if isinstance(message, cls):
+            return message
+        if isinstance(message, dict):
+            return cls(message)
+        return cls.from_frame(message)
+
+    def __repr__(self) -> str:
+        return (
+            f"AgentMessage(agent={self.agent!r}, agent_type={self.agent_type!r}, "
+            f"conversation_id={self.conversation_id!r})"
+        )
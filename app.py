@@ -1,88 +1,204 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
-import sys
+import asyncio
+import importlib
+import logging
+import os
+import time
 import traceback
-import uuid
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
 from dotenv import load_dotenv
-from datetime import datetime
 from aiohttp import web
-from botbuilder.core import TurnContext
-from botbuilder.core.integration import aiohttp_error_middleware
-from botbuilder.integration.aiohttp import CloudAdapter, ConfigurationBotFrameworkAuthentication
-from botbuilder.schema import Activity, ActivityTypes
 
-from bot import MyBot
 from config import DefaultConfig
-import os
-from bot_handler import BotHandler
-from websocket_handler import WebSocketHandler
+from logging_config import configure_logging
+from metrics import metrics_handler, metrics_middleware
+from tracing import TRACER, configure_tracing
+
+if TYPE_CHECKING:
+    from runtime import BotRuntime
 
 CONFIG = DefaultConfig()
 load_dotenv()
+configure_logging(
+    CONFIG.LOG_LEVEL,
+    json_format=CONFIG.LOG_FORMAT == "json",
+    max_payload_chars=CONFIG.LOG_PAYLOAD_MAX_CHARS,
+    payload_sample_rate=CONFIG.LOG_PAYLOAD_SAMPLE_RATE,
+    queue_size=CONFIG.LOG_QUEUE_SIZE,
+)
+configure_tracing(CONFIG.TRACING_EXPORTER, CONFIG.TRACING_FILE, instance_id=CONFIG.WORKER_ID)
+
+LOG = logging.getLogger(__name__)
+
+
+@web.middleware
+async def error_middleware(request, handler):
+    """The status mapping of botbuilder's aiohttp_error_middleware, without
+    importing botbuilder.core before the server is listening"""
+    try:
+        return await handler(request)
+    except NotImplementedError:
+        raise web.HTTPNotImplemented()
+    except PermissionError:
+        raise web.HTTPUnauthorized()
+    except KeyError:
+        raise web.HTTPNotFound()
+    except web.HTTPException:
+        raise
+    except Exception:
+        traceback.print_exc()
+        raise web.HTTPInternalServerError()
+
+
+# The adapter, bot and AutoGen connections, built in the background after startup
+RUNTIME: Optional["BotRuntime"] = None
+_runtime_task: Optional[asyncio.Task] = None
+
+
+def _load_runtime() -> "BotRuntime":
+    # Runs in a worker thread: importing botbuilder and the message pipeline
+    # is most of the startup time, and the constructor needs no event loop
+    runtime_module = importlib.import_module("runtime")
+    return runtime_module.BotRuntime(CONFIG)
+
+
+async def _build_runtime(app: web.Application) -> "BotRuntime":
+    global RUNTIME
+    started = time.perf_counter()
+    try:
+        runtime = await asyncio.to_thread(_load_runtime)
+        runtime.start(app)
+    except Exception:
+        LOG.exception("Bot runtime failed to start")
+        raise
+    RUNTIME = runtime
+    LOG.info(f"Bot runtime ready to handle requests {(time.perf_counter() - started) * 1000:.0f} ms after startup")
+    return runtime
+
+
+async def get_runtime() -> "BotRuntime":
+    """The bot runtime, waiting for it if it is still being built"""
+    global _runtime_task
+    if RUNTIME is not None:
+        return RUNTIME
+    if _runtime_task is None:
+        _runtime_task = asyncio.create_task(_build_runtime(APP))
+    return await asyncio.shield(_runtime_task)
+
+
+def deferred(handler: Callable[["BotRuntime"], Callable[[web.Request], Awaitable[web.StreamResponse]]]):
+    """A route handler that waits for the runtime, then passes the request on"""
+    async def handle(req: web.Request) -> web.StreamResponse:
+        try:
+            runtime = await get_runtime()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            raise web.HTTPServiceUnavailable(text="Bot failed to start")
+        return await handler(runtime)(req)
+    return handle
+
+
+async def health(req: web.Request) -> web.Response:
+    """Liveness: the process is serving, even while the bot is still starting"""
+    if _runtime_task is not None and _runtime_task.done() and not _runtime_task.cancelled() \
+            and _runtime_task.exception() is not None:
+        return web.json_response({"status": "failed"}, status=503)
+    return web.json_response({"status": "ok" if RUNTIME is not None else "starting"})
+
+
+async def ready(req: web.Request) -> web.Response:
+    """Readiness: the bot is built and at least one AutoGen connection is up"""
+    if RUNTIME is None:
+        return web.json_response({"status": "starting"}, status=503)
+    if not RUNTIME.websocket_handler.is_ready:
+        return web.json_response({"status": "connecting"}, status=503)
+    return web.json_response({"status": "ready"})
 
-# Create adapter
-ADAPTER = CloudAdapter(ConfigurationBotFrameworkAuthentication(CONFIG))
-
-# Setup WebSocket handler
-conn_str = os.environ.get('WEBPUBSUB_CONNECTION_STRING1')
-if not conn_str:
-    raise ValueError("Missing WEBPUBSUB_CONNECTION_STRING1 environment variable")
 
-# Catch-all for errors
-async def on_error(context: TurnContext, error: Exception):
-    print(f"\n [on_turn_error] unhandled error: {error}", file=sys.stderr)
-    traceback.print_exc()
+# Setup routes and handlers
+APP = web.Application(middlewares=[metrics_middleware, error_middleware])
+APP.router.add_post("/api/messages", deferred(lambda runtime: runtime.bot_handler.messages))
+if CONFIG.BROADCAST_API_KEY:
+    APP.router.add_post("/api/broadcast", deferred(lambda runtime: runtime.broadcast_api.post_broadcast))
+    APP.router.add_get("/api/broadcast/{job_id}", deferred(lambda runtime: runtime.broadcast_api.get_broadcast))
+    APP.router.add_get("/api/broadcast-topics", deferred(lambda runtime: runtime.broadcast_api.get_topics))
+    APP.router.add_put("/api/broadcast-topics/{topic}", deferred(lambda runtime: runtime.broadcast_api.put_subscribers))
+    APP.router.add_delete("/api/broadcast-topics/{topic}",
+                          deferred(lambda runtime: runtime.broadcast_api.delete_subscribers))
+APP.router.add_get("/health", health)
+APP.router.add_get("/ready", ready)
+
+# Metrics; the runtime registers its gauges once it is built
+APP.router.add_get("/metrics", metrics_handler)
 
-    await context.send_activity("The bot encountered an error or bug.")
-    await context.send_activity(
-        "To continue to run this bot, please fix the bot source code."
-    )
+async def start_background_tasks(app):
+    global _runtime_task
+    _runtime_task = asyncio.create_task(_build_runtime(app))
+    if CONFIG.STARTUP_MODE == "eager":
+        await _runtime_task
 
-    if context.activity.channel_id == "emulator":
-        trace_activity = Activity(
-            label="TurnError",
-            name="on_turn_error Trace",
-            timestamp=datetime.utcnow(),
-            type=ActivityTypes.trace,
-            value=f"{error}",
-            value_type="https://www.botframework.com/schemas/error",
-        )
-        await context.send_activity(trace_activity)
+async def cleanup_background_tasks(app):
+    if RUNTIME is not None:
+        await RUNTIME.stop()
+    elif _runtime_task is not None:
+        _runtime_task.cancel()
+        await asyncio.gather(_runtime_task, return_exceptions=True)
+    TRACER.close()
 
-ADAPTER.on_turn_error = on_error
+APP.on_startup.append(start_background_tasks)
+APP.on_cleanup.append(cleanup_background_tasks)
 
-# Create the Bot
-BOT = MyBot()
+def run_worker(host: str, port: int):
+    """Entry point of a prefork worker process"""
+    web.run_app(APP, host=host, port=port, reuse_port=True)
 
-APP_ID = CONFIG.APP_ID if CONFIG.APP_ID else uuid.uuid4()
 
-# Setup routes and handlers
-APP = web.Application(middlewares=[aiohttp_error_middleware])
-bot_handler = BotHandler(ADAPTER, APP_ID, BOT)
-APP.router.add_post("/api/messages", bot_handler.messages)
+def run_workers(workers: int, host: str, port: int):
+    """Prefork launcher: each worker imports the app afresh, owns its own Web PubSub
+    connections and binds the same port with SO_REUSEPORT."""
+    import multiprocessing
 
-# Setup WebSocket handler and background tasks
-websocket_handler = WebSocketHandler(conn_str, 'Hub', bot_handler)
-BOT.set_ws_handler(websocket_handler)
+    from conversation_store import check_shared_store
 
-async def start_background_tasks(app):
-    app['websocket_task'] = websocket_handler.get_task(app)
+    check_shared_store(CONFIG.CONVERSATION_STORE_URL, workers)
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for worker_id in range(workers):
+        os.environ["TRAVELBOT_WORKER_ID"] = str(worker_id)
+        process = context.Process(target=run_worker, args=(host, port), name=f"worker-{worker_id}")
+        process.start()
+        processes.append(process)
+    LOG.info(f"Started {workers} workers on http://{host}:{port}")
 
-async def cleanup_background_tasks(app):
-    app['websocket_task'].cancel()
-    await websocket_handler.cleanup()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
 
-APP.on_startup.append(start_background_tasks)
-APP.on_cleanup.append(cleanup_background_tasks)
 
 if __name__ == "__main__":
-    try:
-        # For local development
-        if 'WEBSITE_HOSTNAME' not in os.environ:
-            web.run_app(APP, host="localhost", port=CONFIG.PORT)
-        # For Azure App Service
-        else:
-            web.run_app(APP, host="0.0.0.0", port=8000)
-    except Exception as error:
-        raise error
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Travel assistant bot")
+    parser.add_argument("--workers", type=int, default=CONFIG.WEB_WORKERS,
+                        help="number of worker processes (default: WEB_WORKERS or 1)")
+    args = parser.parse_args()
+
+    # For local development
+    if 'WEBSITE_HOSTNAME' not in os.environ:
+        host, port = "localhost", CONFIG.PORT
+    # For Azure App Service
+    else:
+        host, port = "0.0.0.0", 8000
+
+    if args.workers > 1:
+        run_workers(args.workers, host, port)
+    else:
+        web.run_app(APP, host=host, port=port)
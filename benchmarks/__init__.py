@@ -0,0 +1,11 @@
+"""Offline load tests and microbenchmarks; see the Benchmarks section of the README"""
+import json
+import os
+
+PAYLOADS_PATH = os.path.join(os.path.dirname(__file__), "payloads.json")
+
+
+def load_payloads(path: str = PAYLOADS_PATH) -> dict:
+    """Recorded AutoGen reply payloads keyed by agent_type"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
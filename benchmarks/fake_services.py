@@ -0,0 +1,149 @@
+"""Local stand-ins for Azure Web PubSub and the Bot Connector service"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+import uuid
+from typing import Callable, List, Optional
+
+import websockets
+from aiohttp import web
+
+from wire_format import CONTROL_TYPE, decode_frame, encode_payload
+
+LOG = logging.getLogger(__name__)
+
+
+class FakeWebPubSub:
+    """WebSocket server playing the AutoGen backend.
+
+    Each user message is answered after ``agent_delay`` seconds with the
+    recorded payload for the agent type named in the message text (or the
+    next agent type in rotation), echoing its ``conversation_id`` and
+    ``traceparent`` like a real AutoGen backend would. When the bot offers
+    ``wire_encoding`` and ``wire_compression`` in its handshake, replies are
+    sent in that format instead of JSON text.
+    """
+
+    def __init__(
+        self,
+        payloads: dict,
+        agent_types: List[str],
+        agent_delay: float = 0.0,
+        host: str = "127.0.0.1",
+        wire_encoding: str = "json",
+        wire_compression: str = "none"
+    ):
+        self.payloads = payloads
+        self.agent_types = agent_types
+        self.agent_delay = agent_delay
+        self.host = host
+        self.wire_encoding = wire_encoding
+        self.wire_compression = wire_compression
+        self.url: Optional[str] = None
+        self.received = 0
+        self.replied = 0
+        self.bytes_sent = 0
+        self._rotation = itertools.cycle(agent_types)
+        self._server = None
+
+    async def start(self):
+        self._server = await websockets.serve(self._handle, self.host, 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://{self.host}:{port}"
+
+    async def _handle(self, websocket):
+        replies = set()
+        # Per connection, like a real backend: JSON until the bot offers something better
+        format = {"encoding": "json", "compression": "none"}
+        try:
+            async for frame in websocket:
+                envelope = decode_frame(frame)
+                if isinstance(envelope, dict) and envelope.get("type") == CONTROL_TYPE:
+                    if self.wire_encoding in envelope.get("accept", ()):
+                        format["encoding"] = self.wire_encoding
+                    if self.wire_compression in envelope.get("compression", ()):
+                        format["compression"] = self.wire_compression
+                    await websocket.send(json.dumps({"type": CONTROL_TYPE, **format}))
+                    continue
+                self.received += 1
+                task = asyncio.create_task(self._reply(websocket, envelope, format))
+                replies.add(task)
+                task.add_done_callback(replies.discard)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _reply(self, websocket, envelope, format: dict):
+        if not isinstance(envelope, dict):
+            envelope = {"message": envelope}
+        text = envelope.get("message")
+        agent_type = text if text in self.payloads else next(self._rotation)
+
+        reply = dict(self.payloads[agent_type])
+        reply["conversation_id"] = envelope.get("conversation_id")
+        if envelope.get("traceparent"):
+            reply["traceparent"] = envelope["traceparent"]
+
+        if self.agent_delay:
+            await asyncio.sleep(self.agent_delay)
+        if format["encoding"] == "json" and format["compression"] == "none":
+            frame = json.dumps(reply)
+        else:
+            frame = encode_payload(reply, format["encoding"], format["compression"], min_compress_size=1024)
+        try:
+            await websocket.send(frame)
+            self.replied += 1
+            self.bytes_sent += len(frame)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+class FakeConnector:
+    """Bot Connector REST endpoint that accepts activities and reports them.
+
+    ``on_activity(conversation_id, activity, received_at)`` is called for
+    every activity the bot sends, including typing indicators.
+    """
+
+    def __init__(self, on_activity: Optional[Callable[[str, dict, float], None]] = None, host: str = "127.0.0.1"):
+        self.on_activity = on_activity
+        self.host = host
+        self.url: Optional[str] = None
+        self.activities = 0
+        self.updates = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v3/conversations/{conversation_id}/activities", self._post)
+        app.router.add_post("/v3/conversations/{conversation_id}/activities/{activity_id}", self._post)
+        app.router.add_put("/v3/conversations/{conversation_id}/activities/{activity_id}", self._put)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{self.host}:{port}/"
+
+    async def _post(self, request: web.Request) -> web.Response:
+        received_at = time.perf_counter()
+        activity = await request.json()
+        self.activities += 1
+        if self.on_activity:
+            self.on_activity(request.match_info["conversation_id"], activity, received_at)
+        return web.json_response({"id": uuid.uuid4().hex})
+
+    async def _put(self, request: web.Request) -> web.Response:
+        await request.read()
+        self.updates += 1
+        return web.json_response({"id": request.match_info["activity_id"]})
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
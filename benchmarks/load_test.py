@@ -0,0 +1,251 @@
+"""End-to-end load test of APP against local Web PubSub and Connector stand-ins.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --rate 20 --duration 30 --conversations 50
+
+User messages are POSTed to /api/messages at a fixed rate (open loop, so a
+slow bot builds a backlog instead of slowing the load down). The fake
+AutoGen backend answers each one with a recorded payload, and latency is
+measured from the POST until the reply card reaches the fake Connector.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict, deque
+from typing import Deque, Dict, List
+
+import aiohttp
+
+from benchmarks import load_payloads
+from benchmarks.fake_services import FakeConnector, FakeWebPubSub
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def rss_mb() -> float:
+    """Current resident set size, from /proc where available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.payloads = load_payloads()
+        self.agent_types = args.agent_types or list(self.payloads)
+        # Send times of messages still waiting for their reply, per conversation
+        self.pending: Dict[str, Deque[float]] = defaultdict(deque)
+        self.latencies: List[float] = []
+        self.request_latencies: List[float] = []
+        self.request_errors = 0
+        self.first_sent = None
+        self.last_reply = None
+        self.sent = 0
+
+    def on_activity(self, conversation_id: str, activity: dict, received_at: float):
+        if activity.get("type") != "message":
+            return
+        queue = self.pending.get(conversation_id)
+        # Coalesced replies carry one attachment per agent message
+        for _ in range(max(1, len(activity.get("attachments") or ()))):
+            if not queue:
+                break
+            self.latencies.append(received_at - queue.popleft())
+        self.last_reply = received_at
+
+    @property
+    def total(self) -> int:
+        return int(self.args.rate * self.args.duration)
+
+    def activity(self, index: int, service_url: str) -> dict:
+        conversation_id = f"bench-{index % self.args.conversations}"
+        return {
+            "type": "message",
+            "id": uuid.uuid4().hex,
+            "channelId": "benchmark",
+            "serviceUrl": service_url,
+            "from": {"id": f"user-{index % self.args.conversations}", "name": "Benchmark User"},
+            "recipient": {"id": "bot", "name": "Travel Bot"},
+            "conversation": {"id": conversation_id},
+            "text": self.agent_types[index % len(self.agent_types)],
+        }
+
+    async def post(self, session: aiohttp.ClientSession, url: str, activity: dict):
+        conversation_id = activity["conversation"]["id"]
+        started = time.perf_counter()
+        self.pending[conversation_id].append(started)
+        try:
+            async with session.post(url, json=activity) as response:
+                await response.read()
+                if response.status >= 400:
+                    self.request_errors += 1
+                    self.pending[conversation_id].remove(started)
+        except aiohttp.ClientError:
+            self.request_errors += 1
+            self.pending[conversation_id].remove(started)
+        self.request_latencies.append(time.perf_counter() - started)
+
+    async def run(self) -> dict:
+        connector = FakeConnector(self.on_activity)
+        pubsub = FakeWebPubSub(
+            self.payloads,
+            self.agent_types,
+            self.args.agent_delay,
+            wire_encoding=self.args.wire_encoding,
+            wire_compression=self.args.wire_compression
+        )
+        await connector.start()
+        await pubsub.start()
+
+        # app.py reads its configuration at import time
+        os.environ["WEBSOCKET_URL"] = pubsub.url
+        os.environ["WIRE_ENCODINGS"] = "" if self.args.wire_encoding == "json" else self.args.wire_encoding
+        os.environ["WIRE_COMPRESSIONS"] = "" if self.args.wire_compression == "none" else self.args.wire_compression
+        os.environ.setdefault(
+            "WEBPUBSUB_CONNECTION_STRING1",
+            "Endpoint=https://benchmark.webpubsub.azure.com;AccessKey=YmVuY2htYXJr;Version=1.0;"
+        )
+        import app
+        from aiohttp import web
+
+        runner = web.AppRunner(app.APP, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        messages_url = f"http://127.0.0.1:{runner.addresses[0][1]}/api/messages"
+
+        try:
+            runtime = await app.get_runtime()
+            deadline = time.monotonic() + 10
+            while not runtime.websocket_handler.is_ready:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("The bot did not connect to the fake Web PubSub server")
+                await asyncio.sleep(0.05)
+
+            rss_before = rss_mb()
+            if self.args.tracemalloc:
+                tracemalloc.start()
+
+            requests = []
+            async with aiohttp.ClientSession() as session:
+                self.first_sent = time.perf_counter()
+                for index in range(self.total):
+                    send_at = self.first_sent + index / self.args.rate
+                    delay = send_at - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    requests.append(asyncio.create_task(
+                        self.post(session, messages_url, self.activity(index, connector.url))
+                    ))
+                    self.sent += 1
+                await asyncio.gather(*requests)
+
+            expected = self.sent - self.request_errors
+            if len(self.latencies) < expected:
+                try:
+                    await asyncio.wait_for(self._wait_for_replies(expected), self.args.drain_timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            heap_peak = None
+            if self.args.tracemalloc:
+                heap_peak = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+
+            return {
+                "sent": self.sent,
+                "request_errors": self.request_errors,
+                "replies": len(self.latencies),
+                "agent_frames": pubsub.replied,
+                "agent_bytes": pubsub.bytes_sent,
+                "connector_activities": connector.activities,
+                "elapsed": (self.last_reply or time.perf_counter()) - self.first_sent,
+                "rss_before": rss_before,
+                "rss_after": rss_mb(),
+                "rss_peak": peak_rss_mb(),
+                "heap_peak": heap_peak,
+                "dispatcher": runtime.websocket_handler.dispatcher.stats(),
+                "outbound": runtime.bot_handler.outbound.stats(),
+            }
+        finally:
+            await runner.cleanup()
+            await pubsub.close()
+            await connector.close()
+
+    async def _wait_for_replies(self, expected: int):
+        while len(self.latencies) < expected:
+            await asyncio.sleep(0.05)
+
+
+def report(args: argparse.Namespace, test: LoadTest, results: dict):
+    elapsed = results["elapsed"]
+    print(f"\nLoad: {args.rate:g} msg/s for {args.duration:g}s over {args.conversations} conversations, "
+          f"agent delay {args.agent_delay * 1000:.0f} ms")
+    print(f"Agent types: {', '.join(test.agent_types)}")
+    print(f"Wire format: {args.wire_encoding}, compression {args.wire_compression}; "
+          f"{results['agent_bytes']} bytes in {results['agent_frames']} AutoGen frames")
+    print(f"Sent {results['sent']} messages ({results['request_errors']} request errors), "
+          f"received {results['replies']} replies in {results['connector_activities']} Connector activities")
+    if elapsed > 0:
+        print(f"Throughput: {results['replies'] / elapsed:.1f} replies/s")
+    for name, values in (("End-to-end", test.latencies), ("/api/messages", test.request_latencies)):
+        print(f"{name} latency (ms): p50 {percentile(values, 50) * 1000:.1f}  "
+              f"p90 {percentile(values, 90) * 1000:.1f}  p99 {percentile(values, 99) * 1000:.1f}  "
+              f"max {(max(values) if values else float('nan')) * 1000:.1f}")
+    print(f"Memory (MiB): RSS {results['rss_before']:.1f} -> {results['rss_after']:.1f}, "
+          f"peak {results['rss_peak']:.1f}" +
+          (f", Python heap peak {results['heap_peak']:.1f}" if results["heap_peak"] is not None else ""))
+    print(f"Dispatcher: {results['dispatcher']}")
+    print(f"Outbound: {results['outbound']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=20, help="user messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to send for")
+    parser.add_argument("--conversations", type=int, default=50, help="distinct conversations")
+    parser.add_argument("--agent-types", type=lambda value: value.split(","), default=None,
+                        help="comma-separated agent types to reply with (default: all recorded)")
+    parser.add_argument("--agent-delay", type=float, default=0.05, help="simulated AutoGen think time in seconds")
+    parser.add_argument("--wire-encoding", choices=("json", "msgpack", "cbor"), default="json",
+                        help="frame encoding the fake AutoGen backend picks when offered")
+    parser.add_argument("--wire-compression", choices=("none", "deflate", "zstd"), default="none",
+                        help="frame compression the fake AutoGen backend picks when offered")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="seconds to wait for outstanding replies")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak Python heap (slower)")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    test = LoadTest(args)
+    results = asyncio.run(test.run())
+    report(args, test, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Microbenchmarks for the per-reply hot path: decoding, formatting and card building.
+
+Run from the repository root:
+
+    python -m benchmarks.micro [--agent-types flight_booking,destination_info] [--number 20000]
+"""
+import argparse
+import timeit
+from typing import Callable, List
+
+from benchmarks import load_payloads
+from agent_message import AgentMessage, JSON_BACKEND, dumps
+from bot_handler import BotHandler
+from card_templates import card_attachment, render_card
+from message_formatter import MessageFormatter
+
+
+def best_per_call(func: Callable[[], object], number: int, repeat: int) -> float:
+    """Best mean time per call in microseconds across ``repeat`` runs"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def benchmarks_for(payload: dict, formatter: MessageFormatter, handler: BotHandler):
+    frame = dumps(dict(payload, conversation_id="bench-conversation"))
+    message = AgentMessage.from_frame(frame)
+    text, actions = formatter.format_message(message)
+    card = render_card(text, actions)
+    return [
+        ("AgentMessage.from_frame", lambda: AgentMessage.from_frame(frame)),
+        ("MessageFormatter.format_message", lambda: formatter.format_message(message)),
+        ("render_card", lambda: render_card(text, actions)),
+        ("card_attachment", lambda: card_attachment(card)),
+        ("build_reply_activity", lambda: handler.build_reply_activity(message, text, actions)),
+        ("reply serialize", lambda: handler.build_reply_activity(message, text, actions).serialize()),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agent-types", type=lambda value: value.split(","), default=None,
+                        help="comma-separated agent types (default: all recorded)")
+    parser.add_argument("--number", type=int, default=10000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs; the best is reported")
+    args = parser.parse_args()
+
+    payloads = load_payloads()
+    agent_types: List[str] = args.agent_types or list(payloads)
+    formatter = MessageFormatter()
+    handler = BotHandler(None, "benchmark", None)
+
+    print(f"JSON backend: {JSON_BACKEND}; best of {args.repeat} x {args.number} calls, microseconds per call")
+    for agent_type in agent_types:
+        print(f"\n{agent_type}")
+        for name, func in benchmarks_for(payloads[agent_type], formatter, handler):
+            print(f"  {name:<34}{best_per_call(func, args.number, args.repeat):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Cold start profile: import time by package, and time until /health and /ready answer.
+
+Run from the repository root:
+
+    python -m benchmarks.startup [--repeat 5] [--json startup.json] [--baseline startup.json]
+
+Imports are timed with ``python -X importtime`` in fresh interpreters. For
+the serve timings app.py is started as a subprocess against the fake Web
+PubSub server, and /health and /ready are polled from the moment it is
+spawned. /ready includes the random delay before the first connect, so
+with ``--baseline`` the run fails when the median import time of app or time
+until the runtime is built is more than ``--max-regression`` slower than
+the saved results.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from benchmarks import load_payloads
+from benchmarks.fake_services import FakeWebPubSub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Nothing connects with it; the bot only needs one to be set
+DUMMY_CONNECTION_STRING = "Endpoint=https://benchmark.webpubsub.azure.com;AccessKey=YmVuY2htYXJr;Version=1.0;"
+
+
+def bot_env(**overrides: str) -> Dict[str, str]:
+    env = dict(os.environ, PYTHONPATH=ROOT, LOG_LEVEL="WARNING")
+    env.setdefault("WEBPUBSUB_CONNECTION_STRING1", DUMMY_CONNECTION_STRING)
+    env.update(overrides)
+    return env
+
+
+def parse_importtime(output: str, module: str) -> Tuple[float, Dict[str, float]]:
+    """Total import time of ``module`` and self time per top-level package, in ms"""
+    total = 0.0
+    by_package: Dict[str, float] = defaultdict(float)
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        by_package[name.split(".")[0]] += int(self_us) / 1000
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, dict(by_package)
+
+
+def profile_import(module: str) -> Tuple[float, Dict[str, float]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=bot_env(), capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr, module)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def poll(session: aiohttp.ClientSession, url: str) -> Tuple[int, dict]:
+    async with session.get(url) as response:
+        return response.status, await response.json()
+
+
+async def time_serve(pubsub_url: str, startup_mode: str, timeout: float) -> Dict[str, Optional[float]]:
+    """Milliseconds from spawning app.py to its first /health answer, to the
+    runtime being built, and to /ready"""
+    port = free_port()
+    env = bot_env(PORT=str(port), WEBSOCKET_URL=pubsub_url, STARTUP_MODE=startup_mode)
+    env.pop("WEBSITE_HOSTNAME", None)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings: Dict[str, Optional[float]] = {"health_ms": None, "built_ms": None, "ready_ms": None}
+    base = f"http://localhost:{port}"
+    try:
+        async with aiohttp.ClientSession() as session:
+            while time.perf_counter() - started < timeout and timings["ready_ms"] is None:
+                elapsed = (time.perf_counter() - started) * 1000
+                try:
+                    if timings["built_ms"] is None:
+                        status, body = await poll(session, f"{base}/health")
+                        if status == 200 and timings["health_ms"] is None:
+                            timings["health_ms"] = elapsed
+                        if body.get("status") == "ok":
+                            timings["built_ms"] = elapsed
+                    else:
+                        status, _ = await poll(session, f"{base}/ready")
+                        if status == 200:
+                            timings["ready_ms"] = elapsed
+                except (aiohttp.ClientError, ValueError):
+                    if process.poll() is not None:
+                        raise RuntimeError(f"app.py exited with status {process.returncode}")
+                await asyncio.sleep(0.005)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return timings
+
+
+async def serve_runs(repeat: int, startup_mode: str, timeout: float) -> List[Dict[str, Optional[float]]]:
+    payloads = load_payloads()
+    pubsub = FakeWebPubSub(payloads, list(payloads))
+    await pubsub.start()
+    try:
+        return [await time_serve(pubsub.url, startup_mode, timeout) for _ in range(repeat)]
+    finally:
+        await pubsub.close()
+
+
+def median(values: List[Optional[float]]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def run(args: argparse.Namespace) -> dict:
+    results: dict = {"imports": {}, "packages": {}}
+    for module in ("app", "runtime"):
+        profiles = [profile_import(module) for _ in range(args.repeat)]
+        results["imports"][module] = median([total for total, _ in profiles])
+        if module == "app":
+            packages: Dict[str, List[float]] = defaultdict(list)
+            for _, by_package in profiles:
+                for package, ms in by_package.items():
+                    packages[package].append(ms)
+            results["packages"] = {package: statistics.median(values) for package, values in packages.items()}
+    if not args.no_serve:
+        runs = asyncio.run(serve_runs(args.repeat, args.startup_mode, args.timeout))
+        results["serve"] = {key: median([timings[key] for timings in runs]) for key in runs[0]}
+    return results
+
+
+def format_ms(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:.0f} ms"
+
+
+def report(args: argparse.Namespace, results: dict):
+    print(f"Import app: {format_ms(results['imports']['app'])}  "
+          f"(runtime, imported in the background: {format_ms(results['imports']['runtime'])})")
+    print("Slowest packages imported by app (self time):")
+    slowest = sorted(results["packages"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+    for package, ms in slowest:
+        print(f"  {package:<32} {ms:7.1f} ms")
+    if "serve" in results:
+        serve = results["serve"]
+        print(f"Serve ({args.startup_mode}): /health {format_ms(serve['health_ms'])}, "
+              f"runtime built {format_ms(serve['built_ms'])}, /ready {format_ms(serve['ready_ms'])}")
+
+
+def regressions(results: dict, baseline: dict, max_regression: float) -> List[str]:
+    checks = [("import app", results["imports"]["app"], baseline["imports"]["app"])]
+    if "serve" in results and "serve" in baseline:
+        checks.append(("runtime built", results["serve"]["built_ms"], baseline["serve"]["built_ms"]))
+    failures = []
+    for name, value, before in checks:
+        if value is None or before is None:
+            continue
+        if value > before * (1 + max_regression):
+            failures.append(f"{name}: {value:.0f} ms, baseline {before:.0f} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; medians are reported")
+    parser.add_argument("--top", type=int, default=10, help="packages to list")
+    parser.add_argument("--startup-mode", choices=("deferred", "eager"), default="deferred",
+                        help="STARTUP_MODE for the serve timings")
+    parser.add_argument("--no-serve", action="store_true", help="only profile imports")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for /ready")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to this file")
+    parser.add_argument("--baseline", metavar="PATH", help="results of an earlier --json run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed slowdown against the baseline, as a fraction (default 0.2)")
+    args = parser.parse_args()
+
+    results = run(args)
+    report(args, results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = regressions(results, json.load(f), args.max_regression)
+        for failure in failures:
+            print(f"Regression: {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,60 @@
 # Licensed under the MIT License.
 
 from botbuilder.core import ActivityHandler, TurnContext
-from botbuilder.schema import ChannelAccount, Activity, ActivityTypes, ActionTypes, SuggestedActions, CardAction
+from botbuilder.schema import ChannelAccount, Activity, ActivityTypes
+from card_templates import card_text
+from pagination import SHOW_MORE_ACTION, ReplyPaginator
+from reply_cache import ReplyCache
 from suggested_actions import get_suggested_actions
+from tracing import TRACER
 from websocket_handler import WebSocketHandler
 
 
 
 class MyBot(ActivityHandler):
     # See https://aka.ms/about-bot-activity-message to learn more about the message and other activity types.
+    reply_cache = None
+    paginator = None
+
     def set_ws_handler(self, ws_handler: WebSocketHandler):
         self.ws_handler = ws_handler
 
+    def set_reply_cache(self, reply_cache: ReplyCache):
+        self.reply_cache = reply_cache
+
+    def set_paginator(self, paginator: ReplyPaginator):
+        self.paginator = paginator
+
+    async def _send_next_page(self, turn_context: TurnContext, cursor):
+        """Answer a "Show more" button from the paginator's cursor"""
+        next_page = await self.paginator.next_page(cursor) if isinstance(cursor, str) else None
+        if next_page is None:
+            await turn_context.send_activity("That list is no longer available. Please ask again to see it.")
+            return
+        await turn_context.send_activity(next_page)
+
+    async def _has_history(self, conversation_id: str) -> bool:
+        """Whether the next message will carry earlier turns of the conversation to AutoGen"""
+        history = self.ws_handler.history if self.ws_handler else None
+        if history is None:
+            return False
+        window = await history.window(
+            conversation_id, self.ws_handler.history_window_turns, self.ws_handler.history_window_chars
+        )
+        return bool(window)
+
+    async def _record_cached_turn(self, conversation_id: str, message, replies: list):
+        """Add a turn answered from the reply cache to the conversation history"""
+        history = self.ws_handler.history if self.ws_handler else None
+        if history is None:
+            return
+        await history.add_user(conversation_id, message)
+        for reply in replies:
+            agent = reply.from_property.name if reply.from_property else None
+            for attachment in reply.attachments or []:
+                if isinstance(attachment.content, dict):
+                    await history.add_agent_text(conversation_id, agent, card_text(attachment.content))
+
     async def _send_suggested_actions(self, turn_context: TurnContext):
         """Helper method to create and send suggested actions"""
         reply = get_suggested_actions()
@@ -24,8 +67,32 @@ class MyBot(ActivityHandler):
 
         # Handle both regular text and card responses
         message = text if text else value
-        if self.ws_handler:
-            await self.ws_handler.send_message(message)
+        conversation_id = turn_context.activity.conversation.id
+        with TRACER.start_span("bot.on_message_activity", attributes={"conversation.id": conversation_id}) as span:
+            if self.paginator is not None and isinstance(value, dict) and value.get("action") == SHOW_MORE_ACTION:
+                span.set_attribute("reply.show_more", True)
+                await self._send_next_page(turn_context, value.get("cursor"))
+                return
+
+            if self.reply_cache is not None:
+                # A new message ends the collection of replies to the previous one
+                self.reply_cache.finish(conversation_id)
+                destination = value.get("destination", "") if isinstance(value, dict) else ""
+                cache_key = self.reply_cache.key(message, destination)
+                # AutoGen's answer may build on earlier turns, e.g. a booking just made
+                if cache_key and await self._has_history(conversation_id):
+                    cache_key = None
+                if cache_key:
+                    cached_replies = self.reply_cache.get(cache_key)
+                    span.set_attribute("reply_cache.hit", cached_replies is not None)
+                    if cached_replies:
+                        await turn_context.send_activities(cached_replies)
+                        await self._record_cached_turn(conversation_id, message, cached_replies)
+                        return
+                    self.reply_cache.begin(conversation_id, cache_key)
+
+            if self.ws_handler:
+                await self.ws_handler.send_message(message, conversation_id)
         
         # Then show the suggested actions again
         # await self._send_suggested_actions(turn_context)
@@ -1,57 +1,120 @@
 """Handles bot operations and message processing"""
 import logging
-import json
-from aiohttp.web import Request, Response, json_response
-from botbuilder.schema import Activity, ActionTypes, ActivityTypes, ConversationReference, ChannelAccount, ConversationParameters, CardAction, SuggestedActions, Attachment
-from typing import List, Optional
+from aiohttp.web import HTTPUnauthorized, Request, Response, json_response
+from botbuilder.schema import Activity, ActionTypes, ActivityTypes, ConversationReference, ChannelAccount, ConversationParameters, CardAction, SuggestedActions
+from typing import List, Optional, Union
 from botbuilder.core import (
     TurnContext,
 )
 from botbuilder.integration.aiohttp import CloudAdapter
 
+from agent_message import AgentMessage, loads
+from card_templates import render_card, reply_activity
+from conversation_registry import ConversationRegistry
+from conversation_store import ConversationStore
+from logging_config import log_payload
 from message_formatter import MessageFormatter
-from suggested_actions import get_suggested_actions
+from outbound_scheduler import OutboundScheduler
+from pagination import ReplyPaginator
+from reply_cache import ReplyCache
+from reply_streams import ReplyStreamManager
+from tracing import TRACER
 
 LOG = logging.getLogger(__name__)
 
 class BotHandler:
-    def __init__(self, bot_adapter: CloudAdapter, app_id: str, bot):
+    def __init__(
+        self,
+        bot_adapter: CloudAdapter,
+        app_id: str,
+        bot,
+        max_conversations: int = 10000,
+        conversation_ttl_seconds: float = 86400,
+        request_log_sample_rate: float = 0.01,
+        stream_update_interval: float = 1.5,
+        outbound_options: Optional[dict] = None,
+        conversation_store: Optional[ConversationStore] = None,
+        reply_cache: Optional[ReplyCache] = None,
+        pagination_options: Optional[dict] = None,
+    ):
         self.bot_adapter = bot_adapter
         self.app_id = app_id
         self.bot = bot
-        self.last_conversation_reference: Optional[ConversationReference] = None
+        self.conversations = ConversationRegistry(
+            max_conversations,
+            conversation_ttl_seconds,
+            store=conversation_store
+        )
+        # Used only for AutoGen messages that carry no conversation id
+        self.default_conversation_reference: Optional[ConversationReference] = None
         self.message_formatter = MessageFormatter()
+        self.request_log_sample_rate = request_log_sample_rate
+        self.outbound = OutboundScheduler(self.send_to_conversation, **(outbound_options or {}))
+        self.reply_streams = ReplyStreamManager(self, update_interval=stream_update_interval)
+        # Splits long replies into pages; MyBot serves "Show more" from its cursors
+        self.paginator = ReplyPaginator(
+            store=conversation_store if conversation_store is not None and conversation_store.shared else None,
+            **(pagination_options or {})
+        )
+        # Collects replies to cacheable prompts; MyBot answers repeats from it
+        self.reply_cache = reply_cache
 
     def create_conversation(self) -> ConversationReference:
         conversationParam = ConversationParameters(is_group=False, bot=self.bot, members=[ChannelAccount(id=self.app_id)],)
         conversationReference = self.bot_adapter.create_conversation(self.app_id, self.bot,conversationParam)
         return conversationReference
+
+    async def get_conversation_reference(self, conversation_id: Optional[str]) -> Optional[ConversationReference]:
+        """Resolve the reference for an AutoGen message's conversation id"""
+        if not conversation_id:
+            return self.default_conversation_reference
+
+        reference = await self.conversations.resolve(conversation_id)
+        if not reference:
+            LOG.warning(f"Unknown or expired conversation id: {conversation_id}")
+        return reference
     
 
     async def messages(self, req: Request) -> Response:
         """Handle incoming HTTP requests on /api/messages"""
-        # Print header & body for debugging
-        raw_body = await req.read()
-        print(req.headers["Content-Type"])
-        print(raw_body)
-
-        # Main bot message handler
-        if "application/json" in req.headers["Content-Type"]:
-            body = await req.json()
-        else:
+        if "application/json" not in req.headers.get("Content-Type", ""):
             return Response(status=415)
 
-        activity = Activity().deserialize(body)
-        
-        # Store the conversation reference
-        self.last_conversation_reference = TurnContext.get_conversation_reference(activity)
-        
-        auth_header = req.headers["Authorization"] if "Authorization" in req.headers else ""
+        # Continue the caller's trace if the channel sent a W3C traceparent header
+        with TRACER.start_span("bot.messages", parent=req.headers.get("traceparent")) as span:
+            # Read and decode the body once; the parsed activity goes straight to the adapter
+            raw_body = await req.read()
+
+            try:
+                body = loads(raw_body)
+            except ValueError:
+                return Response(status=400)
+
+            activity = Activity().deserialize(body)
+            if not activity.type:
+                return Response(status=400)
+            span.set_attribute("activity.type", activity.type)
+            conversation_id = activity.conversation.id if activity.conversation else None
+            span.set_attribute("conversation.id", conversation_id)
+            log_payload(LOG, f"Request {req.method} {req.path}", raw_body, conversation_id,
+                        level=logging.DEBUG, sample_rate=self.request_log_sample_rate)
 
-        response = await self.bot_adapter.process(req, self.bot)
-        if response:
-            return json_response(data=response.body, status=response.status)
-        return Response(status=201)
+            auth_header = req.headers.get("Authorization", "")
+
+            try:
+                response = await self.bot_adapter.process_activity(auth_header, activity, self.on_turn)
+            except PermissionError:
+                raise HTTPUnauthorized()
+            if response:
+                return json_response(data=response.body, status=response.status)
+            return Response(status=201)
+
+    async def on_turn(self, turn_context: TurnContext):
+        """Run the bot for a turn the adapter has authenticated"""
+        # Saved only here, after the Authorization header has been checked, so a
+        # forged activity can't point AutoGen's replies at its own serviceUrl
+        await self.conversations.save(TurnContext.get_conversation_reference(turn_context.activity))
+        await self.bot.on_turn(turn_context)
 
     def create_suggested_actions(self, actions_data: List[dict]) -> SuggestedActions:
         """Create suggested actions from provided data"""
@@ -77,61 +140,66 @@ class BotHandler:
         )
         await turn_context.send_activity(typing_activity)
     
-    async def process_websocket_message(self, message: str):
-        """Process incoming WebSocket messages"""
-        if not self.last_conversation_reference:
-            LOG.warning("No conversation reference available - message cannot be processed")
+    async def send_typing(self, conversation_id: str):
+        """Send a typing indicator to a conversation under the outbound rate limits"""
+        conversation_reference = await self.get_conversation_reference(conversation_id)
+        if not conversation_reference:
             return
+        await self.outbound.call(
+            conversation_id,
+            lambda: self.bot_adapter.continue_conversation(conversation_reference, self.show_typing, self.app_id)
+        )
+
+    def build_reply_activity(self, message: AgentMessage, text: str, suggested_actions: list) -> Activity:
+        """Create the adaptive card activity for an agent reply"""
+        return reply_activity(message.agent, [render_card(text, suggested_actions)])
 
+    async def send_to_conversation(self, conversation_reference: ConversationReference, activity: Activity) -> Optional[str]:
+        """Send an activity proactively and return the id the channel assigned to it"""
+        resource_ids = []
+
+        async def callback(context: TurnContext):
+            response = await context.send_activity(activity)
+            if response:
+                resource_ids.append(response.id)
+
+        await self.bot_adapter.continue_conversation(conversation_reference, callback, self.app_id)
+        return resource_ids[0] if resource_ids else None
+
+    async def update_in_conversation(self, conversation_reference: ConversationReference, activity: Activity):
+        """Replace a previously sent activity; activity.id must be set"""
+        async def callback(context: TurnContext):
+            await context.update_activity(activity)
+
+        await self.bot_adapter.continue_conversation(conversation_reference, callback, self.app_id)
+
+    async def process_websocket_message(self, message: Union[AgentMessage, dict, str]):
+        """Process incoming WebSocket messages"""
         try:
-            message_data = json.loads(message)
-            formatted_text, suggested_actions = self.message_formatter.format_message(message_data)
-            agent_name = message_data.get('agent', 'AutoGen Agent')
-            
-            async def callback(context: TurnContext):
-                # Create adaptive card
-                card = {
-                    "type": "AdaptiveCard",
-                    "version": "1.4",
-                    "body": [
-                        {
-                            "type": "TextBlock",
-                            "text": formatted_text,
-                            "wrap": True,
-                            "size": "Medium"
-                        }
-                    ],
-                    "actions": [
-                        {
-                            "type": "Action.Submit",
-                            "title": action["title"],
-                            "data": action["value"]
-                        }
-                        for action in suggested_actions
-                    ]
-                }
-
-                attachment = Attachment(
-                    content_type="application/vnd.microsoft.card.adaptive",
-                    content=card
-                )
-                
-                # Create activity with the adaptive card
-                message_activity = Activity(
-                    type=ActivityTypes.message,
-                    attachments=[attachment],
-                    from_property=ChannelAccount(
-                        id=f"agent-{agent_name.lower().replace(' ', '-')}",
-                        name=agent_name
-                    )
-                )
-                await context.send_activity(message_activity)
-                
-            await self.bot_adapter.continue_conversation(
-                self.last_conversation_reference, 
-                callback,
-                self.app_id
-            )
+            message = AgentMessage.coerce(message)
+            conversation_reference = await self.get_conversation_reference(message.conversation_id)
+            if not conversation_reference:
+                LOG.warning("No conversation reference available - message cannot be processed")
+                return
+
+            if message.stream_id:
+                if self.reply_cache is not None:
+                    # Streamed replies are built up in place and can't be replayed
+                    self.reply_cache.discard(message.conversation_id)
+                await self.reply_streams.handle_chunk(message, conversation_reference)
+                return
+
+            with TRACER.start_span("formatter.format_message", attributes={"agent.type": message.agent_type}) as span:
+                blocks, suggested_actions = self.message_formatter.format_blocks(message)
+                message_activity, paged = await self.paginator.build(message.agent, blocks, suggested_actions)
+                span.set_attribute("reply.paged", paged)
+            if self.reply_cache is not None:
+                if paged:
+                    # The "Show more" cursor belongs to this conversation and is single use
+                    self.reply_cache.discard(message.conversation_id)
+                else:
+                    self.reply_cache.record(message.conversation_id, message_activity, message.agent_type)
+            await self.outbound.send(conversation_reference, message_activity)
         except Exception as e:
             LOG.error(f"Error processing WebSocket message: {str(e)}")
-            raise
\ No newline at end of file
+            raise
@@ -0,0 +1,388 @@
+"""Proactive fan-out of one agent update to many conversations"""
+import asyncio
+import hmac
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set
+
+from aiohttp.web import HTTPNotFound, HTTPUnauthorized, Request, Response, json_response
+from botbuilder.schema import Activity
+
+from agent_message import AgentMessage, dumps, loads
+from conversation_store import ConversationStore
+from metrics import BROADCAST_SENDS
+from outbound_scheduler import TokenBucket, http_status
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where topic file updates aren't locked
+    fcntl = None
+
+if TYPE_CHECKING:
+    from bot_handler import BotHandler
+
+LOG = logging.getLogger(__name__)
+
+
+class TopicRegistry:
+    """Conversation ids subscribed to each topic, e.g. ``flight-SQ27``.
+
+    With a shared ``store``, each topic is a set in the store, so every
+    worker sees every change. Otherwise topics are held in memory and, with a
+    ``path``, saved atomically after every change. Updates hold an exclusive
+    lock on ``<path>.lock`` from reloading the file to replacing it, so
+    processes sharing the path don't overwrite each other's changes, and
+    reads reload the file whenever another process has replaced it.
+    """
+
+    KEY_PREFIX = "broadcast-topic:"
+
+    def __init__(self, path: Optional[str] = None, store: Optional[ConversationStore] = None):
+        self.path = path
+        self.store = store
+        self._topics: Dict[str, Set[str]] = {}
+        self._loaded_mtime: Optional[int] = None
+        if path and store is None:
+            self.load()
+
+    def _refresh(self):
+        if not self.path:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._loaded_mtime:
+            self.load()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the file lock and the latest saved topics"""
+        if not self.path or fcntl is None:
+            yield
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.load()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    async def subscribe(self, topic: str, conversation_ids: Iterable[str]) -> int:
+        if self.store is not None:
+            return await self.store.add_members(self.KEY_PREFIX + topic, conversation_ids)
+        with self._locked():
+            subscribers = self._topics.setdefault(topic, set())
+            subscribers.update(conversation_ids)
+            self.save()
+            return len(subscribers)
+
+    async def unsubscribe(self, topic: str, conversation_ids: Optional[Iterable[str]] = None) -> int:
+        """Remove some subscribers from a topic, or the whole topic if none are given"""
+        if self.store is not None:
+            return await self.store.remove_members(self.KEY_PREFIX + topic, conversation_ids)
+        with self._locked():
+            if conversation_ids is None:
+                self._topics.pop(topic, None)
+            else:
+                subscribers = self._topics.get(topic, set())
+                subscribers.difference_update(conversation_ids)
+                if not subscribers:
+                    self._topics.pop(topic, None)
+            self.save()
+            return len(self._topics.get(topic, ()))
+
+    async def subscribers(self, topic: str) -> Set[str]:
+        if self.store is not None:
+            return await self.store.get_members(self.KEY_PREFIX + topic)
+        self._refresh()
+        return set(self._topics.get(topic, ()))
+
+    async def topics(self) -> Dict[str, int]:
+        if self.store is not None:
+            return await self.store.count_members(self.KEY_PREFIX)
+        self._refresh()
+        return {topic: len(subscribers) for topic, subscribers in self._topics.items()}
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                self._loaded_mtime = os.fstat(f.fileno()).st_mtime_ns
+                saved = loads(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            LOG.warning(f"Could not load broadcast topics from {self.path}: {str(e)}")
+            return
+        self._topics = {topic: set(conversation_ids) for topic, conversation_ids in saved.items()}
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(dumps({topic: sorted(subscribers) for topic, subscribers in self._topics.items()}))
+        os.replace(temporary_path, self.path)
+        self._loaded_mtime = os.stat(self.path).st_mtime_ns
+
+
+class BroadcastJob:
+    """Progress and per-conversation results of one broadcast"""
+
+    __slots__ = ("id", "total", "sent", "failed", "results", "started_at", "finished_at", "task")
+
+    def __init__(self, total: int):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.results: Dict[str, dict] = {}
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def record(self, conversation_id: str, status: str, activity_id: Optional[str] = None, error: Optional[str] = None):
+        result = {"status": status}
+        if activity_id:
+            result["activity_id"] = activity_id
+        if error:
+            result["error"] = error
+        self.results[conversation_id] = result
+        if status == "sent":
+            self.sent += 1
+        else:
+            self.failed += 1
+        BROADCAST_SENDS.inc(result=status)
+
+    def as_dict(self, include_results: bool = True) -> dict:
+        report = {
+            "id": self.id,
+            "status": "done" if self.done else "running",
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pending": self.total - self.sent - self.failed,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if include_results:
+            report["results"] = self.results
+        return report
+
+
+class Broadcaster:
+    """Delivers one rendered activity to many conversations.
+
+    The message is formatted and its card built once. ``concurrency`` workers
+    take conversations from a shared iterator, so the number of Connector
+    calls in flight stays bounded however many targets there are, and every
+    send also takes a token from the broadcast bucket. Sends go through the
+    ``OutboundScheduler``'s limits and retries, so a broadcast shares the
+    bot's global Connector budget with ordinary replies, while
+    ``rate`` keeps some of that budget free for them.
+
+    Jobs run on the worker that received the request. With a shared
+    ``store``, each job's report is also written there every
+    ``report_interval`` seconds while it runs and once it finishes, so any
+    worker can answer a status request for it.
+    """
+
+    REPORT_KEY_PREFIX = "broadcast-job:"
+
+    def __init__(
+        self,
+        bot_handler: "BotHandler",
+        topics: Optional[TopicRegistry] = None,
+        concurrency: int = 32,
+        rate: float = 30,
+        max_jobs: int = 100,
+        store: Optional[ConversationStore] = None,
+        report_interval: float = 1.0,
+        report_ttl_seconds: float = 86400
+    ):
+        self.bot_handler = bot_handler
+        self.topics = topics or TopicRegistry()
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, rate)
+        self.max_jobs = max_jobs
+        self.store = store
+        self.report_interval = report_interval
+        self.report_ttl_seconds = report_ttl_seconds
+        self.jobs: "OrderedDict[str, BroadcastJob]" = OrderedDict()
+
+    def render(self, message: dict) -> Activity:
+        """Build the reply activity for an AutoGen-style message payload"""
+        agent_message = AgentMessage.coerce(message)
+        formatted_text, suggested_actions = self.bot_handler.message_formatter.format_message(agent_message)
+        return self.bot_handler.build_reply_activity(agent_message, formatted_text, suggested_actions)
+
+    def start(self, activity: Activity, conversation_ids: Iterable[str]) -> BroadcastJob:
+        """Start delivering an activity in the background and return its job"""
+        targets = list(dict.fromkeys(conversation_ids))
+        job = BroadcastJob(len(targets))
+        job.task = asyncio.create_task(self._run(job, activity, targets))
+        self.jobs[job.id] = job
+        # Forget the oldest finished jobs
+        for job_id in [job_id for job_id, old in self.jobs.items() if old.done][:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+        return job
+
+    async def _run(self, job: BroadcastJob, activity: Activity, targets: List[str]):
+        LOG.info(f"Broadcast {job.id} started to {job.total} conversations")
+        iterator = iter(targets)
+        reporter = asyncio.create_task(self._report_progress(job)) if self.store is not None else None
+        try:
+            await asyncio.gather(*(
+                self._worker(job, activity, iterator) for _ in range(min(self.concurrency, len(targets)))
+            ))
+        finally:
+            job.finished_at = time.time()
+            if reporter is not None:
+                reporter.cancel()
+                await self._publish(job)
+            LOG.info(
+                f"Broadcast {job.id} finished in {job.finished_at - job.started_at:.1f}s: "
+                f"{job.sent} sent, {job.failed} failed"
+            )
+
+    async def _report_progress(self, job: BroadcastJob):
+        while True:
+            await self._publish(job)
+            await asyncio.sleep(self.report_interval)
+
+    async def _publish(self, job: BroadcastJob):
+        try:
+            await self.store.put_value(self.REPORT_KEY_PREFIX + job.id, job.as_dict(), self.report_ttl_seconds)
+        except Exception as e:
+            LOG.warning(f"Could not save the report of broadcast {job.id}: {str(e)}")
+
+    async def report(self, job_id: str) -> Optional[dict]:
+        """A job's report, from this worker if it ran the job, otherwise from the store"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.as_dict()
+        if self.store is not None:
+            return await self.store.get_value(self.REPORT_KEY_PREFIX + job_id)
+        return None
+
+    async def _worker(self, job: BroadcastJob, activity: Activity, targets: Iterator[str]):
+        for conversation_id in targets:
+            reference = await self.bot_handler.get_conversation_reference(conversation_id)
+            if reference is None:
+                job.record(conversation_id, "unknown_conversation")
+                continue
+            await self.bucket.acquire()
+            try:
+                activity_id = await self.bot_handler.outbound.call(
+                    conversation_id,
+                    lambda: self.bot_handler.send_to_conversation(reference, activity)
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                status = http_status(e)
+                job.record(conversation_id, "failed", error=f"HTTP {status}" if status else str(e))
+            else:
+                job.record(conversation_id, "sent", activity_id=activity_id)
+
+    async def stop(self):
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.done]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class BroadcastApi:
+    """HTTP routes for broadcasts and topic subscriptions, guarded by an API key"""
+
+    def __init__(self, broadcaster: Broadcaster, api_key: str):
+        self.broadcaster = broadcaster
+        self.api_key = api_key
+
+    def _authorize(self, req: Request):
+        supplied = req.headers.get("X-Api-Key", "")
+        authorization = req.headers.get("Authorization", "")
+        if not supplied and authorization.startswith("Bearer "):
+            supplied = authorization[len("Bearer "):]
+        if not hmac.compare_digest(supplied.encode("utf-8"), self.api_key.encode("utf-8")):
+            raise HTTPUnauthorized()
+
+    async def _json_body(self, req: Request) -> Optional[dict]:
+        try:
+            body = loads(await req.read())
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+
+    async def post_broadcast(self, req: Request) -> Response:
+        """Body: ``{"message": {...}, "conversation_ids": [...], "topic": "..."}``.
+
+        ``message`` is an AutoGen-style payload with ``agent``, ``agent_type``
+        and ``data``. Targets are the listed conversations plus the topic's
+        subscribers. Returns 202 with the job id; pass ``"wait": true`` to
+        get the full report once every send has finished instead.
+        """
+        self._authorize(req)
+        body = await self._json_body(req)
+        if body is None or not isinstance(body.get("message"), dict):
+            return json_response({"error": "Expected a JSON object with a 'message' object"}, status=400)
+
+        conversation_ids = body.get("conversation_ids") or []
+        if not isinstance(conversation_ids, list) or not all(isinstance(value, str) for value in conversation_ids):
+            return json_response({"error": "'conversation_ids' must be a list of strings"}, status=400)
+        topic = body.get("topic")
+        if topic:
+            conversation_ids = conversation_ids + sorted(await self.broadcaster.topics.subscribers(topic))
+        if not conversation_ids:
+            return json_response({"error": "No target conversations"}, status=400)
+
+        activity = self.broadcaster.render(body["message"])
+        job = self.broadcaster.start(activity, conversation_ids)
+        if body.get("wait"):
+            await asyncio.shield(job.task)
+            return json_response(job.as_dict())
+        return json_response(job.as_dict(include_results=False), status=202)
+
+    async def get_broadcast(self, req: Request) -> Response:
+        self._authorize(req)
+        report = await self.broadcaster.report(req.match_info["job_id"])
+        if report is None:
+            raise HTTPNotFound()
+        return json_response(report)
+
+    async def get_topics(self, req: Request) -> Response:
+        self._authorize(req)
+        return json_response(await self.broadcaster.topics.topics())
+
+    async def put_subscribers(self, req: Request) -> Response:
+        """Body: ``{"conversation_ids": [...]}``; adds them to the topic"""
+        self._authorize(req)
+        body = await self._json_body(req)
+        conversation_ids = body.get("conversation_ids") if body else None
+        if not isinstance(conversation_ids, list) or not all(isinstance(value, str) for value in conversation_ids):
+            return json_response({"error": "Expected {\"conversation_ids\": [...]}"}, status=400)
+        count = await self.broadcaster.topics.subscribe(req.match_info["topic"], conversation_ids)
+        return json_response({"topic": req.match_info["topic"], "subscribers": count})
+
+    async def delete_subscribers(self, req: Request) -> Response:
+        """Body: ``{"conversation_ids": [...]}`` to remove some subscribers; no body removes the topic"""
+        self._authorize(req)
+        body = await self._json_body(req) if req.can_read_body else None
+        conversation_ids = body.get("conversation_ids") if body else None
+        count = await self.broadcaster.topics.unsubscribe(req.match_info["topic"], conversation_ids)
+        return json_response({"topic": req.match_info["topic"], "subscribers": count})
@@ -0,0 +1,91 @@
+"""Precompiled Adaptive Card templates for agent replies"""
+from functools import lru_cache
+from typing import List, Optional
+
+from botbuilder.schema import Activity, ActivityTypes, Attachment, ChannelAccount
+
+from message_formatter import DEFAULT_ACTIONS
+
+ADAPTIVE_CARD_CONTENT_TYPE = "application/vnd.microsoft.card.adaptive"
+ADAPTIVE_CARD_VERSION = "1.4"
+
+
+def compile_actions(actions: List[dict]) -> List[dict]:
+    """Turn suggested actions into Action.Submit card elements"""
+    return [
+        {
+            "type": "Action.Submit",
+            "title": action["title"],
+            "data": action["value"]
+        }
+        for action in actions
+    ]
+
+
+# DEFAULT_ACTIONS never changes, so its card elements are built once and shared.
+# Rendered cards are only serialized, never mutated, which makes sharing safe.
+DEFAULT_ACTION_ELEMENTS = compile_actions(DEFAULT_ACTIONS)
+
+
+class CardTemplate:
+    """Static card structure; only text and actions vary per render"""
+
+    __slots__ = ("_text_block",)
+
+    def __init__(self, text_size: str = "Medium"):
+        self._text_block = {
+            "type": "TextBlock",
+            "wrap": True,
+            "size": text_size
+        }
+
+    def render(self, text: str, actions: List[dict]) -> dict:
+        """Fill in the variable fields of the template"""
+        if actions is DEFAULT_ACTIONS:
+            action_elements = DEFAULT_ACTION_ELEMENTS
+        else:
+            action_elements = compile_actions(actions)
+
+        return {
+            "type": "AdaptiveCard",
+            "version": ADAPTIVE_CARD_VERSION,
+            "body": [{**self._text_block, "text": text}],
+            "actions": action_elements
+        }
+
+
+# Every agent type's reply uses the same card layout
+DEFAULT_TEMPLATE = CardTemplate()
+
+
+def render_card(text: str, actions: List[dict]) -> dict:
+    """Render a reply card"""
+    return DEFAULT_TEMPLATE.render(text, actions)
+
+
+def card_text(card: dict) -> str:
+    """The text of a rendered card's TextBlocks"""
+    return "\n".join(element["text"] for element in card.get("body", []) if element.get("type") == "TextBlock")
+
+
+def card_attachment(card: dict) -> Attachment:
+    return Attachment(content_type=ADAPTIVE_CARD_CONTENT_TYPE, content=card)
+
+
+def reply_activity(agent: str, cards: List[dict], attachment_layout: Optional[str] = None) -> Activity:
+    """A message activity carrying an agent's reply cards"""
+    return Activity(
+        type=ActivityTypes.message,
+        attachments=[card_attachment(card) for card in cards],
+        attachment_layout=attachment_layout,
+        from_property=ChannelAccount(
+            id=agent_account_id(agent),
+            name=agent
+        )
+    )
+
+
+@lru_cache(maxsize=256)
+def agent_account_id(agent_name: str) -> str:
+    """Channel account id for an agent name, e.g. 'Flight Agent' -> 'agent-flight-agent'"""
+    return f"agent-{agent_name.lower().replace(' ', '-')}"
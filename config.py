@@ -7,6 +7,71 @@ import os
 class DefaultConfig:
     """ Bot Configuration """
 
+    PORT = int(os.environ.get("PORT", "3978"))
     SERVICE_URL = os.environ.get("SERVICE_URL", "http://localhost:3978")
     APP_ID = os.environ.get("MicrosoftAppId", "")
     APP_PASSWORD = os.environ.get("MicrosoftAppPassword", "")
+    CONVERSATION_CACHE_SIZE = int(os.environ.get("CONVERSATION_CACHE_SIZE", "10000"))
+    CONVERSATION_TTL_SECONDS = int(os.environ.get("CONVERSATION_TTL_SECONDS", "86400"))
+    DISPATCH_CONCURRENCY = int(os.environ.get("DISPATCH_CONCURRENCY", "8"))
+    DISPATCH_MAX_PENDING = int(os.environ.get("DISPATCH_MAX_PENDING", "1000"))
+    REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", "0.01"))
+    STREAM_UPDATE_INTERVAL_SECONDS = float(os.environ.get("STREAM_UPDATE_INTERVAL_SECONDS", "1.5"))
+    OUTBOUND_COALESCE_WINDOW_SECONDS = float(os.environ.get("OUTBOUND_COALESCE_WINDOW_SECONDS", "0.1"))
+    OUTBOUND_GLOBAL_RATE = float(os.environ.get("OUTBOUND_GLOBAL_RATE", "50"))
+    OUTBOUND_CONVERSATION_RATE = float(os.environ.get("OUTBOUND_CONVERSATION_RATE", "2"))
+    OUTBOUND_CONVERSATION_BURST = float(os.environ.get("OUTBOUND_CONVERSATION_BURST", "7"))
+    OUTBOUND_MAX_PENDING = int(os.environ.get("OUTBOUND_MAX_PENDING", "5000"))
+    TYPING_THRESHOLD_SECONDS = float(os.environ.get("TYPING_THRESHOLD_SECONDS", "0.5"))
+    TYPING_INTERVAL_SECONDS = float(os.environ.get("TYPING_INTERVAL_SECONDS", "3"))
+    WEBSOCKET_POOL_SIZE = int(os.environ.get("WEBSOCKET_POOL_SIZE", "1"))
+    WEBSOCKET_BUFFER_SIZE = int(os.environ.get("WEBSOCKET_BUFFER_SIZE", "1000"))
+    WEBSOCKET_SPILL_DIR = os.environ.get("WEBSOCKET_SPILL_DIR", "")
+    CONVERSATION_STORE_URL = os.environ.get("CONVERSATION_STORE_URL", "")
+    WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "1"))
+    # "deferred" serves /health as soon as the port is bound and builds the bot in the background;
+    # "eager" builds it before accepting connections
+    STARTUP_MODE = os.environ.get("STARTUP_MODE", "deferred")
+    TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "")  # "", "console" or "file"
+    TRACING_FILE = os.environ.get("TRACING_FILE", "traces.jsonl")
+    REPLY_CACHE_SIZE = int(os.environ.get("REPLY_CACHE_SIZE", "256"))  # 0 disables the cache
+    REPLY_CACHE_TTL_SECONDS = float(os.environ.get("REPLY_CACHE_TTL_SECONDS", "3600"))
+    REPLY_CACHE_PATH = os.environ.get("REPLY_CACHE_PATH", "")
+    REPLY_CACHE_ALL_PROMPTS = os.environ.get("REPLY_CACHE_ALL_PROMPTS", "false").lower() == "true"
+    # Agent types whose replies may be served to other conversations
+    REPLY_CACHE_AGENT_TYPES = [
+        name for name in os.environ.get("REPLY_CACHE_AGENT_TYPES", "destination_info").split(",") if name
+    ]
+    SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", "0"))  # 0 disables; needs numpy
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+    SEMANTIC_CACHE_TTL_SECONDS = float(os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+    SEMANTIC_CACHE_MIN_WORDS = int(os.environ.get("SEMANTIC_CACHE_MIN_WORDS", "4"))
+    # Agent types whose replies may be served to other conversations
+    SEMANTIC_CACHE_AGENT_TYPES = [
+        name for name in os.environ.get("SEMANTIC_CACHE_AGENT_TYPES", "destination_info").split(",") if name
+    ]
+    REPLY_PAGE_MAX_BYTES = int(os.environ.get("REPLY_PAGE_MAX_BYTES", "8000"))
+    REPLY_PAGE_LAYOUT = os.environ.get("REPLY_PAGE_LAYOUT", "list")  # "list" or "carousel"
+    REPLY_ACTIVITY_MAX_BYTES = int(os.environ.get("REPLY_ACTIVITY_MAX_BYTES", "24000"))
+    REPLY_PAGE_CURSOR_TTL_SECONDS = float(os.environ.get("REPLY_PAGE_CURSOR_TTL_SECONDS", "3600"))
+    BROADCAST_API_KEY = os.environ.get("BROADCAST_API_KEY", "")  # empty disables the broadcast API
+    BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "32"))
+    BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "30"))
+    BROADCAST_TOPICS_PATH = os.environ.get("BROADCAST_TOPICS_PATH", "")
+    HISTORY_TURNS = int(os.environ.get("HISTORY_TURNS", "20"))  # per conversation; 0 disables history
+    HISTORY_MAX_CONVERSATIONS = int(os.environ.get("HISTORY_MAX_CONVERSATIONS", "10000"))
+    HISTORY_WINDOW_TURNS = int(os.environ.get("HISTORY_WINDOW_TURNS", "6"))
+    HISTORY_WINDOW_CHARS = int(os.environ.get("HISTORY_WINDOW_CHARS", "4000"))
+    HISTORY_PATH = os.environ.get("HISTORY_PATH", "")
+    HISTORY_SNAPSHOT_SECONDS = float(os.environ.get("HISTORY_SNAPSHOT_SECONDS", "60"))
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")  # "text" or "json"
+    LOG_PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", "1000"))
+    LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", "0.1"))
+    LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+    # Compact AutoGen frame formats to offer, e.g. "msgpack,cbor" and "zstd,deflate"; empty means JSON only
+    WIRE_ENCODINGS = [name for name in os.environ.get("WIRE_ENCODINGS", "").split(",") if name]
+    WIRE_COMPRESSIONS = [name for name in os.environ.get("WIRE_COMPRESSIONS", "").split(",") if name]
+    WEBSOCKET_COMPRESSION = os.environ.get("WEBSOCKET_COMPRESSION", "deflate")  # permessage-deflate, or "none"
+    # Set per worker process by the prefork launcher and gunicorn.conf.py
+    WORKER_ID = os.environ.get("TRAVELBOT_WORKER_ID", "")
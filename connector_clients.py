@@ -0,0 +1,78 @@
+"""Bot Connector clients reused across turns instead of built per call"""
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from botbuilder.integration.aiohttp import ConfigurationBotFrameworkAuthentication
+from botframework.connector.aio import ConnectorClient
+from botframework.connector.auth import AuthenticationConstants, ClaimsIdentity, ConnectorFactory, UserTokenClient
+
+LOG = logging.getLogger(__name__)
+
+
+def claims_app_id(claims_identity: ClaimsIdentity) -> Optional[str]:
+    """The bot's app id from a turn's claims: the audience, or for the Emulator the appid claim"""
+    app_id = claims_identity.get_claim_value(AuthenticationConstants.AUDIENCE_CLAIM)
+    if app_id is None:
+        app_id = claims_identity.get_claim_value(AuthenticationConstants.APP_ID_CLAIM)
+    return app_id
+
+
+class _CachingConnectorFactory(ConnectorFactory):
+    def __init__(
+        self,
+        inner: ConnectorFactory,
+        app_id: Optional[str],
+        clients: "OrderedDict[Tuple[Optional[str], str, Optional[str]], ConnectorClient]",
+        max_clients: int
+    ):
+        self._inner = inner
+        self._app_id = app_id
+        self._clients = clients
+        self._max_clients = max_clients
+
+    async def create(self, service_url: str, audience: str = None) -> ConnectorClient:
+        key = (self._app_id, service_url, audience)
+        client = self._clients.get(key)
+        if client is not None:
+            self._clients.move_to_end(key)
+            return client
+        client = await self._inner.create(service_url, audience)
+        self._clients[key] = client
+        while len(self._clients) > self._max_clients:
+            self._clients.popitem(last=False)
+        return client
+
+
+class CachingBotFrameworkAuthentication(ConfigurationBotFrameworkAuthentication):
+    """Hands CloudAdapter the same Connector and user token clients on every turn.
+
+    CloudAdapter asks for a new ConnectorClient and UserTokenClient on every
+    turn and every ``continue_conversation``, and building each one costs
+    several milliseconds of CPU in msrest's configuration setup, which caps
+    proactive sends at under 100 a second per worker. The clients hold
+    no per-turn state, and their credentials cache and refresh tokens
+    themselves, so one per app id and service URL is enough.
+    """
+
+    def __init__(self, configuration, max_clients: int = 100, **kwargs):
+        super().__init__(configuration, **kwargs)
+        self.max_clients = max_clients
+        self._connector_clients: "OrderedDict[Tuple[Optional[str], str, Optional[str]], ConnectorClient]" = OrderedDict()
+        self._user_token_clients: Dict[Optional[str], UserTokenClient] = {}
+
+    def create_connector_factory(self, claims_identity: ClaimsIdentity) -> ConnectorFactory:
+        return _CachingConnectorFactory(
+            super().create_connector_factory(claims_identity),
+            claims_app_id(claims_identity),
+            self._connector_clients,
+            self.max_clients
+        )
+
+    async def create_user_token_client(self, claims_identity: ClaimsIdentity) -> UserTokenClient:
+        app_id = claims_app_id(claims_identity)
+        client = self._user_token_clients.get(app_id)
+        if client is None:
+            client = await super().create_user_token_client(claims_identity)
+            self._user_token_clients[app_id] = client
+        return client
@@ -0,0 +1,116 @@
+"""Bounded registry of conversation references keyed by conversation id"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from botbuilder.schema import ConversationReference
+
+from conversation_store import ConversationStore
+
+LOG = logging.getLogger(__name__)
+
+
+class ConversationRegistry:
+    """LRU/TTL bounded map of conversation id to ConversationReference.
+
+    Entries are kept in least-recently-used order, so the oldest entry is
+    always at the front. Expired entries are evicted from the front on every
+    write, which keeps lookups and inserts O(1) amortized and memory bounded
+    by ``max_size`` regardless of how many conversations have been seen.
+
+    With a shared ``store``, the registry acts as a per-worker cache in front
+    of it: ``save`` writes through and ``resolve`` falls back to the store
+    for conversations another worker registered.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl_seconds: float = 86400,
+        store: Optional[ConversationStore] = None
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[float, ConversationReference]]" = OrderedDict()
+
+    def add(self, reference: ConversationReference) -> Optional[str]:
+        """Store a reference under its conversation id and return that id"""
+        conversation_id = reference.conversation.id if reference.conversation else None
+        if not conversation_id:
+            LOG.warning("Conversation reference has no conversation id - not registered")
+            return None
+
+        self._entries[conversation_id] = (time.monotonic(), reference)
+        self._entries.move_to_end(conversation_id)
+        self._evict()
+        return conversation_id
+
+    def get(self, conversation_id: Optional[str]) -> Optional[ConversationReference]:
+        """Return the reference for a conversation id, or None if unknown or expired"""
+        if not conversation_id:
+            return None
+
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+
+        touched_at, reference = entry
+        now = time.monotonic()
+        if now - touched_at > self.ttl_seconds:
+            del self._entries[conversation_id]
+            return None
+
+        self._entries[conversation_id] = (now, reference)
+        self._entries.move_to_end(conversation_id)
+        return reference
+
+    async def save(self, reference: ConversationReference) -> Optional[str]:
+        """Register a reference locally and in the shared store"""
+        conversation_id = self.add(reference)
+        if conversation_id and self.store:
+            try:
+                await self.store.put(conversation_id, reference.serialize())
+            except Exception as e:
+                LOG.error(f"Failed to store conversation reference {conversation_id}: {str(e)}")
+        return conversation_id
+
+    async def resolve(self, conversation_id: Optional[str]) -> Optional[ConversationReference]:
+        """Look a conversation up locally, then in the shared store"""
+        reference = self.get(conversation_id)
+        if reference or not conversation_id or not self.store:
+            return reference
+
+        try:
+            data = await self.store.get(conversation_id)
+        except Exception as e:
+            LOG.error(f"Failed to load conversation reference {conversation_id}: {str(e)}")
+            return None
+        if not data:
+            return None
+
+        reference = ConversationReference().deserialize(data)
+        self.add(reference)
+        return reference
+
+    def remove(self, conversation_id: str):
+        self._entries.pop(conversation_id, None)
+
+    def _evict(self):
+        """Drop expired entries from the LRU end, then trim to max_size"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            oldest_id, (touched_at, _) = next(iter(self._entries.items()))
+            if touched_at >= cutoff:
+                break
+            del self._entries[oldest_id]
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return self.get(conversation_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,470 @@
+"""Shared conversation reference storage for multi-worker deployments"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from agent_message import dumps, loads
+
+LOG = logging.getLogger(__name__)
+
+
+class ConversationStore(ABC):
+    """Stores serialized conversation references so every worker can route replies.
+
+    A worker that receives an AutoGen reply may not be the one that handled
+    the user's message, so references are written through to a store shared
+    by all workers. Values are the dicts produced by
+    ``ConversationReference.serialize()``.
+
+    Other state a later request may need on a different worker is kept
+    alongside: JSON values with a TTL, such as "Show more" cursors and
+    broadcast reports, sets of strings, such as broadcast topics, and capped
+    lists with a TTL, such as conversation history.
+    """
+
+    # Whether every worker process sees the same data
+    shared = True
+
+    @abstractmethod
+    async def get(self, conversation_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def put(self, conversation_id: str, reference: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_value(self, key: str) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def put_value(self, key: str, value: Any, ttl_seconds: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def pop_value(self, key: str) -> Any:
+        """Get and delete a value in one step, so a single-use token is only used once"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_members(self, key: str, members: Iterable[str]) -> int:
+        """Add strings to a set and return its size"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove_members(self, key: str, members: Optional[Iterable[str]] = None) -> int:
+        """Remove strings from a set, or the whole set if none are given, and return its size"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_members(self, key: str) -> Set[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_members(self, prefix: str) -> Dict[str, int]:
+        """Sizes of the non-empty sets whose keys start with ``prefix``, keyed by the rest of the key"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def append_items(self, key: str, items: List[Any], max_items: int, ttl_seconds: float):
+        """Append JSON values to a list, keep its last ``max_items`` and restart its TTL"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def tail_items(self, key: str, count: int) -> List[Any]:
+        """The last ``count`` values of a list, oldest first"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryConversationStore(ConversationStore):
+    """In-process store with the same TTL semantics, for a single process only.
+
+    Nothing is shared between workers, so it is only useful with one worker
+    or in tests. The local stand-in for Redis with several workers on one
+    machine is ``SQLiteConversationStore``.
+    """
+
+    shared = False
+
+    def __init__(self, ttl_seconds: float = 86400, max_size: int = 100000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._values: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._sets: Dict[str, Set[str]] = {}
+        self._lists: "OrderedDict[str, Tuple[float, Deque[Any]]]" = OrderedDict()
+
+    def _live(self, entries: "OrderedDict[str, Tuple[float, Any]]", key: str) -> Any:
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() > expires_at:
+            del entries[key]
+            return None
+        return value
+
+    def _store(self, entries: "OrderedDict[str, Tuple[float, Any]]", key: str, value: Any, ttl_seconds: float):
+        entries[key] = (time.monotonic() + ttl_seconds, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    async def get(self, conversation_id: str) -> Optional[dict]:
+        return self._live(self._entries, conversation_id)
+
+    async def put(self, conversation_id: str, reference: dict):
+        self._store(self._entries, conversation_id, reference, self.ttl_seconds)
+
+    async def get_value(self, key: str) -> Any:
+        return self._live(self._values, key)
+
+    async def put_value(self, key: str, value: Any, ttl_seconds: float):
+        self._store(self._values, key, value, ttl_seconds)
+
+    async def pop_value(self, key: str) -> Any:
+        value = self._live(self._values, key)
+        self._values.pop(key, None)
+        return value
+
+    async def add_members(self, key: str, members: Iterable[str]) -> int:
+        existing = self._sets.setdefault(key, set())
+        existing.update(members)
+        return len(existing)
+
+    async def remove_members(self, key: str, members: Optional[Iterable[str]] = None) -> int:
+        if members is not None:
+            self._sets.get(key, set()).difference_update(members)
+        if members is None or not self._sets.get(key):
+            self._sets.pop(key, None)
+        return len(self._sets.get(key, ()))
+
+    async def get_members(self, key: str) -> Set[str]:
+        return set(self._sets.get(key, ()))
+
+    async def count_members(self, prefix: str) -> Dict[str, int]:
+        return {key[len(prefix):]: len(members) for key, members in self._sets.items() if key.startswith(prefix)}
+
+    async def append_items(self, key: str, items: List[Any], max_items: int, ttl_seconds: float):
+        values = self._live(self._lists, key)
+        if values is None or values.maxlen != max_items:
+            values = deque(values or (), maxlen=max_items)
+        values.extend(items)
+        self._store(self._lists, key, values, ttl_seconds)
+
+    async def tail_items(self, key: str, count: int) -> List[Any]:
+        values = self._live(self._lists, key)
+        return list(values)[-count:] if values and count > 0 else []
+
+
+class SQLiteConversationStore(ConversationStore):
+    """SQLite file shared by the workers on one machine.
+
+    Queries run in a worker thread to keep the event loop free, and the
+    database uses WAL mode so readers in other processes don't block writers.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86400):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "id TEXT PRIMARY KEY, reference TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS state_values ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS state_members ("
+                "key TEXT NOT NULL, member TEXT NOT NULL, PRIMARY KEY (key, member))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS state_items ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS state_items_key ON state_items (key, seq)")
+            self._db.execute("DELETE FROM conversations WHERE expires_at < ?", (time.time(),))
+            self._db.execute("DELETE FROM state_values WHERE expires_at < ?", (time.time(),))
+            self._db.execute("DELETE FROM state_items WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def _get(self, conversation_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT reference FROM conversations WHERE id = ? AND expires_at >= ?",
+                (conversation_id, time.time())
+            ).fetchone()
+        return loads(row[0]) if row else None
+
+    def _put(self, conversation_id: str, reference: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO conversations (id, reference, expires_at) VALUES (?, ?, ?)",
+                (conversation_id, dumps(reference), time.time() + self.ttl_seconds)
+            )
+            self._db.commit()
+
+    def _get_value(self, key: str) -> Any:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM state_values WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return loads(row[0]) if row else None
+
+    def _put_value(self, key: str, value: Any, ttl_seconds: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO state_values (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, dumps(value), time.time() + ttl_seconds)
+            )
+            self._db.commit()
+
+    def _pop_value(self, key: str) -> Any:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock first, so no other worker can pop the same key
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM state_values WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    self._db.execute("DELETE FROM state_values WHERE key = ?", (key,))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return loads(row[0]) if row and row[1] >= time.time() else None
+
+    def _add_members(self, key: str, members: Iterable[str]) -> int:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO state_members (key, member) VALUES (?, ?)",
+                [(key, member) for member in members]
+            )
+            self._db.commit()
+            return self._db.execute("SELECT COUNT(*) FROM state_members WHERE key = ?", (key,)).fetchone()[0]
+
+    def _remove_members(self, key: str, members: Optional[Iterable[str]]) -> int:
+        with self._lock:
+            if members is None:
+                self._db.execute("DELETE FROM state_members WHERE key = ?", (key,))
+            else:
+                self._db.executemany(
+                    "DELETE FROM state_members WHERE key = ? AND member = ?",
+                    [(key, member) for member in members]
+                )
+            self._db.commit()
+            return self._db.execute("SELECT COUNT(*) FROM state_members WHERE key = ?", (key,)).fetchone()[0]
+
+    def _get_members(self, key: str) -> Set[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT member FROM state_members WHERE key = ?", (key,)).fetchall()
+        return {row[0] for row in rows}
+
+    def _count_members(self, prefix: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, COUNT(*) FROM state_members WHERE substr(key, 1, ?) = ? GROUP BY key",
+                (len(prefix), prefix)
+            ).fetchall()
+        return {key[len(prefix):]: count for key, count in rows}
+
+    def _append_items(self, key: str, items: List[Any], max_items: int, ttl_seconds: float):
+        expires_at = time.time() + ttl_seconds
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO state_items (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, dumps(item), expires_at) for item in items]
+            )
+            self._db.execute("UPDATE state_items SET expires_at = ? WHERE key = ?", (expires_at, key))
+            self._db.execute(
+                "DELETE FROM state_items WHERE key = ? AND seq <= "
+                "(SELECT seq FROM state_items WHERE key = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (key, key, max_items)
+            )
+            self._db.commit()
+
+    def _tail_items(self, key: str, count: int) -> List[Any]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT value FROM state_items WHERE key = ? AND expires_at >= ? ORDER BY seq DESC LIMIT ?",
+                (key, time.time(), count)
+            ).fetchall()
+        return [loads(row[0]) for row in reversed(rows)]
+
+    async def get(self, conversation_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, conversation_id)
+
+    async def put(self, conversation_id: str, reference: dict):
+        await asyncio.to_thread(self._put, conversation_id, reference)
+
+    async def get_value(self, key: str) -> Any:
+        return await asyncio.to_thread(self._get_value, key)
+
+    async def put_value(self, key: str, value: Any, ttl_seconds: float):
+        await asyncio.to_thread(self._put_value, key, value, ttl_seconds)
+
+    async def pop_value(self, key: str) -> Any:
+        return await asyncio.to_thread(self._pop_value, key)
+
+    async def add_members(self, key: str, members: Iterable[str]) -> int:
+        return await asyncio.to_thread(self._add_members, key, list(members))
+
+    async def remove_members(self, key: str, members: Optional[Iterable[str]] = None) -> int:
+        return await asyncio.to_thread(self._remove_members, key, None if members is None else list(members))
+
+    async def get_members(self, key: str) -> Set[str]:
+        return await asyncio.to_thread(self._get_members, key)
+
+    async def count_members(self, prefix: str) -> Dict[str, int]:
+        return await asyncio.to_thread(self._count_members, prefix)
+
+    async def append_items(self, key: str, items: List[Any], max_items: int, ttl_seconds: float):
+        await asyncio.to_thread(self._append_items, key, items, max_items, ttl_seconds)
+
+    async def tail_items(self, key: str, count: int) -> List[Any]:
+        return await asyncio.to_thread(self._tail_items, key, count)
+
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisConversationStore(ConversationStore):
+    """Any Redis-compatible server, for workers spread across instances"""
+
+    def __init__(
+        self,
+        url: str,
+        ttl_seconds: float = 86400,
+        key_prefix: str = "travelbot:conversation:",
+        state_prefix: str = "travelbot:state:"
+    ):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise ValueError("The redis package is required for redis:// conversation stores") from e
+        self.ttl_seconds = int(ttl_seconds)
+        self.key_prefix = key_prefix
+        self.state_prefix = state_prefix
+        self._redis = redis.from_url(url)
+
+    async def get(self, conversation_id: str) -> Optional[dict]:
+        value = await self._redis.get(self.key_prefix + conversation_id)
+        return loads(value) if value else None
+
+    async def put(self, conversation_id: str, reference: dict):
+        await self._redis.set(self.key_prefix + conversation_id, dumps(reference), ex=self.ttl_seconds)
+
+    async def get_value(self, key: str) -> Any:
+        value = await self._redis.get(self.state_prefix + key)
+        return loads(value) if value else None
+
+    async def put_value(self, key: str, value: Any, ttl_seconds: float):
+        await self._redis.set(self.state_prefix + key, dumps(value), ex=max(1, int(ttl_seconds)))
+
+    async def pop_value(self, key: str) -> Any:
+        # GET and DEL in one MULTI transaction, which works before Redis 6.2's GETDEL
+        async with self._redis.pipeline(transaction=True) as pipe:
+            value, _ = await pipe.get(self.state_prefix + key).delete(self.state_prefix + key).execute()
+        return loads(value) if value else None
+
+    async def add_members(self, key: str, members: Iterable[str]) -> int:
+        members = list(members)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            if members:
+                pipe.sadd(self.state_prefix + key, *members)
+            results = await pipe.scard(self.state_prefix + key).execute()
+        return results[-1]
+
+    async def remove_members(self, key: str, members: Optional[Iterable[str]] = None) -> int:
+        if members is None:
+            await self._redis.delete(self.state_prefix + key)
+            return 0
+        members = list(members)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            if members:
+                pipe.srem(self.state_prefix + key, *members)
+            results = await pipe.scard(self.state_prefix + key).execute()
+        return results[-1]
+
+    async def get_members(self, key: str) -> Set[str]:
+        members = await self._redis.smembers(self.state_prefix + key)
+        return {member.decode("utf-8") if isinstance(member, bytes) else member for member in members}
+
+    async def count_members(self, prefix: str) -> Dict[str, int]:
+        counts = {}
+        full_prefix = self.state_prefix + prefix
+        async for key in self._redis.scan_iter(match=full_prefix + "*"):
+            key = key.decode("utf-8") if isinstance(key, bytes) else key
+            count = await self._redis.scard(key)
+            if count:
+                counts[key[len(full_prefix):]] = count
+        return counts
+
+    async def append_items(self, key: str, items: List[Any], max_items: int, ttl_seconds: float):
+        if not items:
+            return
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(self.state_prefix + key, *(dumps(item) for item in items))
+            pipe.ltrim(self.state_prefix + key, -max_items, -1)
+            pipe.expire(self.state_prefix + key, max(1, int(ttl_seconds)))
+            await pipe.execute()
+
+    async def tail_items(self, key: str, count: int) -> List[Any]:
+        if count <= 0:
+            return []
+        values = await self._redis.lrange(self.state_prefix + key, -count, -1)
+        return [loads(value) for value in values]
+
+    async def close(self):
+        await self._redis.close()
+
+
+def is_shared_store_url(url: str) -> bool:
+    """Whether a store URL gives every worker process the same references"""
+    return bool(url) and not url.startswith("memory://")
+
+
+def check_shared_store(url: str, workers: int):
+    """Refuse to run several workers without a shared store: each would only
+    know the conversations it received, and drop replies to all the others"""
+    if workers > 1 and not is_shared_store_url(url):
+        raise ValueError(
+            f"{workers} workers need a shared CONVERSATION_STORE_URL, e.g. "
+            f"sqlite:///data/conversations.db or redis://host:6379/0 (got {url!r})"
+        )
+
+
+def create_conversation_store(url: str, ttl_seconds: float = 86400) -> Optional[ConversationStore]:
+    """Build a store from a URL: memory://, sqlite:///path/to/file.db or redis://host:port/db.
+
+    An empty URL means no store; like memory://, that only works with a single worker.
+    """
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryConversationStore(ttl_seconds)
+    if url.startswith("sqlite:///"):
+        return SQLiteConversationStore(url[len("sqlite:///"):], ttl_seconds)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisConversationStore(url, ttl_seconds)
+    raise ValueError(f"Unsupported conversation store URL: {url}")
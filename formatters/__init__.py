@@ -0,0 +1,100 @@
+"""Registry of message formatters, imported lazily per agent type.
+
+Built-in formatters live in the modules listed in ``FORMATTER_MODULES`` and
+register themselves with ``@register_formatter`` when imported. Third-party
+packages can add agent types through the ``travelbot.formatters`` entry
+point group, where the entry point name is the agent type and the object is
+the formatter function. Nothing is imported until an agent type is first seen.
+
+Formatters for agent types whose replies can grow without bound may also
+register a block formatter with ``@register_block_formatter``: a generator
+yielding the reply a piece at a time, so long replies can be split into
+pages without building the whole text first.
+"""
+import importlib
+import logging
+from typing import Callable, Dict, Iterator, Optional
+
+LOG = logging.getLogger(__name__)
+
+Formatter = Callable[[dict], str]
+BlockFormatter = Callable[[dict], Iterator[str]]
+
+ENTRY_POINT_GROUP = "travelbot.formatters"
+
+FORMATTER_MODULES: Dict[str, str] = {
+    'activities_booking': 'formatters.activities',
+    'destination_info': 'formatters.destination',
+    'flight_booking': 'formatters.bookings',
+    'hotel_booking': 'formatters.bookings',
+    'car_rental': 'formatters.bookings',
+    'default_agent': 'formatters.chat',
+    'group_chat_manager': 'formatters.chat'
+}
+
+_REGISTRY: Dict[str, Formatter] = {}
+_BLOCK_REGISTRY: Dict[str, BlockFormatter] = {}
+_entry_points = None
+
+
+def register_formatter(agent_type: str) -> Callable[[Formatter], Formatter]:
+    """Decorator that registers a function as the formatter for an agent type"""
+    def decorator(func: Formatter) -> Formatter:
+        _REGISTRY[agent_type] = func
+        return func
+    return decorator
+
+
+def register_block_formatter(agent_type: str) -> Callable[[BlockFormatter], BlockFormatter]:
+    """Decorator that registers a generator of reply blocks for an agent type.
+
+    Joining the blocks with newlines should give the same text as the
+    agent type's formatter.
+    """
+    def decorator(func: BlockFormatter) -> BlockFormatter:
+        _BLOCK_REGISTRY[agent_type] = func
+        return func
+    return decorator
+
+
+def register_formatter_module(agent_type: str, module_name: str):
+    """Declare the module that provides an agent type, to be imported on first use"""
+    FORMATTER_MODULES[agent_type] = module_name
+
+
+def _load_entry_points() -> dict:
+    global _entry_points
+    if _entry_points is None:
+        from importlib.metadata import entry_points
+        _entry_points = {ep.name: ep for ep in entry_points(group=ENTRY_POINT_GROUP)}
+    return _entry_points
+
+
+def load_formatter(agent_type: str) -> Optional[Formatter]:
+    """Return the formatter for an agent type, importing its module if needed"""
+    formatter = _REGISTRY.get(agent_type)
+    if formatter:
+        return formatter
+
+    module_name = FORMATTER_MODULES.get(agent_type)
+    if module_name:
+        importlib.import_module(module_name)
+        return _REGISTRY.get(agent_type)
+
+    entry_point = _load_entry_points().get(agent_type)
+    if entry_point:
+        try:
+            formatter = entry_point.load()
+        except Exception as e:
+            LOG.error(f"Failed to load formatter entry point '{agent_type}': {str(e)}")
+            return None
+        _REGISTRY[agent_type] = formatter
+        return formatter
+    return None
+
+
+def load_block_formatter(agent_type: str) -> Optional[BlockFormatter]:
+    """Return the block formatter for an agent type, if its module registers one"""
+    if agent_type not in _BLOCK_REGISTRY:
+        load_formatter(agent_type)
+    return _BLOCK_REGISTRY.get(agent_type)
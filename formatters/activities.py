@@ -0,0 +1,30 @@
+"""Formatter for activities_booking messages"""
+from typing import Iterator
+
+from formatters import register_block_formatter, register_formatter
+
+
+@register_block_formatter('activities_booking')
+def iter_activities(data: dict) -> Iterator[str]:
+    """Yield the header, then a block per activity type heading and per activity"""
+    activities = data.get('data', {}).get('activities', [])
+    destination = data.get('data', {}).get('destination_city', '')
+
+    yield f"🎯 Exploring {destination}"
+
+    # Group activities by type
+    activity_types = {}
+    for activity in activities:
+        activity_types.setdefault(activity.get('activity_type', 'Other'), []).append(activity)
+
+    for type_name, type_activities in activity_types.items():
+        yield f"\n📍 {type_name}"
+        for activity in type_activities:
+            name = activity.get('activity_name', '')
+            desc = activity.get('activity_description', '')
+            yield f"• {name}\n  {desc}\n"
+
+
+@register_formatter('activities_booking')
+def format_activities(data: dict) -> str:
+    return "\n".join(iter_activities(data))
@@ -0,0 +1,49 @@
+"""Formatters for flight, hotel and car rental booking messages"""
+from formatters import register_formatter
+
+
+@register_formatter('flight_booking')
+def format_flight_booking(data: dict) -> str:
+    booking = data.get('data', {})
+    return "\n".join([
+        "✈️ Flight Booking Details",
+        f"From: {booking.get('departure_city', '')}",
+        f"To: {booking.get('destination_city', '')}",
+        f"Departure: {booking.get('departure_date', '')}",
+        f"Return: {booking.get('return_date', '')}",
+        f"Airline: {booking.get('airline', '')}",
+        f"Flight: {booking.get('flight_number', '')}",
+        f"Passengers: {booking.get('number_of_passengers', '')}",
+        f"Total Price: ${booking.get('total_price', ''):.2f}",
+        f"Booking Reference: {booking.get('booking_reference', '')}"
+    ])
+
+
+@register_formatter('hotel_booking')
+def format_hotel_booking(data: dict) -> str:
+    booking = data.get('data', {})
+    return "\n".join([
+        "🏨 Hotel Booking Details",
+        f"City: {booking.get('city', '')}",
+        f"Hotel: {booking.get('hotel_name', '')}",
+        f"Check-in: {booking.get('check_in_date', '')}",
+        f"Check-out: {booking.get('check_out_date', '')}",
+        f"Room Type: {booking.get('room_type', '')}",
+        f"Total Price: ${booking.get('total_price', ''):.2f}",
+        f"Booking Reference: {booking.get('booking_reference', '')}"
+    ])
+
+
+@register_formatter('car_rental')
+def format_car_rental(data: dict) -> str:
+    rental = data.get('data', {})
+    return "\n".join([
+        "🚗 Car Rental Details",
+        f"City: {rental.get('rental_city', '')}",
+        f"Pickup: {rental.get('rental_start_date', '')}",
+        f"Return: {rental.get('rental_end_date', '')}",
+        f"Vehicle Type: {rental.get('car_type', '')}",
+        f"Rental Company: {rental.get('company', '')}",
+        f"Total Price: ${rental.get('total_price', ''):.2f}",
+        f"Booking Reference: {rental.get('booking_reference', '')}"
+    ])
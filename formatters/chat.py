@@ -0,0 +1,15 @@
+"""Formatters for group chat and plain agent messages"""
+from formatters import register_formatter
+
+
+@register_formatter('group_chat_manager')
+def format_group_chat(data: dict) -> str:
+    chat = data.get('data', {})
+    return f"{chat.get('sender', 'Unknown')}: {chat.get('content', '')}"
+
+
+@register_formatter('default_agent')
+def format_default(data: dict) -> str:
+    if 'message' in data:
+        return data['message']
+    return str(data.get('data', ''))
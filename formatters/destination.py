@@ -0,0 +1,20 @@
+"""Formatter for destination_info messages"""
+from formatters import register_formatter
+
+
+@register_formatter('destination_info')
+def format_destination_info(data: dict) -> str:
+    info = data.get('data', {})
+    return "\n".join([
+        f"🌏 {info.get('city', '')}, {info.get('country', '')}\n",
+        "📝 Description:",
+        f"{info.get('description', '')}\n",
+        "⏰ Best Time to Visit:",
+        f"{info.get('best_time_to_visit', '')}\n",
+        "🌡️ Average Temperature:",
+        f"{info.get('average_temperature', '')}\n",
+        f"💰 Currency: {info.get('currency', '')}",
+        f"🗣️ Language: {info.get('language', '')}\n",
+        "✈️ Similar Destinations:",
+        ", ".join(info.get('similar_destinations', []))
+    ])
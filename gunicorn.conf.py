@@ -0,0 +1,36 @@
+"""Gunicorn settings for running the bot with several aiohttp workers.
+
+    gunicorn app:APP -c gunicorn.conf.py
+
+Each worker imports the app itself (no preload), so every worker owns its
+own Web PubSub connections. With more than one worker CONVERSATION_STORE_URL
+must name a shared store, so workers can route replies for conversations
+another worker received; gunicorn refuses to start otherwise.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count()))
+worker_class = "aiohttp.GunicornWebWorker"
+preload_app = False
+timeout = 120
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # Imported here, once gunicorn has put the app directory on sys.path
+    from conversation_store import check_shared_store
+
+    check_shared_store(os.environ.get("CONVERSATION_STORE_URL", ""), server.cfg.workers)
+
+
+def pre_fork(server, worker):
+    # Give each worker the lowest free slot number so a restarted worker
+    # reuses the slot (and WEBSOCKET_SPILL_DIR subdirectory) of the one it replaces
+    used = {getattr(w, "travelbot_id", None) for w in server.WORKERS.values()}
+    worker.travelbot_id = next(i for i in range(len(used) + 1) if i not in used)
+
+
+def post_fork(server, worker):
+    os.environ["TRAVELBOT_WORKER_ID"] = str(worker.travelbot_id)
@@ -0,0 +1,326 @@
+"""Recent turns of each conversation, attached to messages sent to AutoGen"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, List, Optional, Tuple
+
+from agent_message import AgentMessage, dumps, loads
+from conversation_store import ConversationStore
+
+LOG = logging.getLogger(__name__)
+
+USER = "user"
+AGENT = "agent"
+
+
+class Turn:
+    """One user message or agent reply.
+
+    Agent names and types repeat across every conversation, so they are
+    interned and each turn holds a reference to one shared string.
+    """
+
+    __slots__ = ("role", "agent", "agent_type", "text", "data", "stream_id", "at", "size")
+
+    def __init__(
+        self,
+        role: str,
+        text: Optional[str],
+        agent: Optional[str] = None,
+        agent_type: Optional[str] = None,
+        data: Any = None,
+        stream_id: Optional[str] = None,
+        at: Optional[float] = None,
+        size: Optional[int] = None
+    ):
+        self.role = USER if role == USER else AGENT
+        self.agent = sys.intern(agent) if agent else None
+        self.agent_type = sys.intern(agent_type) if agent_type else None
+        self.text = text
+        self.data = data
+        self.stream_id = stream_id
+        self.at = time.time() if at is None else at
+        if size is None:
+            self.measure()
+        else:
+            self.size = size
+
+    def measure(self):
+        """Characters the turn adds to a context window, worked out once rather than per window"""
+        self.size = len(self.text or "") + (len(dumps(self.data)) if self.data is not None else 0)
+
+    def as_dict(self) -> dict:
+        """The form sent to AutoGen; empty fields are left out"""
+        entry = {"role": self.role}
+        if self.agent:
+            entry["agent"] = self.agent
+            entry["agent_type"] = self.agent_type
+        if self.text:
+            entry["text"] = self.text
+        if self.data is not None:
+            entry["data"] = self.data
+        return entry
+
+    def as_row(self) -> list:
+        return [self.role, self.agent, self.agent_type, self.text, self.data, self.at, self.size]
+
+    @classmethod
+    def from_row(cls, row: list) -> "Turn":
+        # The saved size spares re-encoding every turn's data on startup
+        role, agent, agent_type, text, data, at, size = row
+        return cls(role, text, agent, agent_type, data, at=at, size=size)
+
+
+class _Conversation:
+    __slots__ = ("turns", "updated_at")
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.updated_at = time.time()
+
+
+class HistoryStore:
+    """Ring buffer of the last ``max_turns`` turns per conversation.
+
+    Conversations are kept in least-recently-updated order and bounded by
+    ``max_conversations`` and ``ttl_seconds``, like the conversation
+    registry. With a ``path``, the store is written atomically to that file
+    every ``snapshot_interval`` seconds while it has changes, and on
+    shutdown, and loaded again on startup.
+
+    With several workers, consecutive turns of a conversation reach
+    different workers, so a shared ``store`` is used instead: each finished
+    turn is appended to the conversation's capped list there, and the
+    window is read back from it. The chunks of a streamed reply all arrive
+    on one worker and are joined there until the final chunk.
+    """
+
+    KEY_PREFIX = "history:"
+
+    def __init__(
+        self,
+        max_turns: int = 20,
+        max_conversations: int = 10000,
+        ttl_seconds: float = 86400,
+        path: Optional[str] = None,
+        snapshot_interval: float = 60,
+        store: Optional[ConversationStore] = None
+    ):
+        self.max_turns = max_turns
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self.path = path if store is None else None
+        self.snapshot_interval = snapshot_interval
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        # Streamed replies still being received, when turns are kept in the shared store
+        self._streams: "OrderedDict[Tuple[str, str], Turn]" = OrderedDict()
+        self._dirty = False
+        self._snapshot_task: Optional[asyncio.Task] = None
+        if self.path:
+            self.load()
+
+    def _conversation(self, conversation_id: str) -> _Conversation:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            conversation = _Conversation(self.max_turns)
+            self._conversations[conversation_id] = conversation
+            self._evict()
+        else:
+            self._conversations.move_to_end(conversation_id)
+            conversation.updated_at = time.time()
+        self._dirty = True
+        return conversation
+
+    def _evict(self):
+        expired_before = time.time() - self.ttl_seconds
+        while self._conversations:
+            conversation = next(iter(self._conversations.values()))
+            if len(self._conversations) <= self.max_conversations and conversation.updated_at > expired_before:
+                break
+            self._conversations.popitem(last=False)
+
+    async def _append(self, conversation_id: str, turn: Turn):
+        if self.store is not None:
+            await self.store.append_items(
+                self.KEY_PREFIX + conversation_id, [turn.as_row()], self.max_turns, self.ttl_seconds
+            )
+        else:
+            self._conversation(conversation_id).turns.append(turn)
+
+    async def add_user(self, conversation_id: str, message: Any):
+        """Record a user message; card submits are kept as structured data"""
+        if isinstance(message, str):
+            turn = Turn(USER, message)
+        else:
+            turn = Turn(USER, None, data=message)
+        await self._append(conversation_id, turn)
+
+    async def add_agent(self, conversation_id: str, message: AgentMessage):
+        """Record an AutoGen reply; the chunks of a streamed reply are joined into one turn"""
+        text = message.payload.get("message")
+        text = text if isinstance(text, str) else None
+        if self.store is not None:
+            await self._add_shared_agent(conversation_id, message, text)
+            return
+        turns = self._conversation(conversation_id).turns
+        if message.stream_id and turns and turns[-1].stream_id == message.stream_id:
+            last = turns[-1]
+            if text:
+                last.text = (last.text or "") + text
+            if message.payload.get("data") is not None:
+                last.data = message.payload["data"]
+            if message.final:
+                last.stream_id = None
+                last.measure()
+            return
+        turns.append(Turn(
+            AGENT,
+            text,
+            message.agent,
+            message.agent_type,
+            message.payload.get("data"),
+            stream_id=None if message.final else message.stream_id
+        ))
+
+    async def _add_shared_agent(self, conversation_id: str, message: AgentMessage, text: Optional[str]):
+        if not message.stream_id:
+            await self._append(conversation_id, Turn(
+                AGENT, text, message.agent, message.agent_type, message.payload.get("data")
+            ))
+            return
+        key = (conversation_id, message.stream_id)
+        turn = self._streams.get(key)
+        if turn is None:
+            turn = Turn(AGENT, text, message.agent, message.agent_type, message.payload.get("data"))
+            self._streams[key] = turn
+            # Streams whose final chunk never arrives are dropped rather than kept forever
+            while len(self._streams) > self.max_conversations:
+                self._streams.popitem(last=False)
+        else:
+            if text:
+                turn.text = (turn.text or "") + text
+            if message.payload.get("data") is not None:
+                turn.data = message.payload["data"]
+        if message.final:
+            del self._streams[key]
+            turn.measure()
+            await self._append(conversation_id, turn)
+
+    async def add_agent_text(self, conversation_id: str, agent: Optional[str], text: str):
+        """Record a reply that didn't come from AutoGen, e.g. one served from the reply cache"""
+        await self._append(conversation_id, Turn(AGENT, text, agent))
+
+    async def window(self, conversation_id: str, max_turns: int = 6, max_chars: int = 4000) -> List[dict]:
+        """The most recent turns, oldest first, up to ``max_turns`` and
+        ``max_chars`` of text and JSON-encoded data"""
+        if self.store is not None:
+            rows = await self.store.tail_items(self.KEY_PREFIX + conversation_id, max_turns)
+            turns = [Turn.from_row(row) for row in rows]
+        else:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return []
+            turns = conversation.turns
+        window: List[dict] = []
+        chars = 0
+        for turn in reversed(turns):
+            if len(window) >= max_turns:
+                break
+            chars += turn.size
+            if chars > max_chars:
+                break
+            window.append(turn.as_dict())
+        window.reverse()
+        return window
+
+    def load(self):
+        """Restore the conversations saved by ``save`` that haven't expired"""
+        started = time.perf_counter()
+        try:
+            with open(self.path, "rb") as f:
+                saved = loads(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            LOG.warning(f"Could not load conversation history from {self.path}: {str(e)}")
+            return
+
+        expired_before = time.time() - self.ttl_seconds
+        # Saved oldest first, so the newest are kept when max_conversations is smaller
+        for conversation_id, updated_at, rows in saved[-self.max_conversations:]:
+            if updated_at <= expired_before:
+                continue
+            conversation = _Conversation(self.max_turns)
+            conversation.turns.extend(Turn.from_row(row) for row in rows)
+            conversation.updated_at = updated_at
+            self._conversations[conversation_id] = conversation
+        LOG.info(
+            f"Loaded history of {len(self._conversations)} conversations from {self.path} "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    def _capture(self) -> list:
+        """Copy each ring buffer, which is all that has to happen on the event loop"""
+        return [
+            (conversation_id, conversation.updated_at, tuple(conversation.turns))
+            for conversation_id, conversation in self._conversations.items()
+        ]
+
+    def _write(self, captured: list):
+        rows = [[conversation_id, updated_at, [turn.as_row() for turn in turns]]
+                for conversation_id, updated_at, turns in captured]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(dumps(rows))
+        os.replace(temporary_path, self.path)
+
+    def save(self):
+        """Write the store atomically, so a crash mid-write leaves the old file intact"""
+        if not self.path:
+            return
+        self._write(self._capture())
+        self._dirty = False
+
+    async def snapshot(self):
+        """Save in a worker thread, so a large store doesn't stall the event loop"""
+        if not self.path or not self._dirty:
+            return
+        captured = self._capture()
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._write, captured)
+        except OSError as e:
+            self._dirty = True
+            LOG.error(f"Could not save conversation history to {self.path}: {str(e)}")
+
+    def start(self):
+        """Start saving snapshots in the background"""
+        if self.path and self.snapshot_interval > 0 and self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            await self.snapshot()
+
+    async def close(self):
+        """Stop the snapshot task and save what changed since the last snapshot"""
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+        if self._dirty:
+            self.save()
+
+    def __len__(self) -> int:
+        return len(self._conversations)
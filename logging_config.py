@@ -0,0 +1,162 @@
+"""Non-blocking logging setup and sampled, truncated payload logging"""
+import atexit
+import logging
+import queue
+import random
+import reprlib
+import sys
+import time
+import zlib
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Union
+
+from agent_message import dumps
+
+# Set by configure_logging
+MAX_PAYLOAD_CHARS = 1000
+PAYLOAD_SAMPLE_RATE = 1.0
+
+_listener: Optional[QueueListener] = None
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra`` fields as top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return dumps(entry)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the listener thread, dropping them if its queue is full
+    rather than blocking the event loop"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _bounded_repr(limit: int) -> reprlib.Repr:
+    # Caps every level of a decoded payload, so rendering it costs about the
+    # same however large it is; str() would format the whole structure first
+    bounded = reprlib.Repr()
+    bounded.maxlevel = 4
+    bounded.maxdict = bounded.maxlist = bounded.maxtuple = bounded.maxset = 16
+    bounded.maxstring = bounded.maxother = max(limit // 4, 20)
+    return bounded
+
+
+def truncate(payload: Union[str, bytes, dict, list, None], limit: Optional[int] = None) -> str:
+    """Render at most ``limit`` characters of a payload, slicing before decoding"""
+    limit = MAX_PAYLOAD_CHARS if limit is None else limit
+    if isinstance(payload, (bytes, bytearray)):
+        text = bytes(payload[:limit]).decode("utf-8", errors="replace")
+        size = len(payload)
+    elif isinstance(payload, str):
+        text = payload[:limit]
+        size = len(payload)
+    else:
+        text = _bounded_repr(limit).repr(payload)
+        if len(text) > limit:
+            return f"{text[:limit]}... [truncated]"
+        return text
+    if size > limit:
+        return f"{text}... [{size} characters, truncated]"
+    return text
+
+
+def payload_sampled(conversation_id: Optional[str], sample_rate: Optional[float] = None) -> bool:
+    """Whether payloads of a conversation are logged.
+
+    The decision is a hash of the conversation id, so a sampled conversation
+    is logged in full and every worker makes the same choice. Payloads
+    without a conversation are sampled individually.
+    """
+    rate = PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    if not conversation_id:
+        return random.random() < rate
+    return zlib.crc32(conversation_id.encode("utf-8")) % 10000 < rate * 10000
+
+
+def log_payload(
+    logger: logging.Logger,
+    message: str,
+    payload: Union[str, bytes, dict, list, None],
+    conversation_id: Optional[str] = None,
+    level: int = logging.INFO,
+    sample_rate: Optional[float] = None
+):
+    """Log a message payload if the level is enabled and its conversation is sampled.
+
+    Both checks come before the payload is touched, so unlogged payloads
+    cost nothing however large they are.
+    """
+    if not logger.isEnabledFor(level) or not payload_sampled(conversation_id, sample_rate):
+        return
+    if conversation_id:
+        message = f"{message} [{conversation_id}]"
+    logger.log(level, f"{message}: {truncate(payload)}", extra={"conversation_id": conversation_id})
+
+
+def configure_logging(
+    level: str = "INFO",
+    json_format: bool = False,
+    max_payload_chars: int = 1000,
+    payload_sample_rate: float = 1.0,
+    queue_size: int = 10000
+) -> QueueListener:
+    """Route all logging through a bounded queue to a listener thread that writes to stderr"""
+    global MAX_PAYLOAD_CHARS, PAYLOAD_SAMPLE_RATE, _listener
+    MAX_PAYLOAD_CHARS = max_payload_chars
+    PAYLOAD_SAMPLE_RATE = payload_sample_rate
+
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if json_format:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(queue.Queue(maxsize=queue_size)))
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(root.handlers[0].queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,104 @@
+"""Concurrent, per-conversation ordered dispatch of AutoGen messages"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from metrics import MESSAGES_DROPPED
+
+LOG = logging.getLogger(__name__)
+
+
+class MessageDispatcher:
+    """Bounded asyncio worker pool that preserves order per conversation.
+
+    Each conversation gets its own lane. A lane is scheduled on the ready
+    queue at most once, so only one worker handles a given conversation at a
+    time while different conversations run in parallel. ``submit`` blocks once
+    ``max_pending`` messages are queued or in flight, which pushes back on the
+    WebSocket reader instead of buffering without limit.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable],
+        concurrency: int = 8,
+        max_pending: int = 1000,
+    ):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.queue_depth = 0
+        self.in_flight = 0
+        self._lanes: Dict[str, Deque[Any]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        if self._workers:
+            return
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"dispatch-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        LOG.info(f"Message dispatcher started with {self.concurrency} workers")
+
+    async def submit(self, conversation_id: Optional[str], item: Any):
+        """Queue an item behind earlier items of the same conversation"""
+        if not self._workers:
+            self.start()
+
+        await self._slots.acquire()
+        key = conversation_id or ""
+        self.queue_depth += 1
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            self._lanes[key] = deque([item])
+            self._ready.put_nowait(key)
+        else:
+            lane.append(item)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            item = lane.popleft()
+            self.queue_depth -= 1
+            self.in_flight += 1
+            try:
+                await self.handler(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                MESSAGES_DROPPED.inc(reason="dispatch_error")
+                LOG.error(f"Error dispatching message for conversation '{key}': {str(e)}")
+            finally:
+                self.in_flight -= 1
+                self._slots.release()
+                # Requeue at the back so busy conversations can't starve the others
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "active_conversations": len(self._lanes),
+            "concurrency": self.concurrency,
+        }
+
+    async def stop(self):
+        """Cancel the worker tasks; queued messages are discarded"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.queue_depth:
+            LOG.warning(f"Message dispatcher stopped with {self.queue_depth} queued messages")
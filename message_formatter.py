@@ -1,8 +1,19 @@
-from typing import Dict, Callable, Tuple
+from typing import Dict, Callable, Iterator, Optional, Tuple, TYPE_CHECKING
 import logging
+import time
+
+from formatters import load_block_formatter, load_formatter
+from metrics import FORMATTER_SECONDS
+
+if TYPE_CHECKING:
+    from agent_message import AgentMessage
 
 LOG = logging.getLogger(__name__)
 
+# Agent types without a formatter of their own share the default formatter and
+# this key in the timings and metric labels, which stay bounded however many
+# types the backend sends
+OTHER_AGENT_TYPE = "other"
 
 DEFAULT_ACTIONS = [
     {
@@ -23,125 +34,135 @@ DEFAULT_ACTIONS = [
     }
 ]
 
-class MessageFormatter:
-    """Handles formatting of different message types based on backend data structures"""
-    
+class FormatterTiming:
+    """Call counters for a single agent type's formatter"""
+
+    __slots__ = ("calls", "errors", "total_seconds", "max_seconds")
+
     def __init__(self):
-        self.formatters: Dict[str, Callable] = {
-            'activities_booking': self.format_activities,
-            'destination_info': self.format_destination_info,
-            'flight_booking': self.format_flight_booking,
-            'hotel_booking': self.format_hotel_booking,
-            'car_rental': self.format_car_rental,
-            'default_agent': self.format_default,
-            'group_chat_manager': self.format_group_chat
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float):
+        self.calls += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_seconds": self.total_seconds,
+            "avg_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+            "max_seconds": self.max_seconds
         }
 
-    def format_activities(self, data: dict) -> str:
-        activities = data.get('data', {}).get('activities', [])
-        destination = data.get('data', {}).get('destination_city', '')
-        
-        formatted_text = [f"🎯 Exploring {destination}"]
-        
-        # Group activities by type
-        activity_types = {}
-        for activity in activities:
-            activity_type = activity.get('activity_type', 'Other')
-            if activity_type not in activity_types:
-                activity_types[activity_type] = []
-            activity_types[activity_type].append(activity)
-        
-        for type_name, type_activities in activity_types.items():
-            formatted_text.append(f"\n📍 {type_name}")
-            for activity in type_activities:
-                name = activity.get('activity_name', '')
-                desc = activity.get('activity_description', '')
-                formatted_text.append(f"• {name}")
-                formatted_text.append(f"  {desc}\n")
-                
-        return "\n".join(formatted_text)
-
-    def format_destination_info(self, data: dict) -> str:
-        info = data.get('data', {})
-        return "\n".join([
-            f"🌏 {info.get('city', '')}, {info.get('country', '')}\n",
-            "📝 Description:",
-            f"{info.get('description', '')}\n",
-            "⏰ Best Time to Visit:",
-            f"{info.get('best_time_to_visit', '')}\n",
-            "🌡️ Average Temperature:",
-            f"{info.get('average_temperature', '')}\n",
-            f"💰 Currency: {info.get('currency', '')}",
-            f"🗣️ Language: {info.get('language', '')}\n",
-            "✈️ Similar Destinations:",
-            ", ".join(info.get('similar_destinations', []))
-        ])
-
-    def format_flight_booking(self, data: dict) -> str:
-        booking = data.get('data', {})
-        return "\n".join([
-            "✈️ Flight Booking Details",
-            f"From: {booking.get('departure_city', '')}",
-            f"To: {booking.get('destination_city', '')}",
-            f"Departure: {booking.get('departure_date', '')}",
-            f"Return: {booking.get('return_date', '')}",
-            f"Airline: {booking.get('airline', '')}",
-            f"Flight: {booking.get('flight_number', '')}",
-            f"Passengers: {booking.get('number_of_passengers', '')}",
-            f"Total Price: ${booking.get('total_price', ''):.2f}",
-            f"Booking Reference: {booking.get('booking_reference', '')}"
-        ])
-
-    def format_hotel_booking(self, data: dict) -> str:
-        booking = data.get('data', {})
-        return "\n".join([
-            "🏨 Hotel Booking Details",
-            f"City: {booking.get('city', '')}",
-            f"Hotel: {booking.get('hotel_name', '')}",
-            f"Check-in: {booking.get('check_in_date', '')}",
-            f"Check-out: {booking.get('check_out_date', '')}",
-            f"Room Type: {booking.get('room_type', '')}",
-            f"Total Price: ${booking.get('total_price', ''):.2f}",
-            f"Booking Reference: {booking.get('booking_reference', '')}"
-        ])
-
-    def format_car_rental(self, data: dict) -> str:
-        rental = data.get('data', {})
-        return "\n".join([
-            "🚗 Car Rental Details",
-            f"City: {rental.get('rental_city', '')}",
-            f"Pickup: {rental.get('rental_start_date', '')}",
-            f"Return: {rental.get('rental_end_date', '')}",
-            f"Vehicle Type: {rental.get('car_type', '')}",
-            f"Rental Company: {rental.get('company', '')}",
-            f"Total Price: ${rental.get('total_price', ''):.2f}",
-            f"Booking Reference: {rental.get('booking_reference', '')}"
-        ])
-
-    def format_group_chat(self, data: dict) -> str:
-        chat = data.get('data', {})
-        return f"{chat.get('sender', 'Unknown')}: {chat.get('content', '')}"
-
-    def format_default(self, data: dict) -> str:
-        if 'message' in data:
-            return data['message']
-        return str(data.get('data', ''))
+
+class MessageFormatter:
+    """Handles formatting of different message types based on backend data structures.
+
+    Formatters come from the ``formatters`` registry and are imported the
+    first time their agent type is seen; after that, dispatch is a single
+    lookup in ``self.formatters``. Unknown agent types are formatted and
+    timed as ``OTHER_AGENT_TYPE``.
+    """
     
-    def format_message(self, message_data: dict) -> Tuple[str, list]:
+    def __init__(self):
+        self.formatters: Dict[str, Callable[[dict], str]] = {}
+        self.block_formatters: Dict[str, Optional[Callable[[dict], Iterator[str]]]] = {}
+        self.timings: Dict[str, FormatterTiming] = {}
+
+    def resolve(self, agent_type: str) -> str:
+        """The key an agent type's formatter and timings are kept under,
+        loading its formatter on first use"""
+        if agent_type in self.formatters:
+            return agent_type
+        formatter = load_formatter(agent_type)
+        if formatter is None:
+            LOG.debug(f"No formatter registered for agent type '{agent_type}', using default")
+            if OTHER_AGENT_TYPE not in self.formatters:
+                LOG.warning(f"Formatting unknown agent types such as '{agent_type}' with the default formatter")
+                self.formatters[OTHER_AGENT_TYPE] = load_formatter('default_agent')
+                self.block_formatters[OTHER_AGENT_TYPE] = None
+                self.timings[OTHER_AGENT_TYPE] = FormatterTiming()
+            return OTHER_AGENT_TYPE
+        self.formatters[agent_type] = formatter
+        self.block_formatters[agent_type] = load_block_formatter(agent_type)
+        self.timings[agent_type] = FormatterTiming()
+        return agent_type
+
+    def get_formatter(self, agent_type: str) -> Callable[[dict], str]:
+        """Resolve the formatter for an agent type, loading it on first use"""
+        return self.formatters[self.resolve(agent_type)]
+
+    def format_message(self, message: "AgentMessage") -> Tuple[str, list]:
             """
             Format message and return both formatted text and suggested actions
             Returns tuple of (formatted_text, suggested_actions)
             """
+            key = OTHER_AGENT_TYPE
             try:
-                agent_type = message_data.get('agent_type', 'default_agent')
-                formatter = self.formatters.get(agent_type, self.format_default)
-                formatted_text = formatter(message_data)
-                
-                # Get suggested actions from message or use defaults
-                suggested_actions = message_data.get('suggested_actions', DEFAULT_ACTIONS)
+                key = self.resolve(message.agent_type)
+                formatter = self.formatters[key]
+                timing = self.timings[key]
+                started = time.perf_counter()
+                try:
+                    formatted_text = formatter(message.payload)
+                finally:
+                    elapsed = time.perf_counter() - started
+                    timing.record(elapsed)
+                    FORMATTER_SECONDS.observe(elapsed, agent_type=key)
                 
-                return formatted_text, suggested_actions
+                # Suggested actions from the message, or the defaults
+                return formatted_text, message.suggested_actions
                 
             except Exception as e:
+                if key in self.timings:
+                    self.timings[key].errors += 1
                 LOG.error(f"Error formatting message: {str(e)}")
-                return str(message_data), DEFAULT_ACTIONS
+                return str(message.payload), DEFAULT_ACTIONS
+
+    def format_blocks(self, message: "AgentMessage") -> Tuple[Iterator[str], list]:
+        """
+        Format message lazily, as blocks of text to be joined with newlines
+        Returns tuple of (blocks, suggested_actions)
+        """
+        key = self.resolve(message.agent_type)
+        block_formatter = self.block_formatters[key]
+        if block_formatter is None:
+            formatted_text, suggested_actions = self.format_message(message)
+            return iter((formatted_text,)), suggested_actions
+        return self._timed_blocks(message, key, block_formatter(message.payload)), message.suggested_actions
+
+    def _timed_blocks(self, message: "AgentMessage", key: str, blocks: Iterator[str]) -> Iterator[str]:
+        """Time a block formatter across all of its steps, and fall back to the
+        raw payload if it fails before producing anything"""
+        timing = self.timings[key]
+        elapsed = 0.0
+        produced = False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    block = next(blocks)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                produced = True
+                yield block
+        except Exception as e:
+            timing.errors += 1
+            LOG.error(f"Error formatting message: {str(e)}")
+            if not produced:
+                yield str(message.payload)
+        finally:
+            timing.record(elapsed)
+            FORMATTER_SECONDS.observe(elapsed, agent_type=key)
+
+    def stats(self) -> Dict[str, dict]:
+        """Per agent type formatter timings"""
+        return {agent_type: timing.as_dict() for agent_type, timing in self.timings.items()}
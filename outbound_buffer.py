@@ -0,0 +1,140 @@
+"""Bounded FIFO of outbound WebSocket frames with optional on-disk spill"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from metrics import MESSAGES_DROPPED
+
+LOG = logging.getLogger(__name__)
+
+
+class OutboundBuffer:
+    """Holds serialized frames until the WebSocket can take them.
+
+    Up to ``max_size`` frames are kept in memory. When ``spill_path`` is set,
+    frames that don't fit are appended to that file (one JSON string per
+    line) and read back in order once memory has drained; while the file has
+    unread frames, new frames go to the file too so ordering is preserved.
+    Frames still in the file when the process stops are sent after a restart.
+    Without a spill file, frames that don't fit are dropped.
+
+    Spilling happens during an outage, when frames pile up, so the file is
+    written and read in a worker thread. One lock orders the appends and
+    reads, and ``_unread`` counts only the lines already on disk.
+    """
+
+    def __init__(self, max_size: int = 1000, spill_path: Optional[str] = None):
+        self.max_size = max_size
+        self.spill_path = spill_path
+        self.dropped = 0
+        self._memory: Deque[str] = deque()
+        # Frames sent to the file, including appends still waiting for the lock
+        self._spilled = 0
+        self._unread = 0
+        self._read_offset = 0
+        self._not_empty = asyncio.Event()
+        self._spill_lock = asyncio.Lock()
+
+        if spill_path and os.path.exists(spill_path):
+            with open(spill_path, "r", encoding="utf-8") as spill:
+                self._spilled = self._unread = sum(1 for line in spill if line.strip())
+            if self._spilled:
+                LOG.info(f"Recovered {self._spilled} unsent frames from {spill_path}")
+                self._not_empty.set()
+
+    async def put(self, frame: str) -> bool:
+        """Queue a frame; returns False if it had to be dropped"""
+        if self._spilled or len(self._memory) >= self.max_size:
+            if not self.spill_path:
+                self.dropped += 1
+                MESSAGES_DROPPED.inc(reason="websocket_buffer_full")
+                LOG.error(f"Outbound buffer full ({self.max_size} frames), dropping message")
+                return False
+            # Counted before the write, so later frames queue behind this one
+            self._spilled += 1
+            self._not_empty.set()
+            try:
+                async with self._spill_lock:
+                    await asyncio.to_thread(self._append, json.dumps(frame) + "\n")
+                    self._unread += 1
+            except BaseException:
+                self._spilled -= 1
+                raise
+        else:
+            self._memory.append(frame)
+        self._not_empty.set()
+        return True
+
+    def _append(self, line: str):
+        with open(self.spill_path, "a", encoding="utf-8") as spill:
+            spill.write(line)
+
+    async def wait(self):
+        """Wait until there is at least one frame to send"""
+        await self._not_empty.wait()
+
+    async def peek(self) -> Optional[str]:
+        """Return the oldest frame without removing it"""
+        if not self._memory and self._spilled:
+            await self._load_spilled()
+        if not self._memory:
+            if not self._spilled:
+                self._not_empty.clear()
+            return None
+        return self._memory[0]
+
+    def pop(self):
+        """Remove the oldest frame once it has been sent"""
+        self._memory.popleft()
+        if not self._memory and not self._spilled:
+            self._not_empty.clear()
+
+    async def _load_spilled(self):
+        """Move the next batch of spilled frames back into memory"""
+        async with self._spill_lock:
+            count = min(self._unread, self.max_size - len(self._memory))
+            if count <= 0:
+                return
+            lines, self._read_offset, ended_early = await asyncio.to_thread(
+                self._read_lines, self._read_offset, count
+            )
+            for line in lines:
+                try:
+                    self._memory.append(json.loads(line))
+                except ValueError as e:
+                    # A torn write or a corrupted file loses that frame, not the rest
+                    self.dropped += 1
+                    MESSAGES_DROPPED.inc(reason="websocket_spill_corrupt")
+                    LOG.warning(f"Skipped an unreadable frame in spill file {self.spill_path}: {str(e)}")
+            read = len(lines)
+            if ended_early:
+                LOG.warning(f"Spill file {self.spill_path} ended early; {self._unread - read} frames lost")
+                read = self._unread
+            self._unread -= read
+            self._spilled -= read
+
+            if not self._spilled:
+                # Everything has been read back, so the file can start over
+                await asyncio.to_thread(self._truncate)
+                self._read_offset = 0
+
+    def _read_lines(self, offset: int, count: int) -> Tuple[List[str], int, bool]:
+        lines: List[str] = []
+        with open(self.spill_path, "r", encoding="utf-8") as spill:
+            spill.seek(offset)
+            while len(lines) < count:
+                line = spill.readline()
+                if not line:
+                    return lines, spill.tell(), True
+                if line.strip():
+                    lines.append(line)
+            return lines, spill.tell(), False
+
+    def _truncate(self):
+        open(self.spill_path, "w", encoding="utf-8").close()
+
+    def __len__(self) -> int:
+        return len(self._memory) + self._spilled
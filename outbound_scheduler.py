@@ -0,0 +1,279 @@
+"""Rate limited, coalescing scheduler for proactive Bot Connector sends"""
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from botbuilder.schema import Activity, ActivityTypes, AttachmentLayoutTypes, ConversationReference
+
+from metrics import CONNECTOR_CALL_SECONDS, CONNECTOR_ERRORS, MESSAGES_DROPPED
+
+LOG = logging.getLogger(__name__)
+
+# Sending an activity isn't idempotent: a 500, 502 or 504 may come after the
+# Connector delivered it, so only rejections that certainly didn't are retried
+RETRYABLE_STATUSES = {429, 503}
+
+
+def http_status(error: Exception) -> Optional[int]:
+    """HTTP status of a Connector error (msrest HttpOperationError), if any"""
+    response = getattr(error, "response", None)
+    return getattr(response, "status", None) or getattr(response, "status_code", None)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header, given either as seconds or an HTTP date"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket that refills at ``rate`` tokens per second up to ``capacity``"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Hold back all sends for ``seconds``, e.g. after a 429 with Retry-After"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class _OrderedCall:
+    """A Connector call queued behind a conversation's pending replies"""
+
+    __slots__ = ("func", "future")
+
+    def __init__(self, func: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.func = func
+        self.future = future
+
+
+class OutboundScheduler:
+    """Queues proactive replies per conversation and sends them under rate limits.
+
+    A reply to an idle conversation is sent at once. When several are queued,
+    the scheduler waits ``coalesce_window`` seconds for more and merges those
+    from the same agent into one activity. Every Connector call takes a token
+    from the global bucket and from the conversation's bucket. Throttled (429)
+    and unavailable (503) calls are retried, waiting for ``Retry-After`` when
+    the Connector sends one.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[ConversationReference, Activity], Awaitable[Optional[str]]],
+        coalesce_window: float = 0.1,
+        max_batch: int = 5,
+        global_rate: float = 50,
+        global_burst: float = 50,
+        conversation_rate: float = 2,
+        conversation_burst: float = 7,
+        max_retries: int = 8,
+        max_pending: int = 5000,
+        max_buckets: int = 10000
+    ):
+        self._send = send
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self.conversation_rate = conversation_rate
+        self.conversation_burst = conversation_burst
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self.max_buckets = max_buckets
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.pending = 0
+        self.dropped = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._queues: Dict[str, Deque[Activity]] = {}
+        self._references: Dict[str, ConversationReference] = {}
+        self._flushers: Dict[str, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def conversation_bucket(self, conversation_id: str) -> TokenBucket:
+        bucket = self._buckets.get(conversation_id)
+        if bucket is None:
+            bucket = TokenBucket(self.conversation_rate, self.conversation_burst)
+            self._buckets[conversation_id] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(conversation_id)
+        return bucket
+
+    async def send(self, conversation_reference: ConversationReference, activity: Activity):
+        """Queue an activity; blocks only while ``max_pending`` activities are queued"""
+        conversation_id = conversation_reference.conversation.id
+        await self._enqueue(conversation_id, activity)
+        self._references[conversation_id] = conversation_reference
+
+    async def call_in_order(self, conversation_id: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a Connector call in the conversation's queue, after the replies
+        already queued for it, and return its result; e.g. streamed reply updates"""
+        future = asyncio.get_running_loop().create_future()
+        await self._enqueue(conversation_id, _OrderedCall(func, future))
+        return await future
+
+    async def _enqueue(self, conversation_id: str, item: Any):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        await self._slots.acquire()
+        self.pending += 1
+        self._queues.setdefault(conversation_id, deque()).append(item)
+        if conversation_id not in self._flushers:
+            self._flushers[conversation_id] = asyncio.create_task(self._flush(conversation_id))
+
+    def _release(self, count: int = 1):
+        for _ in range(count):
+            self.pending -= 1
+            self._slots.release()
+
+    async def call(self, conversation_id: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run one Connector call under the rate limits, retrying throttled attempts"""
+        bucket = self.conversation_bucket(conversation_id)
+        attempt = 0
+        while True:
+            await self.global_bucket.acquire()
+            await bucket.acquire()
+            try:
+                with CONNECTOR_CALL_SECONDS.time():
+                    return await func()
+            except Exception as e:
+                status = http_status(e)
+                if status:
+                    CONNECTOR_ERRORS.inc(status_class=f"{status // 100}xx")
+                if status not in RETRYABLE_STATUSES or attempt >= self.max_retries:
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(30.0, 0.5 * 2 ** attempt)
+                if status == 429:
+                    bucket.pause(delay)
+                attempt += 1
+                LOG.warning(
+                    f"Connector returned {status} for conversation {conversation_id}; "
+                    f"retrying in {delay:.1f}s (attempt {attempt})"
+                )
+                await asyncio.sleep(delay)
+
+    async def _flush(self, conversation_id: str):
+        queue = self._queues[conversation_id]
+        try:
+            while queue:
+                if isinstance(queue[0], _OrderedCall):
+                    await self._run_ordered(conversation_id, queue.popleft())
+                    continue
+                # A lone reply goes out at once; a burst is given time to fill the batch
+                if self.coalesce_window and 1 < len(queue) < self.max_batch:
+                    await asyncio.sleep(self.coalesce_window)
+                batch = []
+                while queue and len(batch) < self.max_batch and not isinstance(queue[0], _OrderedCall):
+                    batch.append(queue.popleft())
+                reference = self._references[conversation_id]
+                for activity in coalesce(batch):
+                    try:
+                        await self.call(conversation_id, lambda: self._send(reference, activity))
+                    except Exception as e:
+                        self.dropped += 1
+                        MESSAGES_DROPPED.inc(reason="connector")
+                        LOG.error(f"Dropped reply for conversation {conversation_id}: {str(e)}")
+                self._release(len(batch))
+        finally:
+            # Callers still waiting on a queued call are woken up on shutdown
+            for item in queue:
+                if isinstance(item, _OrderedCall):
+                    item.future.cancel()
+            del self._flushers[conversation_id]
+            del self._queues[conversation_id]
+            self._references.pop(conversation_id, None)
+
+    async def _run_ordered(self, conversation_id: str, item: _OrderedCall):
+        try:
+            result = await self.call(conversation_id, item.func)
+        except asyncio.CancelledError:
+            item.future.cancel()
+            raise
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            if not item.future.done():
+                item.future.set_result(result)
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "dropped": self.dropped,
+            "active_conversations": len(self._flushers)
+        }
+
+    async def stop(self):
+        for task in list(self._flushers.values()):
+            task.cancel()
+        await asyncio.gather(*self._flushers.values(), return_exceptions=True)
+        if self.pending:
+            LOG.warning(f"Outbound scheduler stopped with {self.pending} unsent replies")
+
+
+def coalesce(activities: List[Activity]) -> List[Activity]:
+    """Merge consecutive card replies from the same agent into single activities.
+
+    The given activities are left as they are, since the reply cache or a
+    pagination cursor may hold them; merging builds a new activity.
+    """
+    merged: List[Activity] = []
+    for activity in activities:
+        previous = merged[-1] if merged else None
+        if (
+            previous is not None
+            and previous.type == activity.type == ActivityTypes.message
+            and previous.attachments and activity.attachments
+            and not previous.text and not activity.text
+            and previous.from_property and activity.from_property
+            and previous.from_property.id == activity.from_property.id
+        ):
+            combined = copy.copy(previous)
+            combined.attachments = previous.attachments + activity.attachments
+            # A shared layout is kept, e.g. two carousels make one carousel
+            if previous.attachment_layout != activity.attachment_layout:
+                combined.attachment_layout = AttachmentLayoutTypes.list
+            merged[-1] = combined
+        else:
+            merged.append(activity)
+    return merged
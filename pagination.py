@@ -0,0 +1,192 @@
+"""Splitting long agent replies into size-bounded pages behind "Show more" cursors"""
+import itertools
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from botbuilder.schema import Activity, AttachmentLayoutTypes
+
+from card_templates import render_card, reply_activity
+from conversation_store import ConversationStore
+
+LOG = logging.getLogger(__name__)
+
+SHOW_MORE_ACTION = "show_more"
+
+# Teams renders at most 10 cards in a carousel
+MAX_CAROUSEL_CARDS = 10
+
+
+def _utf8_size(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def split_block(block: str, max_bytes: int) -> Iterator[str]:
+    """Split a block that doesn't fit on a page at line breaks, and a line
+    that doesn't fit at character boundaries"""
+    if _utf8_size(block) <= max_bytes:
+        yield block
+        return
+    piece: List[str] = []
+    size = 0
+    for line in block.split("\n"):
+        line_size = _utf8_size(line) + (1 if piece else 0)
+        if piece and size + line_size > max_bytes:
+            yield "\n".join(piece)
+            piece, size = [], 0
+            line_size -= 1
+        if line_size > max_bytes:
+            encoded = line.encode("utf-8")
+            start = 0
+            while start < len(encoded):
+                end = min(start + max_bytes, len(encoded))
+                # Back off to the start of a multi-byte character
+                while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+                    end -= 1
+                yield encoded[start:end].decode("utf-8")
+                start = end
+            continue
+        piece.append(line)
+        size += line_size
+    if piece:
+        yield "\n".join(piece)
+
+
+def paginate(blocks: Iterable[str], max_bytes: int) -> Iterator[str]:
+    """Join blocks with newlines into pages of at most ``max_bytes`` of UTF-8.
+
+    Blocks are consumed one page at a time, so a reply that fits on one page
+    gives exactly the text of its formatter, and later pages of a long reply
+    aren't built until they are asked for.
+    """
+    page: List[str] = []
+    size = 0
+    for block in blocks:
+        for piece in split_block(block, max_bytes):
+            piece_size = _utf8_size(piece) + (1 if page else 0)
+            if page and size + piece_size > max_bytes:
+                yield "\n".join(page)
+                page, size = [], 0
+                piece = piece.lstrip("\n")
+                piece_size = _utf8_size(piece)
+            page.append(piece)
+            size += piece_size
+    if page:
+        yield "\n".join(page)
+
+
+class _Cursor:
+    __slots__ = ("expires_at", "pages", "agent", "actions")
+
+    def __init__(self, expires_at: float, pages: Iterator[str], agent: str, actions: list):
+        self.expires_at = expires_at
+        self.pages = pages
+        self.agent = agent
+        self.actions = actions
+
+
+class ReplyPaginator:
+    """Builds reply activities under the channel's size limit.
+
+    The first activity carries one page, or with ``layout="carousel"`` as
+    many pages as fit in ``max_activity_bytes``, each as its own card. If the
+    reply goes on, the remaining pages stay behind a cursor held here, and
+    the last card gets a "Show more" button that submits
+    ``{"action": "show_more", "cursor": ...}``. Cursors are single use and
+    expire after ``ttl_seconds``.
+
+    Without a ``store``, cursors are held in this process, the rest of the
+    reply is only paginated when asked for, and the least recently created
+    cursors are dropped beyond ``max_cursors``. With a shared ``store``, the
+    remaining pages are saved there under the cursor, so whichever worker
+    receives the "Show more" click can answer it.
+    """
+
+    def __init__(
+        self,
+        max_page_bytes: int = 8000,
+        layout: str = "list",
+        max_activity_bytes: int = 24000,
+        max_cursors: int = 1000,
+        ttl_seconds: float = 3600,
+        store: Optional[ConversationStore] = None
+    ):
+        self.max_page_bytes = max_page_bytes
+        self.layout = layout
+        self.max_activity_bytes = max_activity_bytes
+        self.max_cursors = max_cursors
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._cursors: "OrderedDict[str, _Cursor]" = OrderedDict()
+
+    async def build(self, agent: str, blocks: Iterable[str], actions: list) -> Tuple[Activity, bool]:
+        """The first activity of a reply, and whether more pages are waiting behind a cursor"""
+        return await self._activity(paginate(blocks, self.max_page_bytes), agent, actions)
+
+    async def next_page(self, cursor: str) -> Optional[Activity]:
+        """The activity for the pages after a "Show more", or None if the cursor expired"""
+        if self.store is not None:
+            saved = await self.store.pop_value(f"page-cursor:{cursor}")
+            if not isinstance(saved, dict):
+                return None
+            entry = _Cursor(0, iter(saved["pages"]), saved["agent"], saved["actions"])
+        else:
+            self._evict()
+            entry = self._cursors.pop(cursor, None)
+            if entry is None:
+                return None
+        activity, _ = await self._activity(entry.pages, entry.agent, entry.actions)
+        return activity
+
+    async def _activity(self, pages: Iterator[str], agent: str, actions: list) -> Tuple[Activity, bool]:
+        texts, rest = self._take(pages)
+        if rest is not None:
+            cursor = await self._store(rest, agent, actions)
+            last_actions = [{"title": "Show more", "value": {"action": SHOW_MORE_ACTION, "cursor": cursor}}] + actions
+        else:
+            last_actions = actions
+        cards = [render_card(text, []) for text in texts[:-1]]
+        cards.append(render_card(texts[-1], last_actions))
+        layout = AttachmentLayoutTypes.carousel if len(cards) > 1 else None
+        return reply_activity(agent, cards, layout), rest is not None
+
+    def _take(self, pages: Iterator[str]) -> Tuple[List[str], Optional[Iterator[str]]]:
+        """Pages for one activity, and an iterator over the rest if there are any"""
+        first = next(pages, "")
+        texts = [first]
+        size = _utf8_size(first)
+        max_cards = MAX_CAROUSEL_CARDS if self.layout == "carousel" else 1
+        for page in pages:
+            page_size = _utf8_size(page)
+            if len(texts) >= max_cards or size + page_size > self.max_activity_bytes:
+                return texts, itertools.chain((page,), pages)
+            texts.append(page)
+            size += page_size
+        return texts, None
+
+    async def _store(self, pages: Iterator[str], agent: str, actions: list) -> str:
+        cursor = secrets.token_urlsafe(12)
+        if self.store is not None:
+            # Another worker may serve the next page, so the rest is paginated now
+            saved = {"pages": list(pages), "agent": agent, "actions": actions}
+            await self.store.put_value(f"page-cursor:{cursor}", saved, self.ttl_seconds)
+            return cursor
+        self._evict()
+        self._cursors[cursor] = _Cursor(time.monotonic() + self.ttl_seconds, pages, agent, actions)
+        while len(self._cursors) > self.max_cursors:
+            self._cursors.popitem(last=False)
+        return cursor
+
+    def _evict(self):
+        # Cursors share one TTL, so the oldest is always at the front
+        now = time.monotonic()
+        while self._cursors:
+            entry = next(iter(self._cursors.values()))
+            if entry.expires_at > now:
+                break
+            self._cursors.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._cursors)
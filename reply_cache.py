@@ -0,0 +1,174 @@
+"""Cache of finished replies to common prompts, answered without a round trip to AutoGen"""
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from botbuilder.schema import Activity
+
+from agent_message import dumps, loads
+from message_formatter import DEFAULT_ACTIONS
+from metrics import REPLY_CACHE_REQUESTS
+
+LOG = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+# Replies of these agent types answer the prompt alone, so they can be served
+# to other conversations; bookings and chat carry the user's own details
+SHAREABLE_AGENT_TYPES = frozenset({"destination_info"})
+
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase and drop punctuation and extra whitespace, so trivially different prompts match"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub("", text.replace("'", ""))).strip().lower()
+
+
+class _Collection:
+    __slots__ = ("key", "deadline", "activities")
+
+    def __init__(self, key: str, deadline: float):
+        self.key = key
+        self.deadline = deadline
+        self.activities: List[dict] = []
+
+
+class ReplyCache:
+    """LRU/TTL cache of the reply cards AutoGen sent for a prompt.
+
+    When a cacheable prompt goes to AutoGen, the reply activities sent to
+    that conversation are collected until the user's next message or
+    ``collect_seconds``, whichever comes first, and then stored under the
+    prompt. Later requests for the same prompt are answered from the cache.
+    By default only the ``DEFAULT_ACTIONS`` prompts are cacheable.
+
+    AutoGen sees the conversation's recent turns, so a prompt is only
+    cacheable when it is sent without any (``history``), and a reply is
+    only kept if every activity came from one of ``agent_types``. Anything
+    else may carry the user's own details and is never served to another
+    conversation.
+    """
+
+    DEFAULT_PROMPTS = tuple(action["value"] for action in DEFAULT_ACTIONS)
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600,
+        collect_seconds: float = 30,
+        path: Optional[str] = None,
+        prompts: Optional[Iterable[str]] = DEFAULT_PROMPTS,
+        agent_types: Iterable[str] = SHAREABLE_AGENT_TYPES
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collect_seconds = collect_seconds
+        self.path = path
+        # None makes every prompt cacheable
+        self.prompts = {normalize_prompt(prompt) for prompt in prompts} if prompts is not None else None
+        self.agent_types = frozenset(agent_types)
+        # Wall-clock expiry so persisted entries stay valid across restarts
+        self._entries: "OrderedDict[str, Tuple[float, List[dict]]]" = OrderedDict()
+        self._collecting: "OrderedDict[str, _Collection]" = OrderedDict()
+        if path:
+            self.load()
+
+    def key(self, prompt, destination: str = "", history: Optional[list] = None) -> Optional[str]:
+        """Cache key for a prompt, or None if it isn't cacheable"""
+        if history or not isinstance(prompt, str):
+            return None
+        normalized = normalize_prompt(prompt)
+        if not normalized or (self.prompts is not None and normalized not in self.prompts):
+            return None
+        return f"{normalized}|{normalize_prompt(destination)}" if destination else normalized
+
+    def get(self, key: str) -> Optional[List[Activity]]:
+        """The cached reply activities for a key, as fresh Activity objects"""
+        self._finish_expired()
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._entries[key]
+            REPLY_CACHE_REQUESTS.inc(result="miss")
+            return None
+        self._entries.move_to_end(key)
+        REPLY_CACHE_REQUESTS.inc(result="hit")
+        return [Activity().deserialize(activity) for activity in entry[1]]
+
+    def begin(self, conversation_id: str, key: str):
+        """Start collecting the replies to a prompt that missed the cache"""
+        self.finish(conversation_id)
+        self._collecting[conversation_id] = _Collection(key, time.monotonic() + self.collect_seconds)
+
+    def record(self, conversation_id: Optional[str], activity: Activity, agent_type: str = "default_agent"):
+        """Add a reply activity to the conversation's collection, if one is open"""
+        collection = self._collecting.get(conversation_id)
+        if collection is None or time.monotonic() >= collection.deadline:
+            return
+        if agent_type not in self.agent_types:
+            # Part of the reply is specific to this user, so none of it is kept
+            self.discard(conversation_id)
+            return
+        collection.activities.append(activity.serialize())
+
+    def discard(self, conversation_id: Optional[str]):
+        """Stop collecting without storing, e.g. for replies that can't be replayed"""
+        self._collecting.pop(conversation_id, None)
+
+    def finish(self, conversation_id: str):
+        """Store whatever was collected for the conversation's last prompt"""
+        collection = self._collecting.pop(conversation_id, None)
+        if collection is not None and collection.activities:
+            self._store(collection.key, collection.activities)
+
+    def _finish_expired(self):
+        # Collections share one window length, so the oldest is always at the front
+        now = time.monotonic()
+        while self._collecting:
+            conversation_id, collection = next(iter(self._collecting.items()))
+            if collection.deadline > now:
+                break
+            self.finish(conversation_id)
+
+    def _store(self, key: str, activities: List[dict]):
+        self._entries[key] = (time.time() + self.ttl_seconds, activities)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def load(self):
+        """Restore unexpired entries saved by ``save``"""
+        try:
+            with open(self.path, "rb") as f:
+                saved = loads(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            LOG.warning(f"Could not load reply cache from {self.path}: {str(e)}")
+            return
+
+        now = time.time()
+        for key, expires_at, activities in saved:
+            if expires_at > now:
+                self._entries[key] = (expires_at, activities)
+        LOG.info(f"Loaded {len(self._entries)} cached replies from {self.path}")
+
+    def save(self):
+        """Write the cache atomically, so a crash mid-write leaves the old file intact"""
+        if not self.path:
+            return
+        self._finish_expired()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(dumps([[key, expires_at, activities] for key, (expires_at, activities) in self._entries.items()]))
+        os.replace(temporary_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,155 @@
+"""Incremental rendering of streamed AutoGen replies"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Optional
+
+from botbuilder.schema import ConversationReference
+
+from agent_message import AgentMessage
+
+if TYPE_CHECKING:
+    from bot_handler import BotHandler
+
+LOG = logging.getLogger(__name__)
+
+
+class ReplyStream:
+    """State of one reply that is being streamed into a single activity"""
+
+    __slots__ = (
+        "stream_id", "conversation_reference", "message", "parts",
+        "activity_id", "last_update", "flush_task", "lock", "updates"
+    )
+
+    def __init__(self, message: AgentMessage, conversation_reference: ConversationReference):
+        self.stream_id = message.stream_id
+        self.conversation_reference = conversation_reference
+        self.message = message
+        self.parts: List[str] = []
+        self.activity_id: Optional[str] = None
+        self.last_update = 0.0
+        self.flush_task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.updates = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class ReplyStreamManager:
+    """Posts the first chunk of a streamed reply, then updates it in place.
+
+    Chunk frames carry a ``stream_id`` and a text delta in ``message``.
+    Updates are throttled to one per ``update_interval`` seconds; chunks that
+    arrive in between are folded into a single delayed update. The frame with
+    ``final: true`` renders the finished reply (through the agent type's
+    formatter when it carries ``data``) together with its suggested actions.
+    """
+
+    def __init__(
+        self,
+        bot_handler: "BotHandler",
+        update_interval: float = 1.5,
+        max_streams: int = 1000,
+        idle_timeout: float = 300
+    ):
+        self.bot_handler = bot_handler
+        self.update_interval = update_interval
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self.streams: "OrderedDict[str, ReplyStream]" = OrderedDict()
+
+    async def handle_chunk(self, message: AgentMessage, conversation_reference: ConversationReference):
+        stream = self.streams.get(message.stream_id)
+        if stream is None:
+            self._evict_idle()
+            stream = ReplyStream(message, conversation_reference)
+            self.streams[message.stream_id] = stream
+        else:
+            self.streams.move_to_end(message.stream_id)
+
+        stream.message = message
+        delta = message.payload.get("message")
+        if isinstance(delta, str):
+            stream.parts.append(delta)
+
+        if message.final:
+            del self.streams[message.stream_id]
+            if stream.flush_task:
+                stream.flush_task.cancel()
+            await self._finish(stream)
+        elif not stream.updates or time.monotonic() - stream.last_update >= self.update_interval:
+            await self._render(stream)
+        elif stream.flush_task is None:
+            delay = stream.last_update + self.update_interval - time.monotonic()
+            stream.flush_task = asyncio.create_task(self._flush_later(stream, delay))
+
+    async def _flush_later(self, stream: ReplyStream, delay: float):
+        await asyncio.sleep(delay)
+        stream.flush_task = None
+        try:
+            await self._render(stream)
+        except Exception as e:
+            LOG.error(f"Error updating streamed reply {stream.stream_id}: {str(e)}")
+
+    async def _render(self, stream: ReplyStream, final: bool = False):
+        """Post the reply on the first call, update it in place afterwards"""
+        async with stream.lock:
+            if final:
+                formatted_text, suggested_actions = self._final_content(stream)
+            else:
+                formatted_text, suggested_actions = stream.text, []
+            activity = self.bot_handler.build_reply_activity(stream.message, formatted_text, suggested_actions)
+
+            reference = stream.conversation_reference
+            # Through the conversation's queue, so a chunk never overtakes a reply queued before it
+            outbound = self.bot_handler.outbound
+            if not stream.updates or (final and stream.activity_id is None):
+                stream.activity_id = await outbound.call_in_order(
+                    reference.conversation.id,
+                    lambda: self.bot_handler.send_to_conversation(reference, activity)
+                )
+            elif stream.activity_id is None:
+                # The channel gave no id for the first post, so it can't be updated in place
+                return
+            else:
+                activity.id = stream.activity_id
+                await outbound.call_in_order(
+                    reference.conversation.id,
+                    lambda: self.bot_handler.update_in_conversation(reference, activity)
+                )
+            stream.last_update = time.monotonic()
+            stream.updates += 1
+
+    async def _finish(self, stream: ReplyStream):
+        if stream.activity_id is None and stream.updates:
+            LOG.warning(f"Streamed reply {stream.stream_id} has no activity id; sending final reply separately")
+        await self._render(stream, final=True)
+        LOG.debug(f"Streamed reply {stream.stream_id} finished after {stream.updates} Connector calls")
+
+    def _final_content(self, stream: ReplyStream):
+        message = stream.message
+        if "data" in message.payload:
+            return self.bot_handler.message_formatter.format_message(message)
+        return stream.text, message.suggested_actions
+
+    def _evict_idle(self):
+        """Drop streams whose final frame never arrived"""
+        cutoff = time.monotonic() - self.idle_timeout
+        # Streams are kept in order of their latest chunk, so idle ones are at the front
+        while self.streams:
+            stream_id, stream = next(iter(self.streams.items()))
+            if stream.last_update >= cutoff:
+                break
+            self._drop(stream_id)
+        while len(self.streams) >= self.max_streams:
+            self._drop(next(iter(self.streams)))
+
+    def _drop(self, stream_id: str):
+        stream = self.streams.pop(stream_id)
+        if stream.flush_task:
+            stream.flush_task.cancel()
+        LOG.warning(f"Dropping unfinished streamed reply {stream_id}")
@@ -0,0 +1,220 @@
+"""The bot's adapter, handlers, caches and AutoGen connection.
+
+Importing this module pulls in botbuilder and the rest of the message
+pipeline, which is most of the process's startup time, so ``app`` imports it
+in the background once the server is listening.
+"""
+import asyncio
+import logging
+import os
+import sys
+import traceback
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from botbuilder.core import TurnContext
+from botbuilder.integration.aiohttp import CloudAdapter
+from botbuilder.schema import Activity, ActivityTypes
+
+from bot import MyBot
+from bot_handler import BotHandler
+from broadcast import BroadcastApi, Broadcaster, TopicRegistry
+from config import DefaultConfig
+from connector_clients import CachingBotFrameworkAuthentication
+from conversation_store import create_conversation_store
+from history_store import HistoryStore
+from metrics import REGISTRY
+from reply_cache import ReplyCache
+from websocket_handler import WebSocketHandler
+
+LOG = logging.getLogger(__name__)
+
+
+# Catch-all for errors
+async def on_error(context: TurnContext, error: Exception):
+    print(f"\n [on_turn_error] unhandled error: {error}", file=sys.stderr)
+    traceback.print_exc()
+
+    await context.send_activity("The bot encountered an error or bug.")
+    await context.send_activity(
+        "To continue to run this bot, please fix the bot source code."
+    )
+
+    if context.activity.channel_id == "emulator":
+        trace_activity = Activity(
+            label="TurnError",
+            name="on_turn_error Trace",
+            timestamp=datetime.utcnow(),
+            type=ActivityTypes.trace,
+            value=f"{error}",
+            value_type="https://www.botframework.com/schemas/error",
+        )
+        await context.send_activity(trace_activity)
+
+
+class BotRuntime:
+    """Everything behind the HTTP routes, built from the configuration.
+
+    The constructor makes no network connection and doesn't need the event
+    loop, so ``app`` runs it in a worker thread. ``start`` then runs on the
+    loop and opens the AutoGen connections; a missing connection string shows
+    up there as a failed connect and an unready ``/ready``.
+    """
+
+    def __init__(self, config: DefaultConfig):
+        # Create adapter
+        self.adapter = CloudAdapter(CachingBotFrameworkAuthentication(config))
+        self.adapter.on_turn_error = on_error
+
+        # Create the Bot
+        self.bot = MyBot()
+        app_id = config.APP_ID if config.APP_ID else uuid.uuid4()
+
+        # Conversation references shared between worker processes
+        self.conversation_store = create_conversation_store(config.CONVERSATION_STORE_URL, config.CONVERSATION_TTL_SECONDS)
+
+        # Each worker keeps its own spill files so they survive restarts without clashing
+        spill_dir = config.WEBSOCKET_SPILL_DIR
+        if spill_dir and config.WORKER_ID:
+            spill_dir = os.path.join(spill_dir, f"worker-{config.WORKER_ID}")
+
+        # Replies to the suggested-action prompts, shared by MyBot and BotHandler
+        self.reply_cache: Optional[ReplyCache] = None
+        if config.REPLY_CACHE_SIZE > 0:
+            reply_cache_path = config.REPLY_CACHE_PATH
+            if reply_cache_path and config.WORKER_ID:
+                reply_cache_path = f"{reply_cache_path}.worker-{config.WORKER_ID}"
+            self.reply_cache = ReplyCache(
+                config.REPLY_CACHE_SIZE,
+                config.REPLY_CACHE_TTL_SECONDS,
+                path=reply_cache_path or None,
+                prompts=None if config.REPLY_CACHE_ALL_PROMPTS else ReplyCache.DEFAULT_PROMPTS,
+                agent_types=config.REPLY_CACHE_AGENT_TYPES,
+            )
+            self.bot.set_reply_cache(self.reply_cache)
+
+        self.bot_handler = BotHandler(
+            self.adapter,
+            app_id,
+            self.bot,
+            max_conversations=config.CONVERSATION_CACHE_SIZE,
+            conversation_ttl_seconds=config.CONVERSATION_TTL_SECONDS,
+            request_log_sample_rate=config.REQUEST_LOG_SAMPLE_RATE,
+            stream_update_interval=config.STREAM_UPDATE_INTERVAL_SECONDS,
+            outbound_options={
+                "coalesce_window": config.OUTBOUND_COALESCE_WINDOW_SECONDS,
+                "global_rate": config.OUTBOUND_GLOBAL_RATE,
+                "global_burst": config.OUTBOUND_GLOBAL_RATE,
+                "conversation_rate": config.OUTBOUND_CONVERSATION_RATE,
+                "conversation_burst": config.OUTBOUND_CONVERSATION_BURST,
+                "max_pending": config.OUTBOUND_MAX_PENDING,
+            },
+            conversation_store=self.conversation_store,
+            reply_cache=self.reply_cache,
+            pagination_options={
+                "max_page_bytes": config.REPLY_PAGE_MAX_BYTES,
+                "layout": config.REPLY_PAGE_LAYOUT,
+                "max_activity_bytes": config.REPLY_ACTIVITY_MAX_BYTES,
+                "ttl_seconds": config.REPLY_PAGE_CURSOR_TTL_SECONDS,
+            },
+        )
+        self.bot.set_paginator(self.bot_handler.paginator)
+
+        # Fan-out of agent updates to many conversations, only with an API key configured
+        # Topics and job reports go in the conversation store when every worker shares it
+        shared_store = self.conversation_store if self.conversation_store and self.conversation_store.shared else None
+        self.broadcaster = Broadcaster(
+            self.bot_handler,
+            TopicRegistry(config.BROADCAST_TOPICS_PATH or None, store=shared_store),
+            concurrency=config.BROADCAST_CONCURRENCY,
+            rate=config.BROADCAST_RATE,
+            store=shared_store,
+        )
+        self.broadcast_api = BroadcastApi(self.broadcaster, config.BROADCAST_API_KEY)
+
+        # Optional near-duplicate cache for paraphrased queries
+        semantic_cache = None
+        if config.SEMANTIC_CACHE_SIZE > 0:
+            from semantic_cache import SemanticCache
+            semantic_cache = SemanticCache(
+                config.SEMANTIC_CACHE_SIZE,
+                threshold=config.SEMANTIC_CACHE_THRESHOLD,
+                ttl_seconds=config.SEMANTIC_CACHE_TTL_SECONDS,
+                min_words=config.SEMANTIC_CACHE_MIN_WORDS,
+                agent_types=config.SEMANTIC_CACHE_AGENT_TYPES,
+            )
+
+        # Recent turns per conversation, sent to AutoGen as context
+        # Kept in the conversation store when every worker shares it, else in this worker's memory
+        self.history: Optional[HistoryStore] = None
+        if config.HISTORY_TURNS > 0:
+            self.history = HistoryStore(
+                config.HISTORY_TURNS,
+                max_conversations=config.HISTORY_MAX_CONVERSATIONS,
+                ttl_seconds=config.CONVERSATION_TTL_SECONDS,
+                path=config.HISTORY_PATH or None,
+                snapshot_interval=config.HISTORY_SNAPSHOT_SECONDS,
+                store=shared_store,
+            )
+
+        # Setup WebSocket handler; the connection string is checked when it first connects
+        self.websocket_handler = WebSocketHandler(
+            os.environ.get('WEBPUBSUB_CONNECTION_STRING1'),
+            'Hub',
+            self.bot_handler,
+            dispatch_concurrency=config.DISPATCH_CONCURRENCY,
+            dispatch_max_pending=config.DISPATCH_MAX_PENDING,
+            typing_threshold=config.TYPING_THRESHOLD_SECONDS,
+            typing_interval=config.TYPING_INTERVAL_SECONDS,
+            pool_size=config.WEBSOCKET_POOL_SIZE,
+            outbound_buffer_size=config.WEBSOCKET_BUFFER_SIZE,
+            outbound_spill_dir=spill_dir or None,
+            semantic_cache=semantic_cache,
+            wire_encodings=config.WIRE_ENCODINGS,
+            wire_compressions=config.WIRE_COMPRESSIONS,
+            websocket_compression=None if config.WEBSOCKET_COMPRESSION == "none" else config.WEBSOCKET_COMPRESSION,
+            history=self.history,
+            history_window_turns=config.HISTORY_WINDOW_TURNS,
+            history_window_chars=config.HISTORY_WINDOW_CHARS,
+        )
+        self.bot.set_ws_handler(self.websocket_handler)
+        self._websocket_task: Optional[asyncio.Task] = None
+
+    def _register_gauges(self):
+        websocket_handler = self.websocket_handler
+        bot_handler = self.bot_handler
+        REGISTRY.gauge("travelbot_dispatch_queue_depth", "AutoGen messages waiting for a dispatch worker",
+                       lambda: websocket_handler.dispatcher.queue_depth)
+        REGISTRY.gauge("travelbot_dispatch_in_flight", "AutoGen messages being delivered",
+                       lambda: websocket_handler.dispatcher.in_flight)
+        REGISTRY.gauge("travelbot_outbound_pending", "Replies queued for the Bot Connector",
+                       lambda: bot_handler.outbound.pending)
+        REGISTRY.gauge("travelbot_websocket_buffered", "Messages buffered for AutoGen",
+                       lambda: sum(len(connection.outbox) for connection in websocket_handler.connections))
+        REGISTRY.gauge("travelbot_websocket_connected", "Web PubSub connections that are up",
+                       lambda: sum(connection.is_connected for connection in websocket_handler.connections))
+        REGISTRY.gauge("travelbot_reply_page_cursors", "Show more cursors held in this worker's memory",
+                       lambda: len(bot_handler.paginator))
+        if self.history is not None and self.history.store is None:
+            history = self.history
+            REGISTRY.gauge("travelbot_history_conversations", "Conversations with recorded history",
+                           lambda: len(history))
+        REGISTRY.gauge("travelbot_conversations_cached", "Conversation references held by this worker",
+                       lambda: len(bot_handler.conversations))
+
+    def start(self, app=None):
+        """Start the AutoGen connections and background tasks"""
+        self._register_gauges()
+        self._websocket_task = self.websocket_handler.get_task(app)
+
+    async def stop(self):
+        if self._websocket_task is not None:
+            self._websocket_task.cancel()
+        await self.websocket_handler.cleanup()
+        await self.broadcaster.stop()
+        await self.bot_handler.outbound.stop()
+        if self.conversation_store:
+            await self.conversation_store.close()
+        if self.reply_cache is not None:
+            self.reply_cache.save()
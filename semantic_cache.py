@@ -0,0 +1,215 @@
+"""Near-duplicate query cache in front of the AutoGen backend"""
+import logging
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING, FrozenSet, Iterable, List, Optional, Tuple
+
+from metrics import SEMANTIC_CACHE_REQUESTS
+from reply_cache import SHAREABLE_AGENT_TYPES, normalize_prompt
+
+if TYPE_CHECKING:
+    import numpy
+
+# NumPy is slow to import and only needed when the semantic cache is enabled,
+# so SemanticCache imports it on construction
+np = None
+
+LOG = logging.getLogger(__name__)
+
+
+def _import_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError as e:
+            raise ValueError("The numpy package is required for the semantic cache") from e
+        np = numpy
+
+# Words, numbers and dates such as 12/05, 2026-10-17 or 7:30
+_TOKEN = re.compile(r"[^\W_]+(?:[/.:-][^\W_]+)*")
+
+_DATE_WORDS = frozenset((
+    "january february march april may june july august september october november december "
+    "jan feb mar apr jun jul aug sep sept oct nov dec "
+    "monday tuesday wednesday thursday friday saturday sunday "
+    "today tonight tomorrow yesterday weekend"
+).split())
+
+
+def significant_tokens(text: str) -> FrozenSet[str]:
+    """Words that change the answer however similar the rest is: capitalized
+    words after the first, e.g. destinations and airlines, and numbers and
+    dates anywhere"""
+    tokens = _TOKEN.findall(text.replace("'s", ""))
+    significant = set()
+    for index, token in enumerate(tokens):
+        lowered = token.lower()
+        if lowered in _DATE_WORDS or any(char.isdigit() for char in token):
+            significant.add(lowered)
+        elif index and token[0].isupper() and len(token) > 1:
+            significant.add(token)
+    return frozenset(significant)
+
+
+class HashedNgramEmbedder:
+    """Embeds text as a signed, hashed bag of character n-grams and words.
+
+    Needs no model download and runs in microseconds on the CPU. It catches
+    rewordings that keep most of the words ("When is the best time to visit
+    Singapore" and "What's the best time to visit Singapore?" score about
+    0.83) but not paraphrases with different vocabulary, and it scores a
+    question about another city almost as high, which ``SemanticCache``
+    guards against separately.
+    """
+
+    def __init__(self, dimensions: int = 1024, ngram: int = 3):
+        _import_numpy()
+        self.dimensions = dimensions
+        self.ngram = ngram
+
+    def features(self, text: str) -> List[str]:
+        normalized = normalize_prompt(text)
+        padded = f" {normalized} "
+        grams = [padded[i:i + self.ngram] for i in range(len(padded) - self.ngram + 1)]
+        return grams + [f"w:{word}" for word in normalized.split()]
+
+    def embed(self, text: str) -> "numpy.ndarray":
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self.features(text):
+            # crc32 rather than hash(), which is salted per process
+            digest = zlib.crc32(feature.encode("utf-8"))
+            vector[digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class _Collection:
+    __slots__ = ("prompt", "vector", "tokens", "deadline", "payloads")
+
+    def __init__(self, prompt: str, vector: "numpy.ndarray", deadline: float):
+        self.prompt = prompt
+        self.vector = vector
+        self.tokens = significant_tokens(prompt)
+        self.deadline = deadline
+        self.payloads: List[dict] = []
+
+
+class SemanticCache:
+    """Bounded vector index of past queries and the AutoGen replies they got.
+
+    The index is a fixed ``max_entries`` x ``dimensions`` matrix of unit
+    vectors, so a lookup is one matrix-vector product. A query whose best
+    cosine similarity reaches ``threshold`` and that names the same places,
+    numbers and dates (its significant tokens must match) is a hit, and the
+    stored reply payloads are served again. Replies to a miss are collected
+    until the user's next message or ``collect_seconds``, like the reply
+    cache. When the index is full the least recently used slot is
+    overwritten.
+
+    Only queries that stand alone are cached: not those shorter than
+    ``min_words`` ("yes", "book it"), nor those sent with earlier turns of
+    the conversation. A reply is only kept if every payload came from one
+    of ``agent_types``, so a booking is never replayed to another user.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        threshold: float = 0.8,
+        ttl_seconds: float = 3600,
+        collect_seconds: float = 30,
+        min_words: int = 4,
+        embedder: Optional[HashedNgramEmbedder] = None,
+        agent_types: Iterable[str] = SHAREABLE_AGENT_TYPES
+    ):
+        _import_numpy()
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.collect_seconds = collect_seconds
+        self.min_words = min_words
+        self.agent_types = frozenset(agent_types)
+        self.embedder = embedder or HashedNgramEmbedder()
+
+        self._vectors = np.zeros((max_entries, self.embedder.dimensions), dtype=np.float32)
+        # Expired and empty slots have expires_at 0, so they never match
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._prompts: List[Optional[str]] = [None] * max_entries
+        self._tokens: List[FrozenSet[str]] = [frozenset()] * max_entries
+        self._payloads: List[Optional[List[dict]]] = [None] * max_entries
+        self._collecting: "OrderedDict[str, _Collection]" = OrderedDict()
+
+    def cacheable(self, prompt, history: Optional[list] = None) -> bool:
+        """Whether a query can be answered from, and added to, the cache"""
+        return not history and isinstance(prompt, str) and len(prompt.split()) >= self.min_words
+
+    def lookup(self, prompt: str) -> Tuple[Optional[List[dict]], "numpy.ndarray"]:
+        """Return the stored replies of the most similar live entry, if similar enough,
+        and the query vector for ``begin`` on a miss"""
+        self._finish_expired()
+        vector = self.embedder.embed(prompt)
+        now = time.monotonic()
+        similarities = self._vectors @ vector
+        similarities[self._expires_at <= now] = -1.0
+        candidates = np.flatnonzero(similarities >= self.threshold)
+        tokens = significant_tokens(prompt)
+        for slot in candidates[np.argsort(-similarities[candidates])]:
+            if self._tokens[slot] == tokens:
+                self._last_used[slot] = now
+                SEMANTIC_CACHE_REQUESTS.inc(result="hit")
+                LOG.debug(f"Semantic cache hit ({similarities[slot]:.3f}): {prompt!r} ~ {self._prompts[slot]!r}")
+                return self._payloads[slot], vector
+
+        SEMANTIC_CACHE_REQUESTS.inc(result="miss")
+        return None, vector
+
+    def begin(self, conversation_id: str, prompt: str, vector: "numpy.ndarray"):
+        """Start collecting AutoGen's replies to a prompt that missed"""
+        self.finish(conversation_id)
+        self._collecting[conversation_id] = _Collection(prompt, vector, time.monotonic() + self.collect_seconds)
+
+    def record(self, conversation_id: Optional[str], payload: dict):
+        collection = self._collecting.get(conversation_id)
+        if collection is None or time.monotonic() >= collection.deadline:
+            return
+        if payload.get("agent_type", "default_agent") not in self.agent_types:
+            # Part of the reply is specific to this user, so none of it is kept
+            self.discard(conversation_id)
+            return
+        collection.payloads.append(payload)
+
+    def discard(self, conversation_id: Optional[str]):
+        self._collecting.pop(conversation_id, None)
+
+    def finish(self, conversation_id: str):
+        """Index whatever was collected for the conversation's last prompt"""
+        collection = self._collecting.pop(conversation_id, None)
+        if collection is not None and collection.payloads:
+            self._store(collection)
+
+    def _finish_expired(self):
+        now = time.monotonic()
+        while self._collecting:
+            conversation_id, collection = next(iter(self._collecting.items()))
+            if collection.deadline > now:
+                break
+            self.finish(conversation_id)
+
+    def _store(self, collection: _Collection):
+        now = time.monotonic()
+        # Expired slots count as unused, so they are reclaimed first
+        last_used = np.where(self._expires_at > now, self._last_used, -1.0)
+        slot = int(np.argmin(last_used))
+        self._vectors[slot] = collection.vector
+        self._expires_at[slot] = now + self.ttl_seconds
+        self._last_used[slot] = now
+        self._prompts[slot] = collection.prompt
+        self._tokens[slot] = collection.tokens
+        self._payloads[slot] = collection.payloads
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires_at > time.monotonic()))
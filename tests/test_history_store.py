@@ -0,0 +1,48 @@
+"""History store: the window is the same whether turns live in memory or in a shared store"""
+import asyncio
+
+import pytest
+
+from agent_message import AgentMessage
+from conversation_store import create_conversation_store
+from history_store import HistoryStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def history(request, tmp_path):
+    if request.param == "memory":
+        return HistoryStore(max_turns=3)
+    return HistoryStore(max_turns=3, store=create_conversation_store(f"sqlite:///{tmp_path / 'history.db'}"))
+
+
+def chunk(text, final):
+    return AgentMessage({"agent": "Travel Agent", "agent_type": "destination_info",
+                         "message": text, "stream_id": "s1", "final": final})
+
+
+def test_streamed_reply_is_one_turn(history):
+    async def run():
+        await history.add_user("alice", "Tell me about Singapore")
+        await history.add_agent("alice", chunk("Singapore is ", False))
+        await history.add_agent("alice", chunk("a city state", True))
+        return await history.window("alice")
+
+    window = asyncio.run(run())
+
+    assert [(turn["role"], turn["text"]) for turn in window] == [
+        ("user", "Tell me about Singapore"),
+        ("agent", "Singapore is a city state"),
+    ]
+
+
+def test_only_the_last_turns_are_kept(history):
+    async def run():
+        for n in range(5):
+            await history.add_user("alice", f"message {n}")
+        await history.add_user("bob", "hello")
+        return await history.window("alice", max_turns=10), await history.window("carol")
+
+    alice, carol = asyncio.run(run())
+
+    assert [turn["text"] for turn in alice] == ["message 2", "message 3", "message 4"]
+    assert carol == []
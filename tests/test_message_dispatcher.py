@@ -0,0 +1,72 @@
+"""Message dispatcher: one conversation's messages are handled in order, others in parallel"""
+import asyncio
+
+from message_dispatcher import MessageDispatcher
+
+
+def test_messages_of_one_conversation_are_handled_in_order():
+    handled = []
+
+    async def handler(item):
+        conversation_id, n = item
+        # Later messages finish sooner, so only the lane keeps them in order
+        await asyncio.sleep(0.01 * (5 - n))
+        handled.append(item)
+
+    async def run():
+        dispatcher = MessageDispatcher(handler, concurrency=4)
+        for n in range(5):
+            await dispatcher.submit("alice", ("alice", n))
+            await dispatcher.submit("bob", ("bob", n))
+        while dispatcher.queue_depth or dispatcher.in_flight:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+
+    assert [n for cid, n in handled if cid == "alice"] == list(range(5))
+    assert [n for cid, n in handled if cid == "bob"] == list(range(5))
+
+
+def test_conversations_are_handled_in_parallel():
+    running = set()
+    overlapped = []
+
+    async def handler(conversation_id):
+        running.add(conversation_id)
+        await asyncio.sleep(0.02)
+        overlapped.append(len(running) > 1)
+        running.discard(conversation_id)
+
+    async def run():
+        dispatcher = MessageDispatcher(handler, concurrency=2)
+        await dispatcher.submit("alice", "alice")
+        await dispatcher.submit("bob", "bob")
+        while dispatcher.queue_depth or dispatcher.in_flight:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+
+    assert any(overlapped)
+
+
+def test_a_failing_message_does_not_stop_its_lane():
+    handled = []
+
+    async def handler(n):
+        if n == 0:
+            raise RuntimeError("AutoGen sent garbage")
+        handled.append(n)
+
+    async def run():
+        dispatcher = MessageDispatcher(handler, concurrency=1)
+        for n in range(3):
+            await dispatcher.submit("alice", n)
+        while dispatcher.queue_depth or dispatcher.in_flight:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+
+    assert handled == [1, 2]
@@ -0,0 +1,78 @@
+"""Outbound buffer: frames that don't fit in memory are spilled and sent in order"""
+import asyncio
+
+from outbound_buffer import OutboundBuffer
+
+
+async def drain(buffer):
+    frames = []
+    while len(buffer):
+        frame = await buffer.peek()
+        if frame is not None:
+            frames.append(frame)
+            buffer.pop()
+    return frames
+
+
+def test_overflow_without_spill_file_is_dropped():
+    async def run():
+        buffer = OutboundBuffer(2)
+        results = [await buffer.put(f"frame-{n}") for n in range(3)]
+        return results, buffer.dropped, await drain(buffer)
+
+    results, dropped, frames = asyncio.run(run())
+
+    assert results == [True, True, False]
+    assert dropped == 1
+    assert frames == ["frame-0", "frame-1"]
+
+
+def test_spilled_frames_are_sent_in_order(tmp_path):
+    spill_path = str(tmp_path / "ws-0.jsonl")
+
+    async def run():
+        buffer = OutboundBuffer(2, spill_path)
+        for n in range(3):
+            await buffer.put(f"frame-{n}")
+        # Sent while the file still has unread frames, so it must wait behind them
+        first = await buffer.peek()
+        buffer.pop()
+        await buffer.put("frame-3")
+        return [first] + await drain(buffer)
+
+    assert asyncio.run(run()) == [f"frame-{n}" for n in range(4)]
+    assert (tmp_path / "ws-0.jsonl").read_text() == ""
+
+
+def test_spilled_frames_are_recovered_after_a_restart(tmp_path):
+    spill_path = str(tmp_path / "ws-0.jsonl")
+
+    async def crash():
+        buffer = OutboundBuffer(1, spill_path)
+        for n in range(4):
+            await buffer.put(f"frame-{n}")
+
+    async def restart():
+        buffer = OutboundBuffer(1, spill_path)
+        return len(buffer), await drain(buffer)
+
+    asyncio.run(crash())
+    recovered, frames = asyncio.run(restart())
+
+    # The frame that was only in memory is lost with the process
+    assert recovered == 3
+    assert frames == ["frame-1", "frame-2", "frame-3"]
+
+
+def test_unreadable_spill_line_is_skipped(tmp_path):
+    spill = tmp_path / "ws-0.jsonl"
+    spill.write_text('"frame-0"\n{"torn\n"frame-1"\n')
+
+    async def restart():
+        buffer = OutboundBuffer(5, str(spill))
+        return await drain(buffer), buffer.dropped
+
+    frames, dropped = asyncio.run(restart())
+
+    assert frames == ["frame-0", "frame-1"]
+    assert dropped == 1
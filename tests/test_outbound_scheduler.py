@@ -0,0 +1,67 @@
+"""Outbound scheduler: throttled Connector calls are retried, others are not"""
+import asyncio
+import time
+
+import pytest
+
+from outbound_scheduler import OutboundScheduler, retry_after
+
+
+class Response:
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+
+
+class ConnectorError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"Connector returned {status}")
+        self.response = Response(status, headers)
+
+
+def flaky(*errors):
+    """A Connector call that raises ``errors`` in turn, then succeeds"""
+    calls = []
+
+    async def func():
+        calls.append(time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "activity-id"
+
+    return func, calls
+
+
+def test_throttled_call_waits_for_retry_after():
+    scheduler = OutboundScheduler(send=None)
+    func, calls = flaky(ConnectorError(429, {"Retry-After": "0.2"}))
+
+    assert asyncio.run(scheduler.call("alice", func)) == "activity-id"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.2
+
+
+def test_server_error_is_not_retried():
+    # The Connector may have delivered the activity before failing
+    scheduler = OutboundScheduler(send=None)
+    func, calls = flaky(ConnectorError(500))
+
+    with pytest.raises(ConnectorError):
+        asyncio.run(scheduler.call("alice", func))
+    assert len(calls) == 1
+
+
+def test_retries_are_bounded():
+    scheduler = OutboundScheduler(send=None, max_retries=2)
+    func, calls = flaky(*[ConnectorError(503, {"Retry-After": "0"})] * 5)
+
+    with pytest.raises(ConnectorError):
+        asyncio.run(scheduler.call("alice", func))
+    assert len(calls) == 3
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert retry_after(ConnectorError(429, {"Retry-After": "3"})) == 3.0
+    assert retry_after(ConnectorError(429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retry_after(ConnectorError(429, {"Retry-After": "soon"})) is None
+    assert retry_after(ConnectorError(429)) is None
@@ -0,0 +1,58 @@
+"""Pagination: long replies are split into pages under the size limit"""
+import asyncio
+
+from card_templates import card_text
+from pagination import ReplyPaginator, SHOW_MORE_ACTION, paginate
+
+
+def utf8_size(text):
+    return len(text.encode("utf-8"))
+
+
+def test_short_reply_is_one_page():
+    assert list(paginate(["Day 1: Gardens by the Bay", "Day 2: Sentosa"], 100)) == \
+        ["Day 1: Gardens by the Bay\nDay 2: Sentosa"]
+
+
+def test_pages_stay_under_the_limit_and_keep_all_text():
+    blocks = [f"Day {n}: " + "hawker centre " * n for n in range(1, 20)]
+    pages = list(paginate(blocks, 120))
+
+    assert len(pages) > 1
+    assert all(utf8_size(page) <= 120 for page in pages)
+    assert "\n".join(pages).replace("\n", "") == "".join(blocks).replace("\n", "")
+
+
+def test_long_line_is_split_between_characters():
+    pages = list(paginate(["新加坡" * 50], 16))
+
+    assert all(utf8_size(page) <= 16 for page in pages)
+    assert "".join(pages) == "新加坡" * 50
+
+
+def show_more_cursor(activity):
+    for action in activity.attachments[-1].content.get("actions", []):
+        if action["data"].get("action") == SHOW_MORE_ACTION:
+            return action["data"]["cursor"]
+    return None
+
+
+def test_show_more_cursors_serve_the_rest_of_the_reply_once():
+    paginator = ReplyPaginator(max_page_bytes=50)
+    blocks = [f"Day {n}: explore the city" for n in range(1, 10)]
+
+    async def run():
+        activity, more = await paginator.build("Travel Agent", blocks, [])
+        texts = [card_text(activity.attachments[0].content)]
+        cursor = show_more_cursor(activity)
+        while cursor:
+            activity = await paginator.next_page(cursor)
+            assert await paginator.next_page(cursor) is None
+            texts.append(card_text(activity.attachments[0].content))
+            cursor = show_more_cursor(activity)
+        return more, texts
+
+    more, texts = asyncio.run(run())
+
+    assert more
+    assert texts == list(paginate(blocks, 50))
@@ -0,0 +1,37 @@
+"""Reply cache: suggested-action replies are only shared when they can't depend on the user"""
+from botbuilder.schema import Activity, ActivityTypes
+
+from reply_cache import ReplyCache
+
+PROMPT = ReplyCache.DEFAULT_PROMPTS[0]
+
+
+def reply(text):
+    return Activity(type=ActivityTypes.message, text=text)
+
+
+def test_informational_reply_is_served_again():
+    cache = ReplyCache()
+    key = cache.key(PROMPT)
+    cache.begin("alice", key)
+    cache.record("alice", reply("Gardens by the Bay"), "destination_info")
+    cache.finish("alice")
+
+    assert [activity.text for activity in cache.get(key)] == ["Gardens by the Bay"]
+
+
+def test_booking_reply_is_never_served_to_another_conversation():
+    cache = ReplyCache()
+    key = cache.key(PROMPT)
+    cache.begin("alice", key)
+    cache.record("alice", reply("Gardens by the Bay"), "destination_info")
+    cache.record("alice", reply("Booked a tour for Alice Tan"), "activities_booking")
+    cache.finish("alice")
+
+    assert cache.get(key) is None
+
+
+def test_prompt_sent_with_history_is_not_cacheable():
+    cache = ReplyCache()
+    assert cache.key(PROMPT) is not None
+    assert cache.key(PROMPT, history=[{"role": "user", "text": "Book a hotel in Singapore"}]) is None
@@ -0,0 +1,66 @@
+"""Semantic cache: only replies that don't depend on the user are shared"""
+import pytest
+
+pytest.importorskip("numpy")
+
+from semantic_cache import SemanticCache, significant_tokens  # noqa: E402
+
+
+def ask(cache, conversation_id, prompt, *payloads):
+    """Run one turn through the cache; returns the cached replies on a hit"""
+    cache.finish(conversation_id)
+    cached, vector = cache.lookup(prompt)
+    if cached is None:
+        cache.begin(conversation_id, prompt, vector)
+        for payload in payloads:
+            cache.record(conversation_id, payload)
+        cache.finish(conversation_id)
+    return cached
+
+
+def test_booking_reply_is_never_served_to_another_conversation():
+    cache = SemanticCache(10)
+    booking = {"agent_type": "flight_booking", "message": "Booked SQ 321 for Alice Tan"}
+    prompt = "Book me a flight to Singapore on Friday"
+
+    assert ask(cache, "alice", prompt, booking) is None
+    assert ask(cache, "bob", prompt) is None
+    assert len(cache) == 0
+
+
+def test_reply_with_a_booking_part_is_not_cached():
+    cache = SemanticCache(10)
+    prompt = "Tell me about Singapore and book a hotel there"
+    ask(cache, "alice", prompt,
+        {"agent_type": "destination_info", "message": "Singapore is a city state"},
+        {"agent_type": "hotel_booking", "message": "Booked Marina Bay Sands for Alice Tan"})
+
+    assert ask(cache, "bob", prompt) is None
+
+
+def test_informational_reply_is_served_again():
+    cache = SemanticCache(10)
+    info = {"agent_type": "destination_info", "message": "Singapore is a city state"}
+    ask(cache, "alice", "Tell me more about Singapore's culture", info)
+
+    assert ask(cache, "bob", "Tell me more about Singapore's culture") == [info]
+
+
+def test_numbers_and_dates_must_match():
+    assert significant_tokens("Best time to visit Singapore in June") != \
+        significant_tokens("Best time to visit Singapore in july")
+    assert significant_tokens("Things to do in Singapore for 2 days") != \
+        significant_tokens("Things to do in Singapore for 3 days")
+    assert "2026-10-17" in significant_tokens("Weather in Singapore on 2026-10-17")
+
+    cache = SemanticCache(10)
+    ask(cache, "alice", "Things to do in Singapore for 2 days",
+        {"agent_type": "destination_info", "message": "Two days in Singapore"})
+    assert ask(cache, "bob", "Things to do in Singapore for 3 days") is None
+
+
+def test_query_with_history_is_not_cacheable():
+    cache = SemanticCache(10)
+    prompt = "What else is there to do"
+    assert cache.cacheable(prompt)
+    assert not cache.cacheable(prompt, [{"role": "user", "text": "Tell me about Singapore"}])
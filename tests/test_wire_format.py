@@ -0,0 +1,61 @@
+"""Wire format: every negotiated encoding decodes back to the same message"""
+import zlib
+
+import pytest
+
+from wire_format import (MAX_DECODED_BYTES, TAG_BASE, WireCodec, available_compressions,
+                         available_encodings, decode_frame, dumps, encode_payload)
+
+MESSAGE = {
+    "type": "message",
+    "conversation_id": "a:1b2c",
+    "agent": "Flight Agent",
+    "message": "Found 3 flights to Singapore, from S$ 412 — 新加坡",
+    "data": {"flights": [{"number": "SQ 321", "price": 412.5, "direct": True}]},
+}
+
+
+@pytest.mark.parametrize("encoding", available_encodings())
+@pytest.mark.parametrize("compression", ["none"] + available_compressions())
+def test_encoded_frames_round_trip(encoding, compression):
+    assert decode_frame(encode_payload(MESSAGE, encoding, compression)) == MESSAGE
+
+
+def test_small_frames_are_not_compressed():
+    frame = encode_payload(MESSAGE, "json", "deflate", min_compress_size=10_000)
+    assert frame[0] == TAG_BASE
+    assert decode_frame(frame) == MESSAGE
+
+
+def test_text_frames_are_json():
+    assert decode_frame(dumps(MESSAGE)) == MESSAGE
+
+
+def test_codec_sends_json_until_a_format_is_accepted():
+    pytest.importorskip("msgpack")
+    codec = WireCodec(["msgpack"], ["deflate"], min_compress_size=0)
+    frame = dumps(MESSAGE)
+    assert codec.encode(frame) == frame
+
+    codec.accept({"encoding": "msgpack", "compression": "deflate"})
+    assert decode_frame(codec.encode(frame)) == MESSAGE
+
+    codec.reset()
+    assert codec.encode(frame) == frame
+
+
+def test_codec_ignores_a_format_it_did_not_offer():
+    codec = WireCodec(["msgpack"], [])
+    codec.accept({"encoding": "cbor", "compression": "none"})
+    assert codec.encoding == "json"
+
+
+def test_frame_that_inflates_past_the_cap_is_rejected():
+    bomb = bytes((TAG_BASE | 1,)) + zlib.compress(b"0" * (MAX_DECODED_BYTES + 1))
+    with pytest.raises(ValueError):
+        decode_frame(bomb)
+
+
+def test_unknown_tag_is_rejected():
+    with pytest.raises(ValueError):
+        decode_frame(bytes((TAG_BASE | 0x3,)) + b"{}")
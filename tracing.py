@@ -0,0 +1,257 @@
+"""End-to-end tracing of a user turn across the bot and AutoGen.
+
+Spans follow the OpenTelemetry data model and propagate as W3C
+``traceparent`` values: taken from the incoming /api/messages request,
+injected into outbound WebSocket frames and read back from AutoGen replies,
+so an AutoGen backend instrumented with OpenTelemetry joins the same trace.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+
+from agent_message import dumps
+
+LOG = logging.getLogger(__name__)
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def from_traceparent(cls, value: Optional[str]) -> Optional["SpanContext"]:
+        """Parse a W3C traceparent; malformed or all-zero ids are ignored"""
+        if not isinstance(value, str):
+            return None
+        match = TRACEPARENT_PATTERN.match(value.strip().lower())
+        if not match:
+            return None
+        trace_id, span_id, flags = match.groups()
+        if not int(trace_id, 16) or not int(span_id, 16):
+            return None
+        return cls(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+class Span:
+    """A timed operation; use as a context manager to make it the current span"""
+
+    __slots__ = (
+        "tracer", "name", "context", "parent_id", "attributes", "status", "start_ns", "end_ns", "_token"
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        context: SpanContext,
+        parent_id: Optional[str],
+        attributes: Optional[Dict[str, Any]] = None
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "UNSET"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._token = None
+
+    @property
+    def traceparent(self) -> str:
+        return self.context.traceparent
+
+    @property
+    def duration_seconds(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        self.status = "ERROR"
+        self.attributes["exception.type"] = type(error).__name__
+        self.attributes["exception.message"] = str(error)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer.export(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None and not isinstance(exc, asyncio.CancelledError):
+            self.record_exception(exc)
+        _current_span.reset(self._token)
+        self.end()
+
+    def to_dict(self) -> dict:
+        """The span in the shape of OpenTelemetry's console exporter"""
+        return {
+            "name": self.name,
+            "context": {"trace_id": self.context.trace_id, "span_id": self.context.span_id},
+            "parent_id": self.parent_id,
+            "start_time": _isoformat(self.start_ns),
+            "end_time": _isoformat(self.end_ns),
+            "duration_ms": round(self.duration_seconds * 1000, 3),
+            "status": {"status_code": self.status},
+            "attributes": self.attributes,
+            "resource": self.tracer.resource,
+        }
+
+
+def _isoformat(timestamp_ns: Optional[int]) -> Optional[str]:
+    if timestamp_ns is None:
+        return None
+    return datetime.fromtimestamp(timestamp_ns / 1e9, tz=timezone.utc).isoformat()
+
+
+class ConsoleSpanExporter:
+    """Logs each finished span as one JSON line"""
+
+    def export(self, span: Span):
+        LOG.info(dumps(span.to_dict()))
+
+    def close(self):
+        pass
+
+
+class FileSpanExporter:
+    """Appends finished spans to a JSON-lines file.
+
+    Like log records, spans go through a bounded queue to a writer thread, so
+    the event loop never waits on the disk; if ``queue_size`` spans are
+    waiting, new ones are dropped.
+    """
+
+    def __init__(self, path: str, queue_size: int = 10000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.dropped = 0
+        self._file = open(path, "a", encoding="utf-8")
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._write, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            self._file.write(dumps(entry) + "\n")
+            if self._queue.empty():
+                self._file.flush()
+
+    def close(self):
+        """Write the queued spans and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the exporter.
+
+    Without an exporter, spans are still created so trace ids keep flowing
+    through frames; they are just not recorded.
+    """
+
+    def __init__(self, service_name: str = "travelbot", exporter=None):
+        self.resource = {"service.name": service_name}
+        self.exporter = exporter
+
+    def start_span(
+        self,
+        name: str,
+        parent: Union[Span, SpanContext, str, None] = None,
+        attributes: Optional[Dict[str, Any]] = None
+    ) -> Span:
+        """Start a span under ``parent`` (a span, context or traceparent), else the current span"""
+        if isinstance(parent, str):
+            parent = SpanContext.from_traceparent(parent)
+        elif isinstance(parent, Span):
+            parent = parent.context
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current else None
+
+        span_id = f"{random.getrandbits(64) or 1:016x}"
+        if parent:
+            context = SpanContext(parent.trace_id, span_id, parent.sampled)
+            parent_id = parent.span_id
+        else:
+            context = SpanContext(f"{random.getrandbits(128) or 1:032x}", span_id)
+            parent_id = None
+        return Span(self, name, context, parent_id, attributes)
+
+    def export(self, span: Span):
+        if self.exporter is None or not span.context.sampled:
+            return
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            LOG.warning(f"Failed to export span {span.name}: {str(e)}")
+
+    def close(self):
+        if self.exporter:
+            self.exporter.close()
+            self.exporter = None
+
+
+TRACER = Tracer()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def configure_tracing(
+    exporter: str,
+    path: str = "traces.jsonl",
+    service_name: str = "travelbot",
+    instance_id: str = ""
+):
+    """Select the span exporter: "" (none), "console" or "file" """
+    TRACER.resource = {"service.name": service_name}
+    if instance_id:
+        TRACER.resource["service.instance.id"] = instance_id
+    if not exporter:
+        TRACER.exporter = None
+    elif exporter == "console":
+        TRACER.exporter = ConsoleSpanExporter()
+    elif exporter == "file":
+        TRACER.exporter = FileSpanExporter(path)
+    else:
+        raise ValueError(f"Unsupported tracing exporter: {exporter}")
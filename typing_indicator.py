@@ -0,0 +1,64 @@
+"""Per-conversation typing indicator for pending AutoGen replies"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict
+
+LOG = logging.getLogger(__name__)
+
+
+class TypingIndicator:
+    """Shows typing in a conversation while its reply is pending.
+
+    Nothing is sent if the reply arrives within ``threshold`` seconds. After
+    that, at most one typing activity is sent every ``interval`` seconds until
+    ``stop`` is called or ``max_duration`` seconds have passed.
+    """
+
+    def __init__(
+        self,
+        send_typing: Callable[[str], Awaitable],
+        threshold: float = 0.5,
+        interval: float = 3.0,
+        max_duration: float = 120
+    ):
+        self.send_typing = send_typing
+        self.threshold = threshold
+        self.interval = interval
+        self.max_duration = max_duration
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, conversation_id: str):
+        """Mark a reply as pending; does nothing if one already is"""
+        if conversation_id and conversation_id not in self._tasks:
+            self._tasks[conversation_id] = asyncio.create_task(self._run(conversation_id))
+
+    def stop(self, conversation_id: str):
+        """Mark the reply as delivered and stop sending typing activities"""
+        task = self._tasks.pop(conversation_id, None)
+        if task:
+            task.cancel()
+
+    def is_pending(self, conversation_id: str) -> bool:
+        return conversation_id in self._tasks
+
+    async def _run(self, conversation_id: str):
+        try:
+            await asyncio.sleep(self.threshold)
+            elapsed = self.threshold
+            while elapsed < self.max_duration:
+                try:
+                    await self.send_typing(conversation_id)
+                except Exception as e:
+                    LOG.warning(f"Failed to send typing indicator to {conversation_id}: {str(e)}")
+                await asyncio.sleep(self.interval)
+                elapsed += self.interval
+        finally:
+            if self._tasks.get(conversation_id) is asyncio.current_task():
+                del self._tasks[conversation_id]
+
+    async def cleanup(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
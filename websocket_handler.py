@@ -1,40 +1,319 @@
 """Handles WebSocket connections and message processing"""
 import logging
 import os
-from azure.messaging.webpubsubservice import WebPubSubServiceClient
 import websockets
 import asyncio
-import json
-from datetime import datetime, timedelta
+import random
+import socket
+import time
+import zlib
+from functools import lru_cache
+from collections import OrderedDict
+from enum import Enum
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Tuple, Union
 from botbuilder.schema import (
     ConversationReference, 
     ConversationAccount, 
     ChannelAccount
 )
 
+from access_token_provider import ClientAccessTokenProvider
+from agent_message import AgentMessage, dumps
+from logging_config import log_payload
 from bot_handler import BotHandler
-from message_formatter import DEFAULT_ACTIONS
+from history_store import HistoryStore
+from message_dispatcher import MessageDispatcher
+from metrics import AUTOGEN_ROUND_TRIP_SECONDS, MESSAGES_DROPPED, WEBSOCKET_RECONNECTS
+from outbound_buffer import OutboundBuffer
+from tracing import TRACER, Span
+from wire_format import WireCodec, is_control
+from typing_indicator import TypingIndicator
+
+if TYPE_CHECKING:
+    from azure.messaging.webpubsubservice import WebPubSubServiceClient
+    from semantic_cache import SemanticCache
 
 LOG = logging.getLogger(__name__)
-LOG.setLevel(logging.INFO)
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 
-class WebSocketHandler:
-    def __init__(self, connection_string: str, hub_name: str, bot_handler: BotHandler):
-        """Initialize WebSocket handler with connection details and bot handler"""
-        self.service = WebPubSubServiceClient.from_connection_string(
-            connection_string=connection_string, 
-            hub=hub_name
-        )
-        self.bot_handler = bot_handler
+def web_pubsub_client(connection_string: Optional[str], hub_name: str) -> "WebPubSubServiceClient":
+    """Build the Web PubSub service client, importing the Azure SDK only now"""
+    if not connection_string:
+        raise ValueError("Missing WEBPUBSUB_CONNECTION_STRING1 environment variable")
+    from azure.messaging.webpubsubservice import WebPubSubServiceClient
+    return WebPubSubServiceClient.from_connection_string(connection_string=connection_string, hub=hub_name)
+
+
+class ConnectionState(Enum):
+    DISCONNECTED = "disconnected"
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    BACKOFF = "backoff"
+    CLOSED = "closed"
+
+
+class WebSocketConnection:
+    """A single Web PubSub WebSocket, owned by one supervisor loop.
+
+    ``run`` is the only place that connects: it connects, reads frames until
+    the socket closes, then reconnects after a decorrelated-jitter backoff
+    (each delay drawn between ``backoff_base`` and three times the previous
+    one, capped at ``backoff_cap``) so restarting instances spread out
+    instead of reconnecting in lockstep. Senders never connect themselves;
+    they wait on the ``connected`` event. Keepalive pings come from the
+    websockets library's ``ping_interval``.
+
+    With a ``codec`` that offers compact formats, every (re)connect starts
+    on JSON and sends the codec's handshake; frames are decoded here so the
+    backend's ``wire_format`` answer can be handled before dispatch.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        token_provider: ClientAccessTokenProvider,
+        on_frame: Callable[[AgentMessage, Union[str, bytes]], Awaitable],
+        buffer_size: int = 1000,
+        spill_dir: Optional[str] = None,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 30.0,
+        codec: Optional[WireCodec] = None,
+        compression: Optional[str] = "deflate"
+    ):
+        self.index = index
+        self.token_provider = token_provider
+        # Where AutoGen should send replies to frames sent on this connection
+        self.reply_to = {"user_id": token_provider.user_id} if token_provider.user_id else None
+        self.on_frame = on_frame
+        self.codec = codec or WireCodec([], [])
+        # permessage-deflate offered in the WebSocket handshake; None disables it
+        self.compression = compression
         self.connection = None
+        self.state = ConnectionState.DISCONNECTED
+        self.connected = asyncio.Event()
+        spill_path = None
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            spill_path = os.path.join(spill_dir, f"ws-{index}.jsonl")
+        self.outbox = OutboundBuffer(buffer_size, spill_path)
         self.should_reconnect = True
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.reconnect_attempt = 0
+        self.reconnects = 0
+        self._backoff = backoff_base
+
+    @property
+    def is_connected(self) -> bool:
+        return self.state is ConnectionState.CONNECTED
+
+    def _set_state(self, state: ConnectionState):
+        if state is not self.state:
+            LOG.debug(f"[ws-{self.index}] {self.state.value} -> {state.value}")
+            self.state = state
+        if state is ConnectionState.CONNECTED:
+            self.connected.set()
+        else:
+            self.connected.clear()
+
+    def next_backoff(self) -> float:
+        """Decorrelated jitter: uniform between the base and 3x the previous delay"""
+        self._backoff = min(self.backoff_cap, random.uniform(self.backoff_base, self._backoff * 3))
+        return self._backoff
+
+    async def connect(self) -> bool:
+        """Open the WebSocket; only called from the supervisor loop"""
+        self._set_state(ConnectionState.CONNECTING)
+        try:
+            # Cached until shortly before the token expires
+            url = await self.token_provider.get_url()
+            LOG.info(f"[ws-{self.index}] Connecting to Web PubSub")
+            self.connection = await websockets.connect(
+                url,
+                ping_interval=30,
+                ping_timeout=10,
+                close_timeout=10,
+                max_size=10_000_000,  # 10MB max message size
+                compression=self.compression,
+                extra_headers={
+                    "User-Agent": "TravelBot/1.0",
+                    "Connection": "keep-alive"
+                }
+            )
+        except Exception as e:
+            self.reconnect_attempt += 1
+            LOG.error(f"[ws-{self.index}] Failed to connect to WebSocket (attempt {self.reconnect_attempt}): {str(e)}")
+            self._set_state(ConnectionState.DISCONNECTED)
+            return False
+
+        LOG.info(f"[ws-{self.index}] Connected to Web PubSub service")
+        self.codec.reset()
+        if self.codec.enabled:
+            try:
+                await self.connection.send(self.codec.hello())
+            except Exception as e:
+                LOG.error(f"[ws-{self.index}] Failed to offer wire formats: {str(e)}")
         self.reconnect_attempt = 0
-        self.max_reconnect_attempts = 10  # Maximum number of quick reconnection attempts
-        self.last_reconnect_time = None
-        self.heartbeat_task = None
-        self.is_processing = False  # Add this line to track message processing state
+        self._backoff = self.backoff_base
+        self._set_state(ConnectionState.CONNECTED)
+        return True
+
+    async def enqueue(self, message_to_send: str) -> bool:
+        """Buffer a serialized frame for the drainer; never waits on the network"""
+        return await self.outbox.put(message_to_send)
+
+    async def drain(self):
+        """Send buffered frames in order whenever the connection is up"""
+        while self.should_reconnect:
+            await self.outbox.wait()
+            await self.connected.wait()
+            message_to_send = await self.outbox.peek()
+            if message_to_send is None:
+                continue
+            connection = self.connection
+            if connection is None:
+                # The receive loop has just ended; wait for the supervisor to reconnect
+                self._set_state(ConnectionState.DISCONNECTED)
+                continue
+            try:
+                data = self.codec.encode(message_to_send)
+            except Exception as e:
+                # Retrying can't help a frame that doesn't encode, and it would block the rest
+                self.outbox.pop()
+                MESSAGES_DROPPED.inc(reason="websocket_encode")
+                LOG.error(f"[ws-{self.index}] Dropped a frame that couldn't be encoded: {str(e)}")
+                continue
+            try:
+                await connection.send(data)
+                self.outbox.pop()
+            except Exception as e:
+                # Keep the frame at the head of the buffer; closing the socket
+                # ends the supervisor's receive loop so it reconnects
+                LOG.error(f"[ws-{self.index}] Error sending message: {str(e)}")
+                self._set_state(ConnectionState.DISCONNECTED)
+                try:
+                    await connection.close()
+                except Exception as close_error:
+                    LOG.warning(f"[ws-{self.index}] Error closing connection: {str(close_error)}")
+
+    async def receive_messages(self):
+        """Read frames until the current connection closes"""
+        try:
+            async for frame in self.connection:
+                agent_message = AgentMessage.from_frame(frame)
+                if is_control(agent_message.payload):
+                    self.codec.accept(agent_message.payload)
+                    continue
+                await self.on_frame(agent_message, frame)
+        except websockets.exceptions.ConnectionClosed as closed_error:
+            LOG.warning(f"[ws-{self.index}] WebSocket connection closed ({closed_error.code}): {closed_error.reason}")
+        except Exception as e:
+            LOG.error(f"[ws-{self.index}] Error in receive_messages: {str(e)}")
+        finally:
+            self.connection = None
+            self._set_state(ConnectionState.DISCONNECTED)
+
+    async def supervise(self):
+        """Connection state machine: connect, receive, back off, repeat"""
+        # Spread out the first connect of instances that start at the same time
+        await asyncio.sleep(random.uniform(0, self.backoff_base))
+        while self.should_reconnect:
+            if await self.connect():
+                if self.reconnects:
+                    WEBSOCKET_RECONNECTS.inc()
+                await self.receive_messages()
+                self.reconnects += 1
+                if not self.should_reconnect:
+                    break
+            backoff_time = self.next_backoff()
+            LOG.info(f"[ws-{self.index}] Will attempt reconnect in {backoff_time:.1f} seconds")
+            self._set_state(ConnectionState.BACKOFF)
+            await asyncio.sleep(backoff_time)
+        self._set_state(ConnectionState.CLOSED)
+
+    async def run(self):
+        await asyncio.gather(self.supervise(), self.drain())
+
+    async def close(self):
+        self.should_reconnect = False
+        if len(self.outbox):
+            LOG.warning(f"[ws-{self.index}] Closing with {len(self.outbox)} unsent messages")
+        if self.connection:
+            await self.connection.close()
+        self._set_state(ConnectionState.CLOSED)
+
+
+class WebSocketHandler:
+    """Pool of Web PubSub connections with conversations sharded across them.
+
+    A conversation always uses the same connection (chosen by a stable hash
+    of its id), so its frames stay ordered while other connections send and
+    receive in parallel and reconnect independently.
+    """
+
+    def __init__(
+        self,
+        connection_string: Optional[str],
+        hub_name: str,
+        bot_handler: BotHandler,
+        dispatch_concurrency: int = 8,
+        dispatch_max_pending: int = 1000,
+        typing_threshold: float = 0.5,
+        typing_interval: float = 3.0,
+        pool_size: int = 1,
+        outbound_buffer_size: int = 1000,
+        outbound_spill_dir: Optional[str] = None,
+        semantic_cache: Optional["SemanticCache"] = None,
+        wire_encodings: Optional[List[str]] = None,
+        wire_compressions: Optional[List[str]] = None,
+        websocket_compression: Optional[str] = "deflate",
+        history: Optional[HistoryStore] = None,
+        history_window_turns: int = 6,
+        history_window_chars: int = 4000,
+        instance_id: Optional[str] = None,
+    ):
+        """Initialize WebSocket handler with connection details and bot handler"""
+        # The service client is only needed to sign access tokens, so it is built on the first connect
+        service_factory = lru_cache(maxsize=None)(lambda: web_pubsub_client(connection_string, hub_name))
+        # Every worker and pool connection signs in as its own Web PubSub user, so a
+        # reply sent to that user reaches the socket its prompt was sent on, once
+        instance_id = instance_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.token_providers = [
+            ClientAccessTokenProvider(
+                service_factory,
+                override_url=os.getenv('WEBSOCKET_URL'),
+                user_id=f"travelbot-{instance_id}-ws-{index}"
+            )
+            for index in range(max(1, pool_size))
+        ]
+        self.bot_handler = bot_handler
+        self.semantic_cache = semantic_cache
+        # Recent turns per conversation, sent along with each user message
+        self.history = history
+        self.history_window_turns = history_window_turns
+        self.history_window_chars = history_window_chars
+        self.connections: List[WebSocketConnection] = [
+            WebSocketConnection(
+                index,
+                token_provider,
+                self.on_frame,
+                buffer_size=outbound_buffer_size,
+                spill_dir=outbound_spill_dir,
+                codec=WireCodec(wire_encodings or [], wire_compressions or []),
+                compression=websocket_compression
+            )
+            for index, token_provider in enumerate(self.token_providers)
+        ]
+        self.typing = TypingIndicator(
+            self.bot_handler.send_typing,
+            threshold=typing_threshold,
+            interval=typing_interval
+        )
+        self.dispatcher = MessageDispatcher(
+            self.handle_message,
+            concurrency=dispatch_concurrency,
+            max_pending=dispatch_max_pending
+        )
         LOG.info("WebSocket handler initialized")
 
         # Create a complete default conversation reference with all required fields
@@ -63,163 +342,167 @@ class WebSocketHandler:
             locale="en-US"
         )
         
-        self.bot_handler.last_conversation_reference = self.default_conversation_reference
-
-    def get_backoff_time(self) -> float:
-        """Calculate exponential backoff time with a maximum"""
-        if self.last_reconnect_time:
-            # Reset reconnect attempts if last attempt was more than 5 minutes ago
-            time_since_last = datetime.now() - self.last_reconnect_time
-            if time_since_last > timedelta(minutes=5):
-                self.reconnect_attempt = 0
-
-        # Exponential backoff with max of 30 seconds
-        backoff = min(30, (2 ** self.reconnect_attempt))
-        return backoff
-
-    async def heartbeat(self):
-        """Send periodic heartbeat to keep connection alive"""
-        while self.connection and not self.connection.closed:
-            try:
-                await self.connection.ping()
-                await asyncio.sleep(20)  # Send heartbeat every 20 seconds
-            except Exception as e:
-                LOG.warning(f"Heartbeat failed: {str(e)}")
-                break
-        LOG.info("Heartbeat task ended")
-
-    async def connect(self):
-        """Establish WebSocket connection with retry logic"""
-        if self.reconnect_attempt >= self.max_reconnect_attempts:
-            LOG.error("Maximum reconnection attempts reached. Waiting longer before trying again.")
-            await asyncio.sleep(300)  # Wait 5 minutes before resetting
-            self.reconnect_attempt = 0
-            return False
+        self.bot_handler.default_conversation_reference = self.default_conversation_reference
 
-        try:
-            # Get a fresh token URL each time we connect
-            client_access_token = self.service.get_client_access_token()
-            test_url = os.getenv('WEBSOCKET_URL', client_access_token['url'])
-            logging.info(f"Connecting to {test_url}")
-            self.connection = await websockets.connect(
-                test_url, #client_access_token['url'],
-                ping_interval=30,
-                ping_timeout=10,
-                close_timeout=10,
-                max_size=10_000_000,  # 10MB max message size
-                extra_headers={
-                    "User-Agent": "TravelBot/1.0",
-                    "Connection": "keep-alive"
-                }
-            )
+        # When each conversation's oldest unanswered message was sent, and the span
+        # covering the AutoGen leg of that turn (network plus agent time)
+        self._awaiting_reply: "OrderedDict[str, Tuple[float, Span]]" = OrderedDict()
+        self.max_awaiting_reply = 10000
 
-            # Start heartbeat task
-            if self.heartbeat_task:
-                self.heartbeat_task.cancel()
-            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+    @property
+    def is_ready(self) -> bool:
+        """True when at least one pool connection is up"""
+        return any(connection.is_connected for connection in self.connections)
 
-            LOG.info("Connected to Web PubSub service")
-            self.reconnect_attempt = 0
-            return True
+    def connection_for(self, conversation_id: Optional[str]) -> WebSocketConnection:
+        """Pick the pool connection that owns a conversation"""
+        if not conversation_id or len(self.connections) == 1:
+            return self.connections[0]
+        return self.connections[zlib.crc32(conversation_id.encode("utf-8")) % len(self.connections)]
 
-        except Exception as e:
-            LOG.error(f"Failed to connect to WebSocket: {str(e)}")
-            self.reconnect_attempt += 1
-            self.last_reconnect_time = datetime.now()
-            backoff_time = self.get_backoff_time()
-            LOG.info(f"Will attempt reconnect in {backoff_time} seconds (attempt {self.reconnect_attempt})")
-            return False
+    async def send_message(self, message: str, conversation_id: Optional[str] = None):
+        """Queue a message for the conversation's WebSocket connection.
 
-    def format_message_with_actions(self, message: str) -> dict:
-        """Format the message to include suggested actions"""
-        try:
-            message_data = json.loads(message)
-            if 'suggested_actions' not in message_data:
-                message_data['suggested_actions'] = DEFAULT_ACTIONS
-            return json.dumps(message_data)
-        except json.JSONDecodeError:
-            return json.dumps({
-                "message": message,
-                "agent": "AutoGen Agent",
-                "suggested_actions": DEFAULT_ACTIONS
-            })
-
-    async def send_message(self, message: str):
-        """Send a message over the WebSocket connection with retry logic"""
-        if not self.connection or self.connection.closed:
-            LOG.warning("No WebSocket connection available, attempting to reconnect...")
-            if not await self.connect():
-                LOG.error("Failed to establish connection for sending message")
-                return
+        Returns as soon as the message is buffered; the connection's drainer
+        sends it in order once the socket is up. When a conversation id is
+        given the message is wrapped in an envelope so AutoGen can echo the
+        id (and the ``traceparent`` of the turn) back and replies reach the
+        right user, and with a history store it carries the conversation's
+        recent turns as ``history``.
+        """
+        with TRACER.start_span("websocket.send_message", attributes={"conversation.id": conversation_id}) as span:
+            history_window = None
+            if self.history is not None and conversation_id:
+                history_window = await self.history.window(
+                    conversation_id, self.history_window_turns, self.history_window_chars
+                )
+
+            vector = None
+            if self.semantic_cache is not None and conversation_id:
+                # A new message ends the collection of replies to the previous one
+                self.semantic_cache.finish(conversation_id)
+                # A reply that builds on earlier turns is never shared
+                if self.semantic_cache.cacheable(message, history_window):
+                    cached_payloads, vector = self.semantic_cache.lookup(message)
+                    span.set_attribute("semantic_cache.hit", cached_payloads is not None)
+                    if cached_payloads is not None:
+                        if self.history is not None:
+                            await self.history.add_user(conversation_id, message)
+                        await self.replay(conversation_id, cached_payloads, span.traceparent)
+                        return
+
+            round_trip = None
+            user_message = message
+            connection = self.connection_for(conversation_id)
+            if conversation_id:
+                # The AutoGen leg is timed from the oldest unanswered message of the turn
+                if conversation_id not in self._awaiting_reply:
+                    round_trip = TRACER.start_span("autogen.round_trip", attributes={"conversation.id": conversation_id})
+                trace_context = round_trip or span
+                message = {"conversation_id": conversation_id, "message": message,
+                           "traceparent": trace_context.traceparent}
+                if history_window is not None:
+                    message["history"] = history_window
+                if connection.reply_to:
+                    message["reply_to"] = connection.reply_to
 
-        try:
             if isinstance(message, (dict, list)):
-                message_to_send = json.dumps(message)
+                message_to_send = dumps(message)
             else:
                 message_to_send = str(message)  # Ensure string conversion
 
-            LOG.debug(f"Sending serialized message: {message_to_send}")
-            await self.connection.send(message_to_send)
-            LOG.info(f"Sent message: {message}")
-        except Exception as e:
-            LOG.error(f"Error sending message: {str(e)}")
-            self.connection = None
-            # Try to reconnect and resend
-            if await self.connect():
+            if not await connection.enqueue(message_to_send):
+                span.status = "ERROR"
+                if round_trip:
+                    # Nothing was sent, so no reply will ever end it
+                    round_trip.status = "ERROR"
+                    round_trip.set_attribute("autogen.replied", False)
+                    round_trip.end()
+                return
+            if vector is not None:
+                self.semantic_cache.begin(conversation_id, user_message, vector)
+            if self.history is not None and conversation_id:
+                await self.history.add_user(conversation_id, user_message)
+
+            log_payload(LOG, "Queued message", message_to_send, conversation_id)
+            self.typing.start(conversation_id)
+            if round_trip:
+                self._awaiting_reply[conversation_id] = (time.monotonic(), round_trip)
+                if len(self._awaiting_reply) > self.max_awaiting_reply:
+                    _, (_, abandoned) = self._awaiting_reply.popitem(last=False)
+                    abandoned.set_attribute("autogen.replied", False)
+                    abandoned.end()
+
+    async def replay(self, conversation_id: str, payloads: List[dict], traceparent: Optional[str] = None):
+        """Deliver stored AutoGen replies to a conversation as if they had just arrived"""
+        for payload in payloads:
+            payload = dict(payload, conversation_id=conversation_id, traceparent=traceparent)
+            await self.dispatcher.submit(conversation_id, AgentMessage(payload))
+
+    async def on_frame(self, agent_message: AgentMessage, frame: Union[str, bytes]):
+        """Queue a decoded frame from any pool connection for delivery"""
+        # Binary frames are compressed or packed, so only their size and envelope are logged
+        if isinstance(frame, str):
+            log_payload(LOG, "Received message", frame, agent_message.conversation_id)
+        else:
+            log_payload(LOG, "Received message",
+                        f"{len(frame)} bytes, agent={agent_message.agent!r}, "
+                        f"agent_type={agent_message.agent_type!r}, stream_id={agent_message.stream_id!r}, "
+                        f"final={agent_message.final}",
+                        agent_message.conversation_id)
+        if self.semantic_cache is not None:
+            if agent_message.stream_id:
+                # Streams are keyed by stream_id and can't be replayed into another conversation
+                self.semantic_cache.discard(agent_message.conversation_id)
+            else:
+                self.semantic_cache.record(agent_message.conversation_id, agent_message.payload)
+        pending = self._awaiting_reply.pop(agent_message.conversation_id, None)
+        if pending is not None:
+            sent_at, round_trip = pending
+            AUTOGEN_ROUND_TRIP_SECONDS.observe(time.monotonic() - sent_at)
+            round_trip.set_attribute("autogen.agent", agent_message.agent)
+            round_trip.end()
+            # Replies from an AutoGen backend that doesn't echo traceparent still join the turn's trace
+            if not agent_message.traceparent:
+                agent_message.traceparent = round_trip.traceparent
+        # Blocks while the dispatcher is full, applying backpressure to the socket
+        await self.dispatcher.submit(agent_message.conversation_id, agent_message)
+
+    async def handle_message(self, agent_message: AgentMessage):
+        """Deliver one AutoGen message; runs on a dispatcher worker"""
+        attributes = {"conversation.id": agent_message.conversation_id, "agent.type": agent_message.agent_type}
+        try:
+            # Recorded on the conversation's lane, so a shared store's round trip
+            # holds up neither the socket nor other conversations
+            if self.history is not None and agent_message.conversation_id:
                 try:
-                    await self.connection.send(message)
-                    LOG.info("Successfully resent message after reconnection")
-                except Exception as resend_error:
-                    LOG.error(f"Failed to resend message after reconnection: {str(resend_error)}")
+                    await self.history.add_agent(agent_message.conversation_id, agent_message)
+                except Exception as e:
+                    LOG.error(f"Failed to record history for {agent_message.conversation_id}: {str(e)}")
+            with TRACER.start_span("bot.process_websocket_message", agent_message.traceparent, attributes):
+                await self.bot_handler.process_websocket_message(agent_message)
+        finally:
+            # The reply is visible (or has failed), so stop showing typing
+            self.typing.stop(agent_message.conversation_id)
 
-    async def receive_messages(self):
-        """Main message receiving loop with improved error handling"""
-        while self.should_reconnect:
-            try:
-                if not self.connection or self.connection.closed:
-                    backoff_time = self.get_backoff_time()
-                    await asyncio.sleep(backoff_time)
-                    
-                    if not await self.connect():
-                        continue
-
-                async for message in self.connection:
-                    LOG.info(f"Received message: {message}")
-                    
-                    # Show typing indicator before processing
-                    if not self.is_processing:
-                        self.is_processing = True
-                        await self.bot_handler.bot_adapter.continue_conversation(
-                            self.bot_handler.last_conversation_reference,
-                            self.bot_handler.show_typing,
-                            self.bot_handler.app_id
-                        )
-
-                    formatted_message = self.format_message_with_actions(message)
-                    await self.bot_handler.process_websocket_message(formatted_message)
-                    self.is_processing = False
-
-            except websockets.exceptions.ConnectionClosed as closed_error:
-                self.is_processing = False  # Reset processing state on connection close
-                LOG.warning(f"WebSocket connection closed ({closed_error.code}): {closed_error.reason}")
-                self.connection = None
-            except Exception as e:
-                self.is_processing = False  # Reset processing state on error
-                LOG.error(f"Error in receive_messages: {str(e)}")
-                self.connection = None
+    async def run(self):
+        """Run every pool connection's receive loop and drainer"""
+        await asyncio.gather(*(connection.run() for connection in self.connections))
 
     def get_task(self, app):
         """Create background task for the application"""
-        return asyncio.create_task(self.receive_messages())
+        self.dispatcher.start()
+        for token_provider in self.token_providers:
+            token_provider.start()
+        if self.history is not None:
+            self.history.start()
+        return asyncio.create_task(self.run())
 
     async def cleanup(self):
-        """Cleanup WebSocket connection and tasks"""
-        self.should_reconnect = False
-        if self.heartbeat_task:
-            self.heartbeat_task.cancel()
-            try:
-                await self.heartbeat_task
-            except asyncio.CancelledError:
-                pass
-        if self.connection:
-            await self.connection.close()
\ No newline at end of file
+        """Cleanup WebSocket connections and tasks"""
+        await self.dispatcher.stop()
+        await self.typing.cleanup()
+        await asyncio.gather(*(connection.close() for connection in self.connections))
+        await asyncio.gather(*(token_provider.close() for token_provider in self.token_providers))
+        if self.history is not None:
+            await self.history.close()
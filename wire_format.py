@@ -0,0 +1,192 @@
+"""Encoding of frames exchanged with the AutoGen backend.
+
+Text frames are always JSON. Binary frames start with a tag byte
+``0xB0 | encoding << 2 | compression`` followed by the body, where encoding
+is 0 (JSON), 1 (MessagePack) or 2 (CBOR) and compression is 0 (none),
+1 (deflate) or 2 (zstd). Tag bytes 0xB0-0xBF can't start UTF-8 text, so
+untagged binary frames are still read as JSON.
+
+The compact formats are negotiated in-band, because Web PubSub relays frames
+from simple WebSocket clients as they are: after connecting, the bot sends a
+``wire_format`` control frame listing what it can decode, and AutoGen answers
+with a ``wire_format`` frame naming its choice. Until then, and with any
+backend that never answers, both sides use JSON.
+"""
+import json
+import logging
+import zlib
+from typing import Any, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional speed-up
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG = logging.getLogger(__name__)
+
+JSON_BACKEND = "orjson" if orjson else "json"
+
+CONTROL_TYPE = "wire_format"
+
+TAG_BASE = 0xB0
+ENCODINGS = {"json": 0, "msgpack": 1, "cbor": 2}
+COMPRESSIONS = {"none": 0, "deflate": 1, "zstd": 2}
+
+# Refuse to inflate a frame beyond this, whatever its compressed size
+MAX_DECODED_BYTES = 50_000_000
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Decode JSON with orjson when installed, falling back to the stdlib"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Encode JSON to a str so it is sent as a WebSocket text frame"""
+    if orjson:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj)
+
+
+def available_encodings() -> List[str]:
+    """Encodings this process can read and write, most compact first"""
+    return [name for name, module in (("msgpack", msgpack), ("cbor", cbor2)) if module] + ["json"]
+
+
+def available_compressions() -> List[str]:
+    return (["zstd"] if zstandard else []) + ["deflate"]
+
+
+def _serialize(obj: Any, encoding: str) -> bytes:
+    if encoding == "msgpack":
+        return msgpack.packb(obj, use_bin_type=True)
+    if encoding == "cbor":
+        return cbor2.dumps(obj)
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode("utf-8")
+
+
+def _deserialize(body: bytes, encoding: int) -> Any:
+    if encoding == ENCODINGS["msgpack"]:
+        if not msgpack:
+            raise ValueError("MessagePack frame received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if encoding == ENCODINGS["cbor"]:
+        if not cbor2:
+            raise ValueError("CBOR frame received but cbor2 is not installed")
+        return cbor2.loads(body)
+    return loads(body)
+
+
+def _decompress(body: bytes, compression: int) -> bytes:
+    if compression == COMPRESSIONS["deflate"]:
+        inflater = zlib.decompressobj()
+        data = inflater.decompress(body, MAX_DECODED_BYTES)
+        if inflater.unconsumed_tail:
+            raise ValueError(f"Frame inflates beyond {MAX_DECODED_BYTES} bytes")
+        return data
+    if compression == COMPRESSIONS["zstd"]:
+        if not zstandard:
+            raise ValueError("zstd frame received but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(body, max_output_size=MAX_DECODED_BYTES)
+    return body
+
+
+def encode_payload(obj: Any, encoding: str = "json", compression: str = "none", min_compress_size: int = 0) -> bytes:
+    """Encode an object as a tagged binary frame"""
+    body = _serialize(obj, encoding)
+    if compression == "none" or len(body) < min_compress_size:
+        compression = "none"
+    elif compression == "deflate":
+        body = zlib.compress(body)
+    elif compression == "zstd":
+        body = zstandard.ZstdCompressor().compress(body)
+    return bytes((TAG_BASE | ENCODINGS[encoding] << 2 | COMPRESSIONS[compression],)) + body
+
+
+def decode_frame(frame: Union[str, bytes]) -> Any:
+    """Decode a text or binary frame; raises ValueError if it can't be decoded"""
+    if isinstance(frame, str) or not frame or frame[0] & 0xF0 != TAG_BASE:
+        return loads(frame)
+    tag = frame[0]
+    encoding, compression = (tag >> 2) & 0x3, tag & 0x3
+    if encoding == 3 or compression == 3:
+        raise ValueError(f"Unknown frame tag 0x{tag:02x}")
+    try:
+        return _deserialize(_decompress(frame[1:], compression), encoding)
+    except ValueError:
+        raise
+    except Exception as e:  # zlib.error, zstd and msgpack errors don't all subclass ValueError
+        raise ValueError(f"Could not decode frame: {str(e)}") from e
+
+
+class WireCodec:
+    """Negotiated outbound frame format for one WebSocket connection.
+
+    Outbound frames are buffered as JSON text and converted when sent, so
+    buffering and spilling don't depend on what was negotiated.
+    """
+
+    def __init__(self, encodings: List[str], compressions: List[str], min_compress_size: int = 1024):
+        # Only offer what this process can actually decode
+        self.encodings = [name for name in encodings if name != "json" and name in available_encodings()]
+        self.compressions = [name for name in compressions if name in available_compressions()]
+        unavailable = (set(encodings) - set(self.encodings) - {"json"}) | (set(compressions) - set(self.compressions) - {"none"})
+        if unavailable:
+            LOG.warning(f"Wire formats not installed, not offered: {', '.join(sorted(unavailable))}")
+        self.min_compress_size = min_compress_size
+        self.encoding = "json"
+        self.compression = "none"
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.encodings or self.compressions)
+
+    def hello(self) -> str:
+        """The control frame that offers our formats to AutoGen"""
+        return dumps({
+            "type": CONTROL_TYPE,
+            "accept": self.encodings + ["json"],
+            "compression": self.compressions + ["none"],
+        })
+
+    def accept(self, payload: dict):
+        """Switch to the format AutoGen picked, if we offered it"""
+        encoding = payload.get("encoding", "json")
+        compression = payload.get("compression", "none")
+        if encoding not in self.encodings + ["json"] or compression not in self.compressions + ["none"]:
+            LOG.warning(f"AutoGen chose an unsupported wire format {encoding}/{compression}; staying on JSON")
+            return
+        self.encoding = encoding
+        self.compression = compression
+        LOG.info(f"Wire format negotiated: {encoding}, compression {compression}")
+
+    def reset(self):
+        """Back to JSON until the next handshake, e.g. after reconnecting"""
+        self.encoding = "json"
+        self.compression = "none"
+
+    def encode(self, frame: str) -> Union[str, bytes]:
+        if self.encoding == "json" and self.compression == "none":
+            return frame
+        return encode_payload(loads(frame), self.encoding, self.compression, self.min_compress_size)
+
+
+def is_control(payload: Optional[dict]) -> bool:
+    return isinstance(payload, dict) and payload.get("type") == CONTROL_TYPE